@@ -1,32 +1,52 @@
 import search
 import sys
-import queue as Q
+from frontier import Frontier
+from stats import SearchStats
 
 class Astar(object):
-    ''' Class for performing Uniform Cost Search on a Graph
+    ''' Class for performing A* Search on a Graph
+
+    heuristic: function heuristic(node) estimating the cost from node to
+               the goal
+    trace:     optional stats.Trace (or any function trace(event, node,
+               cost, priority)) told about every expansion and frontier push
     '''
     
-    def __init__(self, graph, heuristic):
+    def __init__(self, graph, heuristic, trace=None):
         self.graph = graph
         self.heuristic = heuristic
+        self.trace = trace
+        # Frontier and statistics of the last search
+        self.frontier = None
+        self.stats = None
         
-    def find_path(self, start_node, end_node):
-        ''' Perform UCS search
+    def find_path(self, start_node, end_node, with_stats=False):
+        ''' Perform A* search
+
+        Return: (path, explored), with an empty path if end_node cannot
+                be reached. The counters of the search, a
+                stats.SearchStats, are left in self.stats, and returned as
+                a third item, (path, explored, stats), if with_stats is
+                true.
         '''
+        stats = self.stats = SearchStats()
+        trace = self.trace
+        heuristic = self.heuristic
         
         # Start the frontier with the original node
         # The cost of the start node is 0
-        frontier = Q.PriorityQueue()
-        start_cost = self.heuristic(start_node)
+        frontier = self.frontier = Frontier()
+        start_cost = heuristic(start_node)
         
         # Frontier: (tot_cost, path_cost, node)
+        # It keeps the best total cost found for every node, and skips
+        # entries that were superseded by a cheaper path
         
         frontier.put((start_cost, 0, start_node))
+        heap = frontier.heap
         explored = set()
         path_cost = {}
         path_cost[start_node] = 0
-        best_cost = {}
-        best_cost[start_node] = start_cost
         
         
         # Store paths as a dictionary
@@ -39,12 +59,13 @@ class Astar(object):
             # from the frontier
             tot_cur_cost, cur_cost, cur_explored = frontier.get()
             explored.add(cur_explored)
-            print('cur_cost: ', cur_cost, 
-                  ' tot_cur_cost: ', tot_cur_cost,
-                  ' cur_explored: ', cur_explored)
+            stats.expanded += 1
+            if trace is not None:
+                trace('expand', cur_explored, cur_cost, tot_cur_cost)
             
             if cur_explored == end_node:
-                    #print('Found ', end_node)
+                    if trace is not None:
+                        trace('found', end_node, cur_cost, tot_cur_cost)
                     # Now retrace steps
                     sol_path = [end_node]
                     cur_node = end_node
@@ -52,11 +73,16 @@ class Astar(object):
                         cur_node = paths[cur_node]
                         sol_path.append(cur_node)
                         
+                    stats.stop(frontier)
+                    if with_stats:
+                        return (list(reversed(sol_path)), explored, stats)
                     return (list(reversed(sol_path)), explored)
             
             # Explore its neightbors
             # Track the cost associated with neighbors
             for neighbor, neigh_cost in self.graph.adj(cur_explored):
+                stats.generated += 1
+                new_cost = cur_cost + neigh_cost
                 
                 if neighbor not in explored: 
                     # Add to frontier
@@ -68,32 +94,29 @@ class Astar(object):
                     # Compute cost
                     # Based on past cost, added path cost to neighbor,
                     # and a heuristic applied to the neighbor
-                    new_cost = cur_cost + neigh_cost
-                    tot_cost = new_cost + self.heuristic(neighbor)
-                    print('Neighbor: ', neighbor, ' cur_cost=', cur_cost,
-                          ' neigh_cost=', neigh_cost,
-                          ' heuristic=', self.heuristic(neighbor))
-                                      
+                    tot_cost = new_cost + heuristic(neighbor)
                     
                     # Do we add it to the frontier? Only if we haven't
                     # already added it at lower cost (using a different
                     # path)
-                    if neighbor not in best_cost.keys() or tot_cost < best_cost[neighbor]:
-                        best_cost[neighbor] = tot_cost
+                    if frontier.put((tot_cost, new_cost, neighbor)):
                         path_cost[neighbor] = new_cost
-                        frontier.put((tot_cost, new_cost, neighbor))
                         paths[neighbor] = cur_explored
-                       
-                   
-                    
-                    
-                
+                        if trace is not None:
+                            trace('push', neighbor, new_cost, tot_cost)
+                elif new_cost < path_cost[neighbor]:
+                    stats.closed_improved += 1
+
+            if len(heap) > stats.max_frontier:
+                stats.max_frontier = len(heap)
                 
         # If we got this far, there are no nodes in the frontier
         # but we haven't found our goal node
         # Declare failure.
-        print('Failed to find node ', end_node)
-        return []
+        stats.stop(frontier)
+        if with_stats:
+            return ([], explored, stats)
+        return ([], explored)
         
         
 if __name__ == "__main__":
@@ -137,6 +160,7 @@ if __name__ == "__main__":
     path, explored = astar.find_path (start, 'Bucharest')  
 
     print('Solution path: ', path) 
-    print('Explored: ', len(explored))      
+    print('Explored: ', len(explored))
+    print('Statistics: ', astar.stats)
     
         
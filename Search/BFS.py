@@ -15,7 +15,7 @@ class BFS(object):
         
         # Start the frontier with the original node
         frontier = deque([start_node])
-        observed = set(start_node)
+        observed = set([start_node])
         
         # Store paths as a dictionary
         # The key is the name of a node, the value is 
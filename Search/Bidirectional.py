@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bidirectional Uniform-Cost and A* searches.
+
+A forward search from the start over graph.adj() and a backward search
+from the goal over graph.radj() run in turns, always expanding the side
+whose frontier has the lower top priority. Whenever an edge reaches a node
+the other side has already reached, the cost through that node is a
+candidate for the shortest path, mu. The search stops once the two top
+priorities add up to at least mu: any path not found yet would have to
+leave both frontiers, and so cost at least as much.
+
+BiAstar guides both sides with averaged potentials: for a heuristic
+h(a, b) estimating the cost from a to b, the forward side adds
+p(v) = (h(v, goal) - h(start, v)) / 2 to the cost of v and the backward
+side subtracts it. Both sides then see the same non-negative reduced edge
+costs as long as h is consistent, so the stopping rule above stays exact,
+where stopping at the first meeting node, or running A* with the plain
+heuristic on each side, would not be.
+"""
+
+import search
+import sys
+from frontier import Frontier
+from stats import SearchStats
+
+
+class BiUCS(object):
+    ''' Class for performing bidirectional Uniform Cost Search on a Graph
+
+    The graph needs radj(node), giving the edges into node.
+
+    trace: optional stats.Trace (or any function trace(event, node, cost,
+           priority)) told about every expansion and frontier push; the
+           backward side reports 'expand_back' and 'push_back'
+    '''
+
+    def __init__(self, graph, trace=None):
+        self.graph = graph
+        self.trace = trace
+        # Frontiers (forward, backward) and statistics of the last search
+        self.frontiers = None
+        self.stats = None
+
+    def potential(self, start_node, end_node):
+        ''' Potential of the forward side; None for plain Dijkstra
+        '''
+        return None
+
+    def find_path(self, start_node, end_node, with_stats=False):
+        ''' Perform bidirectional search
+
+        Return: (path, explored), with an empty path if end_node cannot
+                be reached; explored holds the nodes expanded by either
+                side. The counters of the search, a stats.SearchStats,
+                are left in self.stats, and returned as a third item,
+                (path, explored, stats), if with_stats is true.
+        '''
+        stats = self.stats = SearchStats()
+        trace = self.trace
+        potential = self.potential(start_node, end_node)
+
+        # One set of structures per side; the backward side runs over
+        # reversed edges and subtracts the potential
+        # Frontier: (priority, cost, node)
+        frontiers = self.frontiers = (Frontier(), Frontier())
+        neighbors = (self.graph.adj, self.graph.radj)
+        signs = (1, -1)
+        events = (('expand', 'push'), ('expand_back', 'push_back'))
+        costs = ({start_node : 0}, {end_node : 0})
+        explored = (set(), set())
+        # Breadcrumbs: the node that led to the key, towards start_node
+        # on the forward side and towards end_node on the backward side
+        paths = ({}, {})
+
+        if potential is None:
+            frontiers[0].put((0, 0, start_node))
+            frontiers[1].put((0, 0, end_node))
+        else:
+            frontiers[0].put((potential(start_node), 0, start_node))
+            frontiers[1].put((-potential(end_node), 0, end_node))
+
+        # Cost of the best path found so far, and the node where its two
+        # halves meet
+        best = float('inf')
+        meeting = None
+        if start_node == end_node:
+            best, meeting = 0, start_node
+
+        while not frontiers[0].empty() and not frontiers[1].empty():
+            top_forward = frontiers[0].top()[0]
+            top_backward = frontiers[1].top()[0]
+            if top_forward + top_backward >= best:
+                break
+
+            side = 0 if top_forward <= top_backward else 1
+            other = 1 - side
+            frontier = frontiers[side]
+            cost = costs[side]
+            other_cost = costs[other]
+            sign = signs[side]
+            expand_event, push_event = events[side]
+
+            cur_priority, cur_cost, cur_explored = frontier.get()
+            explored[side].add(cur_explored)
+            stats.expanded += 1
+            if trace is not None:
+                trace(expand_event, cur_explored, cur_cost, cur_priority)
+
+            for neighbor, neigh_cost in neighbors[side](cur_explored):
+                stats.generated += 1
+                new_cost = cur_cost + neigh_cost
+
+                if neighbor not in explored[side]:
+                    if potential is None:
+                        priority = new_cost
+                    else:
+                        priority = new_cost + sign*potential(neighbor)
+                    if frontier.put((priority, new_cost, neighbor)):
+                        cost[neighbor] = new_cost
+                        paths[side][neighbor] = cur_explored
+                        if trace is not None:
+                            trace(push_event, neighbor, new_cost, priority)
+                elif new_cost < cost[neighbor]:
+                    stats.closed_improved += 1
+
+                # Has the other side reached this node?
+                if neighbor in other_cost:
+                    through = cost[neighbor] + other_cost[neighbor]
+                    if through < best:
+                        best, meeting = through, neighbor
+
+            frontiers_len = len(frontiers[0].heap) + len(frontiers[1].heap)
+            if frontiers_len > stats.max_frontier:
+                stats.max_frontier = frontiers_len
+
+        stats.stop()
+        stats.heap_ops = {key : value + frontiers[1].heap_ops()[key]
+                          for key, value in frontiers[0].heap_ops().items()}
+        all_explored = explored[0] | explored[1]
+        if meeting is None:
+            if with_stats:
+                return ([], all_explored, stats)
+            return ([], all_explored)
+
+        if trace is not None:
+            trace('found', end_node, best)
+        # Now retrace steps from the meeting node to both ends
+        sol_path = [meeting]
+        cur_node = meeting
+        while cur_node != start_node:
+            cur_node = paths[0][cur_node]
+            sol_path.append(cur_node)
+        sol_path.reverse()
+        cur_node = meeting
+        while cur_node != end_node:
+            cur_node = paths[1][cur_node]
+            sol_path.append(cur_node)
+
+        if with_stats:
+            return (sol_path, all_explored, stats)
+        return (sol_path, all_explored)
+
+
+class BiAstar(BiUCS):
+    ''' Class for performing bidirectional A* Search on a Graph
+
+    heuristic: function heuristic(a, b) estimating the cost from node a to
+               node b; it must be consistent for the path to be the
+               shortest
+    trace:     see BiUCS
+    '''
+
+    def __init__(self, graph, heuristic, trace=None):
+        BiUCS.__init__(self, graph, trace)
+        self.heuristic = heuristic
+
+    def potential(self, start_node, end_node):
+        heuristic = self.heuristic
+        cache = {}
+
+        def potential(node):
+            value = cache.get(node)
+            if value is None:
+                value = cache[node] = (heuristic(node, end_node)
+                                       - heuristic(start_node, node)) / 2
+            return value
+
+        return potential
+
+
+if __name__ == "__main__":
+    # Do some tests
+
+    if len(sys.argv) < 3:
+        print('usage: Bidirectional start end')
+        exit()
+
+    start = sys.argv[1]
+    end   = sys.argv[2]
+
+    cities = search.DEG('cities.txt')
+    bi_ucs = BiUCS(cities)
+    path, explored = bi_ucs.find_path(start, end)
+
+    if not path:
+        print('Failed to find node ', end)
+    print('Solution path: ', path)
+    print('Explored: ', len(explored))
+    print('Statistics: ', bi_ucs.stats)
@@ -126,7 +126,32 @@ class GridWorld(object):
         
         
         return retlist
-    
+
+    def radj(self, node_id):
+        ''' Find all edges into node named node_id
+
+        Moving costs depend on the square moved into, so every neighbor
+        reaches node_id at the cost of node_id's own value.
+
+        Return: list of tuples
+                [(node_id1, cost), (node_id2, cost), ...]
+        '''
+
+        x, y = self.get_coords(node_id)
+        val = self.get_value(x, y)
+        cost = 10000*val + 1
+        diag_cost = 10000*val + math.sqrt(2.0)
+
+        retlist = []
+        for neighbor, _ in self.adj(node_id):
+            nx, ny = self.get_coords(neighbor)
+            if nx == x or ny == y:
+                retlist.append((neighbor, cost))
+            else:
+                retlist.append((neighbor, diag_cost))
+
+        return retlist
+
 if __name__ == '__main__':
     # Do some tests
     
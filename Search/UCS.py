@@ -1,25 +1,43 @@
 import search
 import sys
-import queue as Q
+from frontier import Frontier
+from stats import SearchStats
 
 class UCS(object):
     ''' Class for performing Uniform Cost Search on a Graph
+
+    trace: optional stats.Trace (or any function trace(event, node, cost,
+           priority)) told about every expansion and frontier push
     '''
     
-    def __init__(self, graph):
+    def __init__(self, graph, trace=None):
         self.graph = graph
+        self.trace = trace
+        # Frontier and statistics of the last search
+        self.frontier = None
+        self.stats = None
         
-    def find_path(self, start_node, end_node):
+    def find_path(self, start_node, end_node, with_stats=False):
         ''' Perform UCS search
+
+        Return: (path, explored), with an empty path if end_node cannot
+                be reached. The counters of the search, a
+                stats.SearchStats, are left in self.stats, and returned as
+                a third item, (path, explored, stats), if with_stats is
+                true.
         '''
+        stats = self.stats = SearchStats()
+        trace = self.trace
         
         # Start the frontier with the original node
         # The cost of the start node is 0
-        frontier = Q.PriorityQueue()
+        # The frontier keeps the best cost found for every node, and
+        # skips entries that were superseded by a cheaper path
+        frontier = self.frontier = Frontier()
         frontier.put((0, start_node))
+        best_cost = frontier.best
+        heap = frontier.heap
         explored = set()
-        best_cost = {}
-        best_cost[start_node] = 0
         
         
         # Store paths as a dictionary
@@ -32,10 +50,13 @@ class UCS(object):
             # from the frontier
             cur_cost, cur_explored = frontier.get()
             explored.add(cur_explored)
-            print('cur_cost: ', cur_cost, ' cur_explored: ', cur_explored)
+            stats.expanded += 1
+            if trace is not None:
+                trace('expand', cur_explored, cur_cost)
             
             if cur_explored == end_node:
-                    #print('Found ', end_node)
+                    if trace is not None:
+                        trace('found', end_node, cur_cost)
                     # Now retrace steps
                     sol_path = [end_node]
                     cur_node = end_node
@@ -43,11 +64,16 @@ class UCS(object):
                         cur_node = paths[cur_node]
                         sol_path.append(cur_node)
                         
+                    stats.stop(frontier)
+                    if with_stats:
+                        return (list(reversed(sol_path)), explored, stats)
                     return (list(reversed(sol_path)), explored)
             
             # Explore its neightbors
             # Track the cost associated with neighbors
             for neighbor, neigh_cost in self.graph.adj(cur_explored):
+                stats.generated += 1
+                new_cost = cur_cost + neigh_cost
                 
                 if neighbor not in explored: 
                     # Add to frontier
@@ -55,24 +81,23 @@ class UCS(object):
                     # cost asscoaited with the path so far
                     # Add to observed nodes, don't return to them
                     # Leave breadcrumbs to retrace our path
-                    new_cost = cur_cost + neigh_cost
-                    if neighbor not in best_cost.keys() or new_cost < best_cost[neighbor]:
-                        best_cost[neighbor] = new_cost
-                        frontier.put((cur_cost + neigh_cost, neighbor))
+                    if frontier.put((new_cost, neighbor)):
                         paths[neighbor] = cur_explored
-                        #print('Added to frontier:', neighbor, ' with cost=', 
-                        #              cur_cost + neigh_cost,
-                        #              ' acc cost=', cur_cost, ' neigh_cost=', neigh_cost)
-                   
-                    
-                    
-                
+                        if trace is not None:
+                            trace('push', neighbor, new_cost)
+                elif new_cost < best_cost[neighbor]:
+                    stats.closed_improved += 1
+
+            if len(heap) > stats.max_frontier:
+                stats.max_frontier = len(heap)
                 
         # If we got this far, there are no nodes in the frontier
         # but we haven't found our goal node
         # Declare failure.
-        print('Failed to find node ', end_node)
-        return []
+        stats.stop(frontier)
+        if with_stats:
+            return ([], explored, stats)
+        return ([], explored)
         
         
 if __name__ == "__main__":
@@ -89,7 +114,10 @@ if __name__ == "__main__":
     ucs = UCS(map)
     path, explored = ucs.find_path (start, end)  
 
+    if not path:
+        print('Failed to find node ', end)
     print('Solution path: ', path) 
-    print('Explored: ', len(explored))      
+    print('Explored: ', len(explored))
+    print('Statistics: ', ucs.stats)      
     
         
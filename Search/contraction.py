@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contraction hierarchies: preprocessing for many queries on a static DEG.
+
+Preprocessing contracts the nodes one at a time, least important first.
+Contracting v removes it from the remaining graph, and for every pair of
+edges u -> v -> w whose cost is not matched by a path that avoids v (a
+witness, looked for with a small local Dijkstra), adds a shortcut u -> w
+with the cost of both edges. Importance is twice the edge difference
+(shortcuts added minus edges removed), plus the number of neighbors
+already contracted, plus the node's depth in the hierarchy so far. The
+last two are updated for the neighbors of every contracted node; the edge
+difference, which takes witness searches, only when a node reaches the top
+of the queue, where it is contracted if it is still the least important.
+
+The position of a node in that order is its rank. Every edge, original or
+shortcut, leads up to a node of higher rank either from its source or
+from its target, so a query only needs a forward search over the upward
+edges out of the start and a backward search over the upward edges into
+the goal. A side stops once its top cost reaches the best meeting cost
+found, and does not expand nodes that are reached more cheaply from
+above (stall-on-demand). Shortcuts keep the node they bypass, so the path
+found is unpacked to edges of the original graph.
+
+A hierarchy is saved with save() and loaded with load() as a NumPy .npz
+file holding the two sets of upward edges in CSR form and the node names;
+queries need neither the graph nor the preprocessing again.
+
+    python contraction.py edges.degs edges.ch.npz 1000
+
+builds the hierarchy of a graph file or snapshot (or loads it if the
+.npz exists), reports preprocessing time and shortcut count, and times
+1000 random queries against UCS.
+"""
+
+import os
+import random
+import sys
+from heapq import heappush, heappop
+from time import perf_counter
+
+import numpy as np
+
+import search
+from frontier import Frontier
+from stats import SearchStats
+from UCS import UCS
+
+# Nodes a witness search settles before it gives up and keeps the
+# shortcut; too few add shortcuts that slow down the witness searches of
+# later contractions as well as queries
+WITNESS_SETTLED = 100
+
+# Weight of the edge difference in the importance of a node
+EDGE_DIFFERENCE_WEIGHT = 2
+
+INF = float('inf')
+
+
+def _witness_costs(out_edges, source, skip, targets, max_cost):
+    ''' Local Dijkstra from source that avoids skip
+
+    Stops once every target is settled, the costs pass max_cost or
+    WITNESS_SETTLED nodes are settled, so the costs it returns are upper
+    bounds.
+    '''
+    dist = {source : 0}
+    heap = [(0, source)]
+    remaining = len(targets)
+    settled = 0
+    while heap:
+        cur_cost, cur = heappop(heap)
+        if cur_cost > dist[cur]:
+            continue
+        if cur_cost > max_cost:
+            break
+        if cur in targets:
+            remaining -= 1
+            if not remaining:
+                break
+        settled += 1
+        if settled > WITNESS_SETTLED:
+            break
+        for neighbor, neigh_cost in out_edges[cur].items():
+            if neighbor == skip:
+                continue
+            new_cost = cur_cost + neigh_cost
+            if new_cost < dist.get(neighbor, INF):
+                dist[neighbor] = new_cost
+                heappush(heap, (new_cost, neighbor))
+    return dist
+
+
+def _shortcuts(out_edges, in_edges, node):
+    ''' Shortcuts (source, target, cost) that contracting node needs
+    '''
+    shortcuts = []
+    outgoing = out_edges[node]
+    if not outgoing:
+        return shortcuts
+    max_out = max(outgoing.values())
+    for source, in_cost in in_edges[node].items():
+        targets = set(outgoing)
+        targets.discard(source)
+        if not targets:
+            continue
+        dist = _witness_costs(out_edges, source, node, targets, in_cost + max_out)
+        for target in targets:
+            cost = in_cost + outgoing[target]
+            if dist.get(target, INF) > cost:
+                shortcuts.append((source, target, cost))
+    return shortcuts
+
+
+def _csr(edge_lists, num_nodes, weight_type):
+    ''' CSR arrays (offsets, nodes, weights, middles) of per-node edge lists
+    '''
+    counts = np.zeros(num_nodes + 1, dtype=np.int64)
+    counts[1:] = [len(edges) for edges in edge_lists]
+    offsets = np.cumsum(counts)
+    nodes = np.fromiter((edge[0] for edges in edge_lists for edge in edges),
+                        dtype=np.int64, count=offsets[-1])
+    weights = np.fromiter((edge[1] for edges in edge_lists for edge in edges),
+                          dtype=weight_type, count=offsets[-1])
+    middles = np.fromiter((edge[2] for edges in edge_lists for edge in edges),
+                          dtype=np.int64, count=offsets[-1])
+    return offsets, nodes, weights, middles
+
+
+class ContractionHierarchy(object):
+    ''' Upward edges of a contracted graph
+
+    names:     node name of every id, as in the DEG
+    nodes:     {node_name: id}
+    rank:      contraction order of every node
+    up:        (offsets, targets, weights, middles): the edges out of every
+               node to nodes of higher rank
+    down:      (offsets, sources, weights, middles): the edges into every
+               node from nodes of higher rank
+    middles:   the node a shortcut bypasses, -1 for original edges
+    shortcuts: number of shortcuts kept in the hierarchy
+    seconds:   preprocessing time, 0 for a loaded hierarchy
+    '''
+
+    def __init__(self, names, rank, up, down, shortcuts, seconds=0.0):
+        self.names = names
+        self.nodes = {name : node_id for node_id, name in enumerate(names)}
+        self.rank = rank
+        self.shortcuts = shortcuts
+        self.seconds = seconds
+        self._up_arrays = up
+        self._down_arrays = down
+        # Queries walk memoryviews, like DEG.adj(): slicing and iterating
+        # them gives Python numbers without NumPy's per-item overhead
+        self.up = tuple(memoryview(a) for a in up)
+        self.down = tuple(memoryview(a) for a in down)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def build(cls, graph):
+        ''' Contract every node of a DEG
+        '''
+        start = perf_counter()
+        num_nodes = len(graph)
+
+        # Remaining graph, without self loops or parallel edges
+        out_edges = [{} for _ in range(num_nodes)]
+        in_edges = [{} for _ in range(num_nodes)]
+        for source in range(num_nodes):
+            outgoing = out_edges[source]
+            for target, cost in graph.adj(source):
+                if target != source and cost < outgoing.get(target, INF):
+                    outgoing[target] = cost
+                    in_edges[target][source] = cost
+        middle = {}
+
+        contracted_neighbors = [0] * num_nodes
+        # Depth in the hierarchy below every node
+        level = [0] * num_nodes
+        # Edge difference of every node when it was last simulated
+        difference = [0] * num_nodes
+
+        def priority(node, added):
+            difference[node] = len(added) - len(out_edges[node]) - len(in_edges[node])
+            return (EDGE_DIFFERENCE_WEIGHT*difference[node]
+                    + contracted_neighbors[node] + level[node])
+
+        # Queue of (priority, node); entries whose priority is no longer
+        # current[node] are stale and skipped
+        current = [priority(node, _shortcuts(out_edges, in_edges, node))
+                   for node in range(num_nodes)]
+        queue = [(node_priority, node) for node, node_priority in enumerate(current)]
+        queue.sort()
+
+        rank = np.empty(num_nodes, dtype=np.int64)
+        up = [None] * num_nodes
+        down = [None] * num_nodes
+        shortcuts = 0
+        next_rank = 0
+        while queue:
+            queued_priority, node = heappop(queue)
+            if queued_priority != current[node]:
+                continue
+            # Lazy update: contract it only if it is still the least
+            # important node
+            added = _shortcuts(out_edges, in_edges, node)
+            node_priority = current[node] = priority(node, added)
+            if queue and node_priority > queue[0][0]:
+                heappush(queue, (node_priority, node))
+                continue
+
+            current[node] = None
+            rank[node] = next_rank
+            next_rank += 1
+
+            # The remaining neighbors all end up higher in the order
+            up[node] = [(target, cost, middle.get((node, target), -1))
+                        for target, cost in out_edges[node].items()]
+            down[node] = [(source, cost, middle.get((source, node), -1))
+                          for source, cost in in_edges[node].items()]
+            for target in out_edges[node]:
+                del in_edges[target][node]
+                contracted_neighbors[target] += 1
+            for source in in_edges[node]:
+                del out_edges[source][node]
+                contracted_neighbors[source] += 1
+            out_edges[node] = {}
+            in_edges[node] = {}
+
+            for source, target, cost in added:
+                if cost < out_edges[source].get(target, INF):
+                    if (source, target) not in middle:
+                        shortcuts += 1
+                    out_edges[source][target] = cost
+                    in_edges[target][source] = cost
+                    middle[(source, target)] = node
+
+            # Contracting node makes its neighbors more important
+            for neighbor in set(target for target, _, _ in up[node]).union(
+                    source for source, _, _ in down[node]):
+                if level[neighbor] <= level[node]:
+                    level[neighbor] = level[node] + 1
+                current[neighbor] = (EDGE_DIFFERENCE_WEIGHT*difference[neighbor]
+                                     + contracted_neighbors[neighbor] + level[neighbor])
+                heappush(queue, (current[neighbor], neighbor))
+
+        weight_type = np.float64 if graph.weights.format == 'd' else np.int64
+        return cls(list(graph.names), rank,
+                   _csr(up, num_nodes, weight_type),
+                   _csr(down, num_nodes, weight_type),
+                   shortcuts, perf_counter() - start)
+
+    def _id(self, node):
+        return node if node.__class__ is int else self.nodes[node]
+
+    def middle(self, source, target):
+        ''' The node the hierarchy edge source -> target bypasses, -1 if none
+        '''
+        # The edge is kept with whichever end has the lower rank
+        if self.rank[source] < self.rank[target]:
+            offsets, nodes, weights, middles = self.up
+            node, other = source, target
+        else:
+            offsets, nodes, weights, middles = self.down
+            node, other = target, source
+        lo = offsets[node]
+        hi = offsets[node + 1]
+        for i in range(lo, hi):
+            if nodes[i] == other:
+                return middles[i]
+        raise KeyError((source, target))
+
+    def unpack(self, path):
+        ''' Replace the shortcuts of a path of node ids by the edges they bypass
+        '''
+        unpacked = [path[0]]
+        stack = [(source, target) for source, target
+                 in reversed(list(zip(path, path[1:])))]
+        while stack:
+            source, target = stack.pop()
+            middle = self.middle(source, target)
+            if middle < 0:
+                unpacked.append(target)
+            else:
+                stack.append((middle, target))
+                stack.append((source, middle))
+        return unpacked
+
+    def save(self, path):
+        ''' Write the hierarchy to path as a NumPy .npz file
+        '''
+        names = '\n'.join(self.names).encode('utf-8')
+        with open(path, 'wb') as fp:
+            np.savez(fp, rank=self.rank,
+                     up_offsets=self._up_arrays[0], up_nodes=self._up_arrays[1],
+                     up_weights=self._up_arrays[2], up_middles=self._up_arrays[3],
+                     down_offsets=self._down_arrays[0],
+                     down_nodes=self._down_arrays[1],
+                     down_weights=self._down_arrays[2],
+                     down_middles=self._down_arrays[3],
+                     shortcuts=np.array(self.shortcuts),
+                     names=np.frombuffer(names, dtype=np.uint8))
+
+    @classmethod
+    def load(cls, path):
+        ''' Read a hierarchy written by save()
+        '''
+        with np.load(path) as data:
+            names = data['names'].tobytes().decode('utf-8')
+            return cls(names.split('\n') if names else [], data['rank'],
+                       tuple(data['up_' + key]
+                             for key in ('offsets', 'nodes', 'weights', 'middles')),
+                       tuple(data['down_' + key]
+                             for key in ('offsets', 'nodes', 'weights', 'middles')),
+                       int(data['shortcuts']))
+
+
+class CH(object):
+    ''' Class for performing shortest path queries on a ContractionHierarchy
+
+    Nodes can be given by name or by id; the path comes back in the same
+    terms, unpacked to edges of the original graph.
+
+    trace: optional stats.Trace (or any function trace(event, node, cost,
+           priority)), as for BiUCS
+    '''
+
+    def __init__(self, hierarchy, trace=None):
+        self.hierarchy = hierarchy
+        self.trace = trace
+        # Frontiers (forward, backward) and statistics of the last search
+        self.frontiers = None
+        self.stats = None
+
+    def find_path(self, start_node, end_node, with_stats=False):
+        ''' Perform a contraction hierarchy query
+
+        Return: (path, explored), with an empty path if end_node cannot
+                be reached; explored holds the nodes expanded by either
+                side. The counters of the search, a stats.SearchStats,
+                are left in self.stats, and returned as a third item,
+                (path, explored, stats), if with_stats is true.
+        '''
+        stats = self.stats = SearchStats()
+        trace = self.trace
+        hierarchy = self.hierarchy
+        by_name = start_node.__class__ is not int
+        start_id = hierarchy._id(start_node)
+        end_id = hierarchy._id(end_node)
+
+        # Forward side over the upward edges out of nodes, backward side
+        # over the upward edges into nodes; each checks for stalling with
+        # the edges of the other direction
+        frontiers = self.frontiers = (Frontier(), Frontier())
+        edges = (hierarchy.up, hierarchy.down)
+        events = (('expand', 'push'), ('expand_back', 'push_back'))
+        costs = ({start_id : 0}, {end_id : 0})
+        explored = (set(), set())
+        paths = ({}, {})
+        frontiers[0].put((0, start_id))
+        frontiers[1].put((0, end_id))
+
+        best = INF
+        meeting = None
+        if start_id == end_id:
+            best, meeting = 0, start_id
+
+        forward, backward = frontiers
+        while True:
+            # A side is done once its top cost reaches the best found, so
+            # expanding the lower top is enough while it is below best
+            top_forward = INF if forward.empty() else forward.heap[0][0]
+            top_backward = INF if backward.empty() else backward.heap[0][0]
+            if top_forward <= top_backward:
+                if top_forward >= best:
+                    break
+                side = 0
+            else:
+                if top_backward >= best:
+                    break
+                side = 1
+            frontier = frontiers[side]
+            cost = costs[side]
+            other_cost = costs[1 - side]
+            expand_event, push_event = events[side]
+
+            cur_cost, cur = frontier.get()
+            explored[side].add(cur)
+            stats.expanded += 1
+            if trace is not None:
+                trace(expand_event, cur, cur_cost)
+
+            # Stall-on-demand: a node reached more cheaply through a node
+            # above it is not on a shortest upward path
+            offsets, nodes, weights, _ = edges[1 - side]
+            lo = offsets[cur]
+            hi = offsets[cur + 1]
+            stalled = False
+            for above, above_cost in zip(nodes[lo:hi], weights[lo:hi]):
+                if cost.get(above, INF) + above_cost < cur_cost:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+
+            offsets, nodes, weights, _ = edges[side]
+            lo = offsets[cur]
+            hi = offsets[cur + 1]
+            for neighbor, neigh_cost in zip(nodes[lo:hi], weights[lo:hi]):
+                stats.generated += 1
+                new_cost = cur_cost + neigh_cost
+                if frontier.put((new_cost, neighbor)):
+                    cost[neighbor] = new_cost
+                    paths[side][neighbor] = cur
+                    if trace is not None:
+                        trace(push_event, neighbor, new_cost)
+                    if neighbor in other_cost:
+                        through = new_cost + other_cost[neighbor]
+                        if through < best:
+                            best, meeting = through, neighbor
+
+            frontiers_len = len(frontiers[0].heap) + len(frontiers[1].heap)
+            if frontiers_len > stats.max_frontier:
+                stats.max_frontier = frontiers_len
+
+        all_explored = explored[0] | explored[1]
+        if meeting is None:
+            stats.stop()
+            stats.heap_ops = _heap_ops(frontiers)
+            if with_stats:
+                return ([], all_explored, stats)
+            return ([], all_explored)
+
+        if trace is not None:
+            trace('found', end_id, best)
+        # Retrace both halves up to the meeting node, then unpack
+        sol_path = [meeting]
+        cur_node = meeting
+        while cur_node != start_id:
+            cur_node = paths[0][cur_node]
+            sol_path.append(cur_node)
+        sol_path.reverse()
+        cur_node = meeting
+        while cur_node != end_id:
+            cur_node = paths[1][cur_node]
+            sol_path.append(cur_node)
+        sol_path = hierarchy.unpack(sol_path)
+
+        stats.stop()
+        stats.heap_ops = _heap_ops(frontiers)
+        if by_name:
+            names = hierarchy.names
+            sol_path = [names[node_id] for node_id in sol_path]
+            all_explored = {names[node_id] for node_id in all_explored}
+        if with_stats:
+            return (sol_path, all_explored, stats)
+        return (sol_path, all_explored)
+
+
+def _heap_ops(frontiers):
+    forward = frontiers[0].heap_ops()
+    backward = frontiers[1].heap_ops()
+    return {key : forward[key] + backward[key] for key in forward}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        cities = search.DEG('cities.txt')
+        hierarchy = ContractionHierarchy.build(cities)
+        print('Shortcuts: ', hierarchy.shortcuts)
+        ch = CH(hierarchy)
+        path, explored = ch.find_path('Arad', 'Bucharest')
+        print('Solution path: ', path)
+        print('Explored: ', len(explored))
+        print('Statistics: ', ch.stats)
+        exit()
+
+    # usage: contraction.py <graph file or snapshot> [hierarchy .npz] [queries]
+    if search.is_snapshot(sys.argv[1]):
+        graph = search.DEG.open_snapshot(sys.argv[1])
+    else:
+        graph = search.DEG(sys.argv[1])
+    saved = sys.argv[2] if len(sys.argv) > 2 else None
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    if saved and os.path.exists(saved):
+        hierarchy = ContractionHierarchy.load(saved)
+        print('Loaded %s' % saved)
+    else:
+        hierarchy = ContractionHierarchy.build(graph)
+        print('Preprocessed %d nodes, %d edges in %.2f s'
+              % (len(graph), graph.num_edges(), hierarchy.seconds))
+        if saved:
+            hierarchy.save(saved)
+    print('%d shortcuts' % hierarchy.shortcuts)
+
+    rng = random.Random(1)
+    pairs = [(rng.randrange(len(graph)), rng.randrange(len(graph)))
+             for _ in range(queries)]
+    ch = CH(hierarchy)
+    expanded = 0
+    seconds = 0.0
+    for start, goal in pairs:
+        ch.find_path(start, goal)
+        expanded += ch.stats.expanded
+        seconds += ch.stats.elapsed
+    print('CH  %10.0f expanded %9.3f ms per query'
+          % (expanded / queries, 1000 * seconds / queries))
+
+    # UCS on a sample of the same queries, for comparison
+    ucs = UCS(graph)
+    sample = pairs[:max(1, queries // 10)]
+    expanded = 0
+    seconds = 0.0
+    for start, goal in sample:
+        ucs.find_path(start, goal)
+        expanded += ucs.stats.expanded
+        seconds += ucs.stats.elapsed
+    print('UCS %10.0f expanded %9.3f ms per query'
+          % (expanded / len(sample), 1000 * seconds / len(sample)))
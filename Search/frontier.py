@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Priority frontier shared by UCS and Astar.
+
+A binary heap (heapq) with lazy deletion stands in for decrease-key:
+putting a node again at a lower priority pushes a new entry, and the
+older entry is skipped when it reaches the top, because its priority no
+longer matches best[node]. Putting a node at a priority no better than
+its best one is a no-op. There is no locking, unlike queue.PriorityQueue.
+"""
+
+from heapq import heappush, heappop
+
+
+class Frontier(object):
+    ''' Min-priority frontier of (priority, ..., node) tuples
+
+    Entries are compared as tuples, so any fields between the priority
+    and the node break ties, in order.
+
+    best:      lowest priority each node was put with
+    pushes:    entries pushed onto the heap
+    pops:      entries popped from the heap, stale ones included
+    stale:     popped entries skipped because the node had been put again
+               at a lower priority
+    decreases: puts that lowered the priority of a node already put
+    rejected:  puts ignored because the node had a priority at least as low
+    '''
+
+    def __init__(self):
+        self.heap = []
+        self.best = {}
+        self.pushes = 0
+        self.pops = 0
+        self.stale = 0
+        self.decreases = 0
+        self.rejected = 0
+
+    def put(self, entry):
+        ''' Add entry = (priority, ..., node), or lower the node's priority
+
+        Return: True if the entry was added
+        '''
+        priority = entry[0]
+        node = entry[-1]
+        old = self.best.get(node)
+        if old is not None:
+            if priority >= old:
+                self.rejected += 1
+                return False
+            self.decreases += 1
+        self.best[node] = priority
+        heappush(self.heap, entry)
+        self.pushes += 1
+        return True
+
+    def empty(self):
+        ''' True if no live entry is left; drops stale entries on top
+        '''
+        heap = self.heap
+        best = self.best
+        while heap and heap[0][0] > best[heap[0][-1]]:
+            heappop(heap)
+            self.pops += 1
+            self.stale += 1
+        return not heap
+
+    def top(self):
+        ''' The live entry with the lowest priority, left in place
+        '''
+        if self.empty():
+            raise IndexError('top of an empty frontier')
+        return self.heap[0]
+
+    def get(self):
+        ''' Remove and return the live entry with the lowest priority
+        '''
+        if self.empty():
+            raise IndexError('get from an empty frontier')
+        self.pops += 1
+        return heappop(self.heap)
+
+    def __len__(self):
+        ''' Heap entries, stale ones included
+        '''
+        return len(self.heap)
+
+    def heap_ops(self):
+        return {'pushes'    : self.pushes,
+                'pops'      : self.pops,
+                'stale'     : self.stale,
+                'decreases' : self.decreases,
+                'rejected'  : self.rejected}
@@ -46,4 +46,5 @@ if __name__ == '__main__':
     
     gw1.add_path(path)
     
-    print(gw1.to_string())
\ No newline at end of file
+    print(gw1.to_string())
+    print('Statistics: ', search.stats)
\ No newline at end of file
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Landmark (ALT) heuristics for A* on a DEG, valid for any goal.
+
+Preprocessing picks K landmark nodes and runs Dijkstra from each of them
+twice, over adj() and over radj(), giving the cost from every landmark to
+every node and from every node to every landmark. By the triangle
+inequality, for any landmark L
+
+    cost(v, t) >= cost(L, t) - cost(L, v)
+    cost(v, t) >= cost(v, L) - cost(t, L)
+
+so the largest of these bounds over all landmarks is an admissible, and
+consistent, estimate of the cost from v to t. Astar takes it through
+goal_heuristic(t), and BiAstar through heuristic, for any pair of nodes.
+
+Landmarks are picked 'farthest' first: each new landmark is the node
+farthest, going there and back, from the landmarks picked so far, which
+tends to put them at the edges of the map, where their bounds are
+tightest. 'random' picks them at random.
+
+The tables are NumPy arrays of shape (nodes, K), one row per node, with
+inf for nodes a landmark does not reach or cannot be reached from. They
+can be saved with save() and loaded back for the same graph with load().
+
+    python landmarks.py edges.degs 16 100
+
+builds 16 landmarks for a graph file or snapshot and compares A* with the
+landmark heuristic to UCS on 100 random queries.
+"""
+
+import random
+import sys
+from heapq import heappush, heappop
+from itertools import chain
+from operator import sub
+from time import perf_counter
+
+import numpy as np
+
+import search
+from Astar import Astar
+from UCS import UCS
+
+DEFAULT_LANDMARKS = 8
+SELECTION_METHODS = ('farthest', 'random')
+
+INF = float('inf')
+
+
+def _finite(row):
+    ''' Function picking from a list the entries where row is finite
+    '''
+    keep = np.flatnonzero(np.isfinite(row)).tolist()
+    if len(keep) == len(row):
+        return lambda values : values
+    return lambda values : [values[i] for i in keep]
+
+
+def distances(adj, source, num_nodes):
+    ''' Dijkstra from node id source over adj (a graph's adj or radj)
+
+    Return: float64 array of the cost to every node id, inf where the
+            node is not reached
+    '''
+    dist = [INF] * num_nodes
+    dist[source] = 0
+    # One-to-all search: a plain heap with lazy deletion, without the
+    # bookkeeping of a Frontier
+    heap = [(0, source)]
+    while heap:
+        cur_cost, cur = heappop(heap)
+        if cur_cost > dist[cur]:
+            continue
+        for neighbor, neigh_cost in adj(cur):
+            new_cost = cur_cost + neigh_cost
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                heappush(heap, (new_cost, neighbor))
+    return np.array(dist, dtype=np.float64)
+
+
+class Landmarks(object):
+    ''' Landmark distance tables of a DEG
+
+    graph:     the graph the tables belong to
+    ids:       node id of every landmark
+    dist_from: dist_from[v, i] is the cost from landmark i to node v
+    dist_to:   dist_to[v, i] is the cost from node v to landmark i
+    seconds:   preprocessing time, 0 for loaded tables
+    '''
+
+    def __init__(self, graph, ids, dist_from, dist_to, seconds=0.0):
+        self.graph = graph
+        self.ids = ids
+        self.dist_from = dist_from
+        self.dist_to = dist_to
+        self.seconds = seconds
+
+    @classmethod
+    def build(cls, graph, count=DEFAULT_LANDMARKS, method='farthest', seed=None):
+        ''' Pick count landmarks of graph and compute their tables
+        '''
+        if method not in SELECTION_METHODS:
+            raise ValueError('Unknown landmark selection: %r' % method)
+        start = perf_counter()
+        num_nodes = len(graph)
+        count = min(count, num_nodes)
+        rng = random.Random(seed)
+
+        ids = []
+        dist_from = np.empty((num_nodes, count))
+        dist_to = np.empty((num_nodes, count))
+        if method == 'random':
+            candidates = rng.sample(range(num_nodes), count)
+        else:
+            # The first landmark is the node farthest from a random one
+            first = distances(graph.adj, rng.randrange(num_nodes), num_nodes)
+            first[np.isinf(first)] = -1
+            candidates = [int(first.argmax())]
+            # Round-trip cost to the nearest landmark picked so far
+            nearest = np.full(num_nodes, np.inf)
+
+        for i in range(count):
+            landmark = candidates[i]
+            ids.append(landmark)
+            dist_from[:, i] = distances(graph.adj, landmark, num_nodes)
+            dist_to[:, i] = distances(graph.radj, landmark, num_nodes)
+            if method == 'farthest' and i + 1 < count:
+                np.minimum(nearest, dist_from[:, i] + dist_to[:, i], out=nearest)
+                nearest[ids] = -1
+                candidates.append(int(nearest.argmax()))
+
+        return cls(graph, np.array(ids, dtype=np.int64), dist_from, dist_to,
+                   perf_counter() - start)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _id(self, node):
+        return node if node.__class__ is int else self.graph.nodes[node]
+
+    def goal_heuristic(self, goal):
+        ''' heuristic(node) estimating the cost from node to goal, for Astar
+
+        Nodes can be given by name or by id, like to the graph. The
+        estimates are kept, so ask for a new heuristic for every search.
+        '''
+        goal_id = self._id(goal)
+        dist_from = self.dist_from
+        dist_to = self.dist_to
+        # Landmarks that do not reach the goal, or that the goal does not
+        # reach, give no bound on the way there (inf - inf)
+        use_from = _finite(dist_from[goal_id])
+        use_to = _finite(dist_to[goal_id])
+        from_goal = use_from(dist_from[goal_id].tolist())
+        to_goal = use_to(dist_to[goal_id].tolist())
+        graph_nodes = self.graph.nodes
+        estimates = {}
+
+        # Rows are bounded as Python floats: with a handful of landmarks
+        # that is several times faster than NumPy's per-call overhead
+        def heuristic(node):
+            estimate = estimates.get(node)
+            if estimate is None:
+                node_id = node if node.__class__ is int else graph_nodes[node]
+                estimate = max(0.0,
+                               max(map(sub, from_goal,
+                                       use_from(dist_from[node_id].tolist())),
+                                   default=0.0),
+                               max(map(sub, use_to(dist_to[node_id].tolist()),
+                                       to_goal),
+                                   default=0.0))
+                estimates[node] = estimate
+            return estimate
+
+        return heuristic
+
+    def heuristic(self, node, goal):
+        ''' Estimate of the cost from node to goal, for BiAstar
+
+        Infinite bounds are left out, so the estimate is always finite and
+        the potentials of BiAstar stay defined.
+        '''
+        node_id = self._id(node)
+        goal_id = self._id(goal)
+        estimate = 0.0
+        for bound in chain(map(sub, self.dist_from[goal_id].tolist(),
+                               self.dist_from[node_id].tolist()),
+                           map(sub, self.dist_to[node_id].tolist(),
+                               self.dist_to[goal_id].tolist())):
+            # inf - inf is nan and fails the test too
+            if estimate < bound < INF:
+                estimate = bound
+        return estimate
+
+    def save(self, path):
+        ''' Write the tables to path as a NumPy .npz file
+        '''
+        with open(path, 'wb') as fp:
+            np.savez(fp, ids=self.ids, dist_from=self.dist_from,
+                     dist_to=self.dist_to,
+                     shape=np.array([len(self.graph), self.graph.num_edges()]))
+
+    @classmethod
+    def load(cls, graph, path):
+        ''' Read tables written by save() for the same graph
+        '''
+        with np.load(path) as data:
+            if tuple(data['shape']) != (len(graph), graph.num_edges()):
+                raise ValueError('%s: landmark tables of a different graph' % path)
+            return cls(graph, data['ids'], data['dist_from'], data['dist_to'])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        # Any goal on the map, not only Bucharest
+        cities = search.DEG('cities.txt')
+        landmarks = Landmarks.build(cities, 4, seed=0)
+        print('Landmarks: ', [cities.name_of(i) for i in landmarks.ids])
+        for goal in ('Bucharest', 'Iasi', 'Timisoara'):
+            astar = Astar(cities, landmarks.goal_heuristic(goal))
+            path, explored = astar.find_path('Arad', goal)
+            print('Solution path: ', path, ' explored: ', len(explored))
+        exit()
+
+    # usage: landmarks.py <graph file or snapshot> [landmarks] [queries]
+    if search.is_snapshot(sys.argv[1]):
+        graph = search.DEG.open_snapshot(sys.argv[1])
+    else:
+        graph = search.DEG(sys.argv[1])
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LANDMARKS
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    landmarks = Landmarks.build(graph, count, seed=0)
+    print('%d landmarks of %d nodes in %.2f s'
+          % (len(landmarks), len(graph), landmarks.seconds))
+
+    rng = random.Random(1)
+    totals = {'UCS' : [0, 0.0], 'A* ALT' : [0, 0.0]}
+    for _ in range(queries):
+        start = rng.randrange(len(graph))
+        goal = rng.randrange(len(graph))
+        for name, searcher in (('UCS', UCS(graph)),
+                               ('A* ALT', Astar(graph, landmarks.goal_heuristic(goal)))):
+            searcher.find_path(start, goal)
+            totals[name][0] += searcher.stats.expanded
+            totals[name][1] += searcher.stats.elapsed
+    for name, (expanded, seconds) in totals.items():
+        print('%-7s %10.0f expanded %9.2f ms per query'
+              % (name, expanded / queries, 1000 * seconds / queries))
@@ -6,108 +6,448 @@ Created on Tue Jun 20 16:43:25 2017
 @author: bobradov
 """
 
-class Node(object):
-    def __init__(self, name):
-        self.name = name
-        self.edge_list = []
-        
-class DirectedEdge(object):
-    def __init__(self, prop_dict, points_to):
-        self.prop_dict = prop_dict
-        self.points_to = points_to
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+from itertools import accumulate, islice, repeat
+from operator import le
+from time import perf_counter
+
+# Characters read from a graph file at a time
+CHUNK_SIZE = 1 << 20
+
+LOAD_FORMATS = ('adj', 'csv', 'tsv')
+
+# Snapshot layout, all little-endian:
+#   header:  magic, version, weight typecode ('q' or 'd'), pad,
+#            number of nodes, number of edges, bytes of names
+#   offsets: (nodes + 1) int64
+#   targets: edges int64
+#   weights: edges int64 or float64
+#   names:   UTF-8 node names, each followed by a newline
+SNAPSHOT_MAGIC = b'DEGS'
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct('<4sHcxQQQ')
 
 
 class DEG(object):
     ''' Class for Directed Edge Graphs
+
+    The graph is stored in compressed sparse row (CSR) form, with nodes
+    numbered 0..n-1 in order of first appearance:
+
+    names:   node name of every id
+    nodes:   {node_name: id}
+    offsets: the edges of node i are offsets[i]:offsets[i+1] of the
+             edge arrays (n+1 entries)
+    targets: id of the node every edge points to
+    weights: 'dist' of every edge; integers unless some distance is not an
+             integer, then floats
+
+    radj() gives the edges into a node, from a reverse copy of the arrays
+    built on first use.
+
+    Nodes can be given by name or by id. adj() answers in the same terms it
+    is asked in, so BFS, UCS and Astar run on names when started from a
+    name and on ids when started from an id (see id_of() and name_of()).
     '''
-    
-    def __init__(self, fname):
+
+    def __init__(self, fname=None, format=None):
+        self.names = []
         self.nodes = {}
-        if not self.load(fname):
+        self.load_info = {}
+        self._snapshot = None
+        self._build(array('q'), array('q'), array('q'))
+        if fname is not None and not self.load(fname, format):
             raise OSError
-            
-            
-    def adj(self, node_name):
-        ''' Find all adjacencies of node named node_name
-        
-        Return: list of tuples
-                [(node_name, cost), (node_name, cost), ...]
+
+    def _build(self, sources, targets, weights):
+        ''' Lay out parallel arrays of edges as the CSR arrays.
+
+        Edges of one node keep their relative order. Edge lists that are
+        already grouped by source node, like cities.txt, are taken as they
+        are; otherwise they are put in order with a counting sort.
         '''
-        cur_node = self.nodes[node_name]
-        edges = cur_node.edge_list
-        
-        ret_list = [(cur_edge.points_to.name, cur_edge.prop_dict['dist'])
-                    for cur_edge in edges]
-        return ret_list
-        
-        
-    
+        counts = [0] * (len(self.names) + 1)
+        for source, count in Counter(sources).items():
+            counts[source + 1] = count
+        offsets = array('q', accumulate(counts))
+
+        if not all(map(le, sources, islice(sources, 1, None))):
+            # sorted() is stable, so every node keeps its edge order
+            order = sorted(range(len(sources)), key=sources.__getitem__)
+            targets = array('q', map(targets.__getitem__, order))
+            weights = array(weights.typecode, map(weights.__getitem__, order))
+
+        self._set_arrays(offsets, targets, weights)
+
+    def _set_arrays(self, offsets, targets, weights):
+        self.offsets = memoryview(offsets)
+        self.targets = memoryview(targets)
+        self.weights = memoryview(weights)
+        self._reverse = None
+
+    def _reverse_arrays(self):
+        ''' (offsets, sources, weights) of the edges grouped by target
+        '''
+        if self._reverse is None:
+            offsets = self.offsets
+            sources = array('q')
+            for node_id in range(len(offsets) - 1):
+                sources.extend(repeat(node_id, offsets[node_id + 1] - offsets[node_id]))
+            targets = self.targets
+            counts = [0] * (len(self.names) + 1)
+            for target, count in Counter(targets).items():
+                counts[target + 1] = count
+            order = sorted(range(len(targets)), key=targets.__getitem__)
+            self._reverse = (memoryview(array('q', accumulate(counts))),
+                             memoryview(array('q', map(sources.__getitem__, order))),
+                             memoryview(array(self.weights.format,
+                                              map(self.weights.__getitem__, order))))
+        return self._reverse
+
+    def save_snapshot(self, path):
+        ''' Write the graph as a binary snapshot for open_snapshot()
+        '''
+        names = ''.join(name + '\n' for name in self.names).encode('utf-8')
+        if names.count(b'\n') != len(self.names):
+            raise ValueError('Node names in a snapshot cannot contain newlines')
+        with open(path, 'wb') as fp:
+            fp.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                           self.weights.format.encode('ascii'),
+                                           len(self.names), len(self.targets),
+                                           len(names)))
+            for view in (self.offsets, self.targets, self.weights):
+                fp.write(_little_endian(view))
+            fp.write(names)
+
+    @classmethod
+    def open_snapshot(cls, path):
+        ''' Open a snapshot written by save_snapshot()
+
+        The edge arrays are memory-mapped read-only rather than read, so
+        opening is quick and processes that open the same snapshot share
+        one copy of it in the page cache. Only the names are decoded.
+        '''
+        start = perf_counter()
+        with open(path, 'rb') as fp:
+            try:
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                raise ValueError('%s is not a graph snapshot' % path)
+        try:
+            typecode, num_nodes, num_edges, names_size = _snapshot_header(data, path)
+        except ValueError:
+            data.close()
+            raise
+        sizes = (8 * (num_nodes + 1), 8 * num_edges, 8 * num_edges)
+
+        view = memoryview(data)
+        arrays = []
+        pos = _SNAPSHOT_HEADER.size
+        for size, code in zip(sizes, ('q', 'q', typecode)):
+            part = view[pos:pos + size]
+            if sys.byteorder == 'little':
+                arrays.append(part.cast(code))
+            else:
+                swapped = array(code, part.tobytes())
+                swapped.byteswap()
+                arrays.append(swapped)
+            pos += size
+
+        graph = cls()
+        graph.names = view[pos:pos + names_size].tobytes().decode('utf-8').split('\n')[:-1]
+        graph.nodes = dict(zip(graph.names, range(num_nodes)))
+        graph._set_arrays(*arrays)
+        graph._snapshot = data
+        graph.load_info = {'seconds' : perf_counter() - start,
+                           'bytes'   : len(data),
+                           'nodes'   : num_nodes,
+                           'edges'   : num_edges}
+        return graph
+
+    def __len__(self):
+        return len(self.names)
+
+    def num_edges(self):
+        return len(self.targets)
+
+    def id_of(self, node_name):
+        return self.nodes[node_name]
+
+    def name_of(self, node_id):
+        return self.names[node_id]
+
+    def adj(self, node):
+        ''' Find all adjacencies of node, given by name or by id
+
+        Return: iterable of tuples, in the terms node was given in
+                [(node_name, cost), (node_name, cost), ...] or
+                [(node_id, cost), (node_id, cost), ...]
+
+        Nothing is copied: the edges are read through slices of the
+        edge arrays, so the result is only good for one pass.
+        '''
+        offsets = self.offsets
+        if node.__class__ is int:
+            lo = offsets[node]
+            hi = offsets[node + 1]
+            return zip(self.targets[lo:hi], self.weights[lo:hi])
+
+        node_id = self.nodes[node]
+        lo = offsets[node_id]
+        hi = offsets[node_id + 1]
+        return zip(map(self.names.__getitem__, self.targets[lo:hi]),
+                   self.weights[lo:hi])
+
+    def radj(self, node):
+        ''' Find all edges into node, given by name or by id
+
+        Return: iterable of (predecessor, cost) tuples, in the same terms
+                and with the same one-pass views as adj()
+        '''
+        offsets, sources, weights = self._reverse_arrays()
+        if node.__class__ is int:
+            lo = offsets[node]
+            hi = offsets[node + 1]
+            return zip(sources[lo:hi], weights[lo:hi])
+
+        node_id = self.nodes[node]
+        lo = offsets[node_id]
+        hi = offsets[node_id + 1]
+        return zip(map(self.names.__getitem__, sources[lo:hi]), weights[lo:hi])
+
     def to_string(self):
         str_build = ''
         for cur_node in self.nodes:
             str_build += 'Node: ' + cur_node + ' '
-            '''
-            for cur_edge in self.nodes[cur_node].edge_list:
-                str_build += cur_edge.prop_dict['dist'] + 'km to: '
-                str_build += cur_edge.points_to.name + ' '
-            '''
             for neighbor, dist in self.adj(cur_node):
                 str_build += str(dist) + 'km to: '
                 str_build += neighbor + ' '
             str_build += '\n'
         return str_build
-    
-    
-            
-    def load(self, fname):
-        fp = open(fname, 'r')
-        all_text = fp.read()
-        
-        # Build graph in two passes
-        # 1. Scan for node names
-        # 2. Scan for directed edges
-        
-        lines = all_text.split('\n')
-        
-        # Node building
-        for cur_line in lines:
-            if len(cur_line) > 0:
-                words = cur_line.split()
-                #print('words: ', words)
-                
-                cur_node_name = words[0]
-                self.nodes[cur_node_name] = Node(cur_node_name)
-             
-        # Now that nodes are built, loop again and build edges
-        for cur_line in lines:
-             if len(cur_line) > 0:
-                words = cur_line.split()
-                cur_node_name = words.pop(0)
-                
-                # Now read all the edge connections
-                while len(words) > 0:
-                    goal_node = words.pop(0)
-                    goal_dist = int(words.pop(0))
-                    
-                    # Create a new edge
-                    new_edge = DirectedEdge({'dist' : goal_dist}, 
-                                              self.nodes[goal_node])
-                    
-                    self.nodes[cur_node_name].edge_list.append(new_edge)
-                    
-                    
-                    
-                
-        
-        #print(lines)
+
+    def load(self, fname, format=None, chunk_size=CHUNK_SIZE, header=None):
+        ''' Read a graph file in one streaming pass
+
+        format: 'adj' for the cities.txt layout, one node per line,
+
+                    <node> <neighbor> <dist> <neighbor> <dist> ...
+
+                'csv' or 'tsv' for edge lists, one edge per line,
+
+                    <node>,<neighbor>[,<dist>]
+
+                where a missing dist counts as 1.
+
+                In every format, blank lines and lines starting with '#'
+                are skipped. By default the format follows the file
+                extension: .csv, .tsv, anything else is 'adj'.
+        header: whether the first line of a csv or tsv file, after blank
+                lines and comments, is a header: None to take it as one
+                when its dist is not a number, True to always skip it (a
+                two-column header cannot be told from an edge), False to
+                never skip it
+
+        The file is read chunk_size characters at a time. Node names are
+        interned as they are met, and the edges collected straight into
+        arrays; the graph read replaces whatever the DEG held before.
+        How long it took is kept in load_info.
+        '''
+        if format is None:
+            format = os.path.splitext(fname)[1].lstrip('.').lower()
+            if format not in LOAD_FORMATS:
+                format = 'adj'
+        if format not in LOAD_FORMATS:
+            raise ValueError('Unknown graph format: %r' % format)
+
+        start = perf_counter()
+        intern = _Interner().__getitem__
+        sources = array('q')
+        targets = array('q')
+        weights = array('q')
+        # Until the first data line of an edge list has been seen
+        header_pending = format != 'adj'
+
+        def add_weights(dists):
+            nonlocal weights
+            if weights.typecode == 'q':
+                try:
+                    weights.fromlist(list(map(int, dists)))
+                    return
+                except ValueError:
+                    weights = array('d', weights)
+            weights.fromlist(list(map(float, dists)))
+
+        with open(fname, 'r') as fp:
+            for lines in _read_lines(fp, chunk_size):
+                chunk_sources = []
+                chunk_targets = []
+                dists = []
+                if format == 'adj':
+                    for cur_line in lines:
+                        words = cur_line.split()
+                        if not words or words[0][0] == '#':
+                            continue
+                        goals = words[1::2]
+                        chunk_sources += [intern(words[0])] * len(goals)
+                        chunk_targets += map(intern, goals)
+                        dists += words[2::2]
+                else:
+                    sep = ',' if format == 'csv' else '\t'
+                    if header_pending:
+                        # Decide on the header at the first data line
+                        for i, cur_line in enumerate(lines):
+                            if cur_line.strip() and cur_line[0] != '#':
+                                header_pending = False
+                                if header is None:
+                                    fields = cur_line.split(sep)
+                                    header = len(fields) > 2 and not _is_number(fields[2])
+                                lines = lines[i + 1:] if header else lines[i:]
+                                break
+                        else:
+                            lines = ()
+                    if lines:
+                        # Fast path: a chunk of uniform lines is split
+                        # into fields all at once
+                        num_fields = lines[0].count(sep) + 1
+                        text = '\n'.join(lines)
+                        fields = text.replace('\n', sep).split(sep)
+                        if num_fields >= 2 and len(fields) == num_fields * len(lines) \
+                                and '#' not in text and '' not in lines:
+                            chunk_sources += map(intern, map(str.strip, fields[0::num_fields]))
+                            chunk_targets += map(intern, map(str.strip, fields[1::num_fields]))
+                            if num_fields > 2:
+                                dists += fields[2::num_fields]
+                            else:
+                                dists += ['1'] * len(lines)
+                            lines = ()
+                    for cur_line in lines:
+                        if not cur_line.strip() or cur_line[0] == '#':
+                            continue
+                        fields = cur_line.split(sep)
+                        if len(fields) < 2:
+                            continue
+                        chunk_sources.append(intern(fields[0].strip()))
+                        chunk_targets.append(intern(fields[1].strip()))
+                        dists.append(fields[2] if len(fields) > 2 else '1')
+                sources.fromlist(chunk_sources)
+                targets.fromlist(chunk_targets)
+                add_weights(dists)
+
+        if len(weights) != len(targets):
+            raise ValueError('%s: every neighbor needs a distance' % fname)
+        # Ids were handed out in insertion order
+        self.nodes = dict(intern.__self__)
+        self.names = list(self.nodes)
+        self._build(sources, targets, weights)
+
+        seconds = perf_counter() - start
+        num_bytes = os.path.getsize(fname)
+        self.load_info = {
+            'seconds'       : seconds,
+            'bytes'         : num_bytes,
+            'nodes'         : len(self.names),
+            'edges'         : len(targets),
+            'edges_per_sec' : len(targets) / seconds if seconds else 0.0,
+            'mb_per_sec'    : num_bytes / 1e6 / seconds if seconds else 0.0,
+        }
         return True
-        
-        
-        
+
+
+def _little_endian(view):
+    ''' The bytes of an array view in little-endian order
+    '''
+    if sys.byteorder == 'little':
+        return view
+    swapped = array(view.format, view)
+    swapped.byteswap()
+    return swapped
+
+
+def _snapshot_header(data, path):
+    ''' Check the header of a mapped snapshot against its size
+
+    Return: (weight typecode, nodes, edges, bytes of names)
+    '''
+    if len(data) < _SNAPSHOT_HEADER.size:
+        raise ValueError('%s is not a graph snapshot' % path)
+    magic, version, typecode, num_nodes, num_edges, names_size = \
+        _SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError('%s is not a graph snapshot' % path)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError('Unsupported graph snapshot version %d' % version)
+    typecode = typecode.decode('ascii')
+    if typecode not in ('q', 'd'):
+        raise ValueError('Bad weight type in graph snapshot: %r' % typecode)
+
+    sizes = (8 * (num_nodes + 1), 8 * num_edges, 8 * num_edges)
+    if len(data) != _SNAPSHOT_HEADER.size + sum(sizes) + names_size:
+        raise ValueError('%s: truncated graph snapshot' % path)
+    return typecode, num_nodes, num_edges, names_size
+
+
+def is_snapshot(fname):
+    ''' True if fname starts like a graph snapshot
+    '''
+    with open(fname, 'rb') as fp:
+        return fp.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+
+class _Interner(dict):
+    ''' {name: id} that hands the next id to every new name looked up.
+    '''
+
+    def __missing__(self, node_name):
+        node_id = self[node_name] = len(self)
+        return node_id
+
+
+def _read_lines(fp, chunk_size):
+    ''' Yield the lines of a text file as lists, one chunk at a time.
+    '''
+    tail = ''
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+        yield lines
+    if tail:
+        yield [tail]
+
+
+def _is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
 if __name__ == '__main__':
-    map = DEG('cities.txt')
-    
-    print(map.to_string())
-    
-        
-    
\ No newline at end of file
+    if len(sys.argv) > 1:
+        # usage: search.py <graph file or snapshot> [format] [snapshot to write]
+        # Load a graph and report the load throughput
+        if is_snapshot(sys.argv[1]):
+            graph = DEG.open_snapshot(sys.argv[1])
+        else:
+            graph = DEG(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+        info = graph.load_info
+        seconds = max(info['seconds'], 1e-9)
+        print('%d nodes, %d edges in %.3f s: %.0f edges/s, %.1f MB/s'
+              % (info['nodes'], info['edges'], info['seconds'],
+                 info['edges'] / seconds, info['bytes'] / 1e6 / seconds))
+        if len(sys.argv) > 3:
+            graph.save_snapshot(sys.argv[3])
+        exit()
+
+    cities = DEG('cities.txt')
+
+    print(cities.to_string())
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import search
+import tempfile
+import unittest
+from Bidirectional import BiUCS, BiAstar
+from frontier import Frontier
+from Astar import Astar
+from UCS import UCS
+
+try:
+    import numpy
+    from contraction import CH, ContractionHierarchy
+    from landmarks import Landmarks
+except ImportError:
+    numpy = None
+
+CITIES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cities.txt')
+GRID_SIZE = 15
+GRID_SPURS = 3
+
+
+def write_grid(dirname, size=GRID_SIZE, seed=0):
+    ''' Write a seeded random grid graph as CSV and return its path
+
+    Nodes are named 'row_col', and both directions of every grid edge get
+    their own weight from 10 to 30, so ten times the Manhattan distance
+    is a consistent heuristic. A few spur nodes have edges into the grid
+    only, so they cannot be reached from it.
+    '''
+    rng = random.Random(seed)
+    lines = ['source,target,dist']
+    for row in range(size):
+        for col in range(size):
+            for next_row, next_col in ((row + 1, col), (row, col + 1)):
+                if next_row < size and next_col < size:
+                    a = '%d_%d' % (row, col)
+                    b = '%d_%d' % (next_row, next_col)
+                    lines.append('%s,%s,%d' % (a, b, rng.randint(10, 30)))
+                    lines.append('%s,%s,%d' % (b, a, rng.randint(10, 30)))
+    for spur in range(GRID_SPURS):
+        lines.append('spur%d,%d_%d,%d' % (spur, rng.randrange(size),
+                                          rng.randrange(size), rng.randint(10, 30)))
+    path = os.path.join(dirname, 'grid.csv')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+def grid_heuristic(a, b):
+    ''' Ten times the Manhattan distance between grid nodes, 0 for spurs
+    '''
+    if a.startswith('spur') or b.startswith('spur'):
+        return 0
+    row_a, col_a = map(int, a.split('_'))
+    row_b, col_b = map(int, b.split('_'))
+    return 10 * (abs(row_a - row_b) + abs(col_a - col_b))
+
+
+def path_cost(graph, path):
+    ''' Cost of path over the edges of graph; None for an empty path
+    '''
+    if not path:
+        return None
+    return sum(dict(graph.adj(a))[b] for a, b in zip(path, path[1:]))
+
+
+def grid_pairs(graph, count=60, seed=1):
+    ''' Seeded random (start, goal) pairs of node names, spurs included
+    '''
+    rng = random.Random(seed)
+    return [(rng.choice(graph.names), rng.choice(graph.names))
+            for _ in range(count)]
+
+
+class ParityTest(unittest.TestCase):
+    ''' Base for tests comparing path costs with those of UCS
+    '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cities = search.DEG(CITIES)
+        self.grid = search.DEG(write_grid(self.tmp.name))
+
+    def assertSameCost(self, graph, searcher, start, goal):
+        expected = path_cost(graph, UCS(graph).find_path(start, goal)[0])
+        path = searcher.find_path(start, goal)[0]
+        msg = '%s to %s' % (start, goal)
+        self.assertEqual(path_cost(graph, path), expected, msg)
+        if path:
+            self.assertEqual((path[0], path[-1]), (start, goal), msg)
+
+    def city_pairs(self):
+        return [(start, goal) for start in self.cities.names
+                for goal in self.cities.names]
+
+
+class TestDEG(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = search.DEG(CITIES)
+
+    def test_adj_by_name_and_id(self):
+        graph = self.graph
+        self.assertEqual(list(graph.adj('Arad')),
+                         [('Zerind', 75), ('Timisoara', 118), ('Sibiu', 140)])
+        arad = graph.id_of('Arad')
+        self.assertEqual(graph.name_of(arad), 'Arad')
+        self.assertEqual([(graph.name_of(node), dist) for node, dist in graph.adj(arad)],
+                         list(graph.adj('Arad')))
+        for node, _ in graph.adj(arad):
+            self.assertIsInstance(node, int)
+
+    def test_radj_by_name_and_id(self):
+        graph = self.graph
+        self.assertEqual(sorted(graph.radj('Bucharest')),
+                         [('Fagaras', 211), ('Giurgiu', 90),
+                          ('Pitesti', 101), ('Urziceni', 85)])
+        bucharest = graph.id_of('Bucharest')
+        self.assertEqual(sorted((graph.name_of(node), dist)
+                                for node, dist in graph.radj(bucharest)),
+                         sorted(graph.radj('Bucharest')))
+        # radj is adj reversed
+        for source in graph.names:
+            for target, dist in graph.adj(source):
+                self.assertIn((source, dist), list(graph.radj(target)))
+
+    def test_sizes(self):
+        self.assertEqual(len(self.graph), 20)
+        self.assertEqual(self.graph.num_edges(),
+                         sum(len(list(self.graph.adj(i))) for i in range(20)))
+        self.assertEqual(self.graph.weights.format, 'q')
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text, newline='\n'):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8', newline=newline) as f:
+            f.write(text)
+        return path
+
+    def test_formats(self):
+        edges = [('a', 'b', 2), ('b', 'c', 3), ('a', 'c', 7)]
+        paths = [
+            self.write('edges.csv', 'source,target,dist\n'
+                       + ''.join('%s,%s,%d\n' % edge for edge in edges)),
+            self.write('edges.tsv', ''.join('%s\t%s\t%d\n' % edge for edge in edges)),
+            self.write('edges.txt', '# adjacency\na b 2 c 7\n\nb c 3\n'),
+        ]
+        for path in paths:
+            graph = search.DEG(path)
+            self.assertEqual(sorted(graph.names), ['a', 'b', 'c'], path)
+            self.assertEqual(sorted((source, target, dist)
+                                    for source in graph.names
+                                    for target, dist in graph.adj(source)),
+                             sorted(edges), path)
+
+    def test_crlf_and_comments(self):
+        text = '# roads\nsrc,dst,dist\na,b,2\n# closed: b,a\nb,c,3.5\n\nc,a,1\n'
+        path = self.write('edges.csv', text, newline='\r\n')
+        # Small chunks split lines across reads
+        for chunk_size in (search.CHUNK_SIZE, 5):
+            graph = search.DEG()
+            graph.load(path, chunk_size=chunk_size)
+            self.assertEqual(graph.names, ['a', 'b', 'c'])
+            self.assertEqual(list(graph.adj('b')), [('c', 3.5)])
+            self.assertEqual(graph.weights.format, 'd')
+            self.assertEqual(graph.num_edges(), 3)
+
+        path = self.write('cities.txt', '# map\nArad Sibiu 140\nSibiu Arad 140\n',
+                          newline='\r\n')
+        self.assertEqual(list(search.DEG(path).adj('Sibiu')), [('Arad', 140)])
+
+    def test_header_after_comments(self):
+        path = self.write('edges.csv', '# roads\n\nsrc,dst,dist\na,b,2\nb,c,3\n')
+        graph = search.DEG(path)
+        self.assertEqual(graph.names, ['a', 'b', 'c'])
+        self.assertEqual(list(graph.adj('a')), [('b', 2)])
+
+    def test_two_column_header(self):
+        path = self.write('edges.csv', 'source,target\na,b\n')
+        graph = search.DEG()
+        graph.load(path, header=True)
+        self.assertEqual(graph.names, ['a', 'b'])
+        self.assertEqual(list(graph.adj('a')), [('b', 1)])
+        # Without the flag the header reads as an edge
+        graph.load(path)
+        self.assertEqual(sorted(graph.names), ['a', 'b', 'source', 'target'])
+
+    def test_bytes_counts_encoded_bytes(self):
+        path = self.write('edges.tsv', 'Brașov\tSibiu\t142\n')
+        graph = search.DEG(path)
+        self.assertEqual(graph.load_info['bytes'], os.path.getsize(path))
+        self.assertEqual(graph.load_info['bytes'], len('Brașov\tSibiu\t142\n') + 1)
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'graph.degs')
+
+    def assertSameGraph(self, graph, loaded):
+        self.assertEqual(loaded.names, graph.names)
+        self.assertEqual(loaded.nodes, graph.nodes)
+        self.assertEqual(list(loaded.offsets), list(graph.offsets))
+        self.assertEqual(loaded.weights.format, graph.weights.format)
+        for node in range(len(graph)):
+            self.assertEqual(list(loaded.adj(node)), list(graph.adj(node)))
+            self.assertEqual(list(loaded.radj(node)), list(graph.radj(node)))
+
+    def test_round_trip(self):
+        graph = search.DEG(CITIES)
+        graph.save_snapshot(self.path)
+        self.assertTrue(search.is_snapshot(self.path))
+        self.assertFalse(search.is_snapshot(CITIES))
+        loaded = search.DEG.open_snapshot(self.path)
+        self.assertSameGraph(graph, loaded)
+        self.assertEqual(loaded.load_info['bytes'], os.path.getsize(self.path))
+
+    def test_float_weights(self):
+        path = os.path.join(self.tmp.name, 'edges.tsv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('Brașov\tSibiu\t142.5\nSibiu\tBrașov\t142.5\n')
+        graph = search.DEG(path)
+        graph.save_snapshot(self.path)
+        loaded = search.DEG.open_snapshot(self.path)
+        self.assertSameGraph(graph, loaded)
+        self.assertEqual(list(loaded.adj('Brașov')), [('Sibiu', 142.5)])
+
+    def test_rejects_bad_files(self):
+        search.DEG(CITIES).save_snapshot(self.path)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        bad = os.path.join(self.tmp.name, 'bad.degs')
+        for name, contents in (('magic', b'XXXX' + data[4:]),
+                               ('truncated', data[:-1]),
+                               ('header', data[:10]),
+                               ('empty', b'')):
+            with open(bad, 'wb') as f:
+                f.write(contents)
+            with self.assertRaises(ValueError, msg=name):
+                search.DEG.open_snapshot(bad)
+
+
+class TestFrontier(unittest.TestCase):
+
+    def test_lazy_deletion(self):
+        frontier = Frontier()
+        self.assertTrue(frontier.put((5, 'a')))
+        self.assertTrue(frontier.put((3, 'b')))
+        # Lowering a's priority leaves its old entry on the heap
+        self.assertTrue(frontier.put((1, 'a')))
+        self.assertFalse(frontier.put((4, 'b')))
+        self.assertEqual(len(frontier), 3)
+
+        self.assertEqual(frontier.top(), (1, 'a'))
+        self.assertEqual(frontier.get(), (1, 'a'))
+        self.assertEqual(frontier.get(), (3, 'b'))
+        # Only the stale (5, 'a') is left
+        self.assertTrue(frontier.empty())
+        self.assertEqual(len(frontier), 0)
+        self.assertEqual(frontier.heap_ops(),
+                         {'pushes' : 3, 'pops' : 3, 'stale' : 1,
+                          'decreases' : 1, 'rejected' : 1})
+
+    def test_empty(self):
+        frontier = Frontier()
+        self.assertTrue(frontier.empty())
+        self.assertRaises(IndexError, frontier.top)
+        self.assertRaises(IndexError, frontier.get)
+        frontier.put((2, 'a'))
+        frontier.put((1, 'a'))
+        frontier.get()
+        self.assertRaises(IndexError, frontier.get)
+
+    def test_ties(self):
+        frontier = Frontier()
+        frontier.put((1, 7, 'a'))
+        frontier.put((1, 2, 'b'))
+        self.assertEqual(frontier.get(), (1, 2, 'b'))
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        path = os.path.join(self.tmp.name, 'edges.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('s a 1 b 4\na b 1\nb t 10\n')
+        self.graph = search.DEG(path)
+
+    def test_closed_improved(self):
+        ucs = UCS(self.graph)
+        self.assertEqual(ucs.find_path('s', 't')[0], ['s', 'a', 'b', 't'])
+        self.assertEqual(ucs.stats.closed_improved, 0)
+        # Overestimating at a closes b before its cheaper path is found
+        astar = Astar(self.graph, lambda node : 10 if node == 'a' else 0)
+        self.assertEqual(astar.find_path('s', 't')[0], ['s', 'b', 't'])
+        self.assertEqual(astar.stats.closed_improved, 1)
+        self.assertEqual(astar.stats.as_dict()['closed_improved'], 1)
+
+    def test_with_stats(self):
+        zero = lambda a, b : 0
+        for searcher in (UCS(self.graph), Astar(self.graph, lambda node : 0),
+                         BiUCS(self.graph), BiAstar(self.graph, zero)):
+            # No edge leads into s
+            for start, goal, path in (('s', 't', ['s', 'a', 'b', 't']),
+                                      ('t', 's', [])):
+                found, explored, stats = searcher.find_path(start, goal,
+                                                            with_stats=True)
+                self.assertEqual(found, path)
+                self.assertIs(stats, searcher.stats)
+                self.assertGreater(stats.expanded, 0)
+                self.assertEqual(len(searcher.find_path(start, goal)), 2)
+
+
+class TestBidirectional(ParityTest):
+
+    def test_cities(self):
+        zero = lambda a, b : 0
+        for start, goal in self.city_pairs():
+            self.assertSameCost(self.cities, BiUCS(self.cities), start, goal)
+            self.assertSameCost(self.cities, BiAstar(self.cities, zero), start, goal)
+
+    def test_random_graph(self):
+        for start, goal in grid_pairs(self.grid):
+            self.assertSameCost(self.grid, BiUCS(self.grid), start, goal)
+            self.assertSameCost(self.grid, BiAstar(self.grid, grid_heuristic),
+                                start, goal)
+
+    def test_stats(self):
+        bi_ucs = BiUCS(self.cities)
+        path, explored = bi_ucs.find_path('Arad', 'Bucharest')
+        self.assertEqual(path, ['Arad', 'Sibiu', 'Rimnicu', 'Pitesti', 'Bucharest'])
+        self.assertGreaterEqual(bi_ucs.stats.expanded, len(explored))
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestLandmarks(ParityTest):
+
+    def check(self, graph, landmarks, pairs):
+        for start, goal in pairs:
+            self.assertSameCost(graph, Astar(graph, landmarks.goal_heuristic(goal)),
+                                start, goal)
+            self.assertSameCost(graph, BiAstar(graph, landmarks.heuristic),
+                                start, goal)
+
+    def test_cities(self):
+        for method in ('farthest', 'random'):
+            landmarks = Landmarks.build(self.cities, 4, method, seed=0)
+            self.assertEqual(len(landmarks), 4)
+            self.check(self.cities, landmarks, self.city_pairs())
+
+    def test_random_graph(self):
+        landmarks = Landmarks.build(self.grid, 6, seed=0)
+        self.check(self.grid, landmarks, grid_pairs(self.grid))
+
+    def test_save_load(self):
+        landmarks = Landmarks.build(self.grid, 6, seed=0)
+        path = os.path.join(self.tmp.name, 'grid.npz')
+        landmarks.save(path)
+        loaded = Landmarks.load(self.grid, path)
+        self.assertEqual(loaded.ids.tolist(), landmarks.ids.tolist())
+        self.assertTrue(numpy.array_equal(loaded.dist_from, landmarks.dist_from))
+        self.assertTrue(numpy.array_equal(loaded.dist_to, landmarks.dist_to))
+        self.check(self.grid, loaded, grid_pairs(self.grid, 20))
+        # Tables of another graph are refused
+        self.assertRaises(ValueError, Landmarks.load, self.cities, path)
+
+    def test_unknown_method(self):
+        self.assertRaises(ValueError, Landmarks.build, self.cities, 4, 'central')
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestContraction(ParityTest):
+
+    def hierarchies(self, graph):
+        ''' The hierarchy of graph, and a copy reloaded from a .npz file
+        '''
+        hierarchy = ContractionHierarchy.build(graph)
+        path = os.path.join(self.tmp.name, 'graph.ch.npz')
+        hierarchy.save(path)
+        return hierarchy, ContractionHierarchy.load(path)
+
+    def test_cities(self):
+        for hierarchy in self.hierarchies(self.cities):
+            self.assertEqual(len(hierarchy), len(self.cities))
+            for start, goal in self.city_pairs():
+                self.assertSameCost(self.cities, CH(hierarchy), start, goal)
+
+    def test_random_graph(self):
+        for hierarchy in self.hierarchies(self.grid):
+            for start, goal in grid_pairs(self.grid):
+                self.assertSameCost(self.grid, CH(hierarchy), start, goal)
+
+    def test_names_and_ids(self):
+        hierarchy, loaded = self.hierarchies(self.cities)
+        self.assertEqual(loaded.names, hierarchy.names)
+        self.assertEqual(loaded.shortcuts, hierarchy.shortcuts)
+        ch = CH(loaded)
+        path, explored, stats = ch.find_path('Arad', 'Bucharest', with_stats=True)
+        self.assertIs(stats, ch.stats)
+        self.assertEqual(path, ['Arad', 'Sibiu', 'Rimnicu', 'Pitesti', 'Bucharest'])
+        arad = self.cities.id_of('Arad')
+        bucharest = self.cities.id_of('Bucharest')
+        self.assertEqual(CH(loaded).find_path(arad, bucharest)[0],
+                         [self.cities.id_of(name) for name in path])
+
+
+if __name__ == '__main__':
+    unittest.main()
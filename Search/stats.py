@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Statistics and tracing for the graph searches.
+
+Every find_path() fills in a SearchStats, kept as the search object's
+stats attribute and returned with the path by find_path(start, goal,
+with_stats=True), instead of printing as it goes. For a closer look, pass
+a Trace as the trace argument of UCS or Astar: it receives one record per
+event, keeps every n-th one, and holds them in memory or writes them to a
+file as JSON lines.
+"""
+
+import json
+from time import perf_counter
+
+
+class SearchStats(object):
+    ''' Counters of one search
+
+    expanded:        nodes taken off the frontier and expanded
+    generated:       edges followed out of expanded nodes
+    closed_improved: times an expanded node was reached again by a cheaper
+                     path; the searches never reopen a node, so with A*
+                     this means the heuristic is not consistent and the
+                     path found may not be the shortest
+    max_frontier:    most entries on the frontier at once
+    elapsed:         seconds the search took
+    heap_ops:        heap operation counts of the frontier
+                     (Frontier.heap_ops())
+    '''
+
+    __slots__ = ('expanded', 'generated', 'closed_improved', 'max_frontier',
+                 'elapsed', 'heap_ops', 'start')
+
+    def __init__(self):
+        self.expanded = 0
+        self.generated = 0
+        self.closed_improved = 0
+        self.max_frontier = 0
+        self.elapsed = 0.0
+        self.heap_ops = {}
+        self.start = perf_counter()
+
+    def stop(self, frontier=None):
+        self.elapsed = perf_counter() - self.start
+        if frontier is not None:
+            self.heap_ops = frontier.heap_ops()
+        return self
+
+    def as_dict(self):
+        return {'expanded'        : self.expanded,
+                'generated'       : self.generated,
+                'closed_improved' : self.closed_improved,
+                'max_frontier'    : self.max_frontier,
+                'elapsed'         : self.elapsed,
+                'heap_ops'        : dict(self.heap_ops)}
+
+    def __repr__(self):
+        return 'SearchStats(%s)' % ', '.join('%s=%r' % item
+                                             for item in self.as_dict().items())
+
+
+class Trace(object):
+    ''' A sink for search events
+
+    Searches call trace(event, node, cost, priority) with the events
+    'expand' (a node taken off the frontier), 'push' (a node put on the
+    frontier at a new best cost) and 'found' (the goal reached). The
+    backward side of a bidirectional search reports 'expand_back' and
+    'push_back'.
+
+    out:     None to keep the records in self.records, or a file object or
+             file name to write them to as JSON lines
+    every:   keep only every n-th event
+    events:  event names to keep, None for all of them
+    '''
+
+    def __init__(self, out=None, every=1, events=None):
+        self.every = every
+        self.events = None if events is None else frozenset(events)
+        self.seen = 0
+        self.records = []
+        self._owned = isinstance(out, str)
+        self.out = open(out, 'w') if self._owned else out
+
+    def __call__(self, event, node, cost, priority=None):
+        if self.events is not None and event not in self.events:
+            return
+        self.seen += 1
+        if (self.seen - 1) % self.every:
+            return
+        record = {'event' : event, 'node' : node, 'cost' : cost}
+        if priority is not None:
+            record['priority'] = priority
+        if self.out is None:
+            self.records.append(record)
+        else:
+            self.out.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self._owned:
+            self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
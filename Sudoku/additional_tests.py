@@ -1,7 +1,26 @@
 #!/usr/bin/env python3
 
+import benchmark
+import branching
+import cache
+import dlx
+import engine
+import generator
+import os
+import random
+import tempfile
 import solution
+import strategies
 import unittest
+from unittest import mock
+import variants
+
+try:
+    import numpy
+    import board
+    import validate
+except ImportError:
+    numpy = None
 
 
 
@@ -36,9 +55,434 @@ class TestStandard(unittest.TestCase):
         for index, cur_grid in enumerate(self.grids):
             print('Diagonal Sudoku: Working on grid ', index)    
             self.assertTrue(solution.is_valid_solution(
-                    solution.solve(cur_grid)))        
+                    solution.solve(cur_grid), solution.DIAGONAL))        
        
-        
+
+
+class TestSolveMany(unittest.TestCase):
+    grids = TestStandard.grids
+
+    def check(self, grid, res):
+        self.assertEqual(len(res), 81)
+        for given, digit in zip(grid, res):
+            if given != '.':
+                self.assertEqual(given, digit)
+        self.assertTrue(solution.is_valid_solution(
+                engine.values_from_masks(
+                    engine.masks_from_grid(res), solution.boxes)))
+
+    def test_ordered(self):
+        results = list(solution.solve_many(self.grids, workers=2, chunksize=5))
+        self.assertEqual(len(results), len(self.grids))
+        for grid, res in zip(self.grids, results):
+            self.check(grid, res)
+
+    def test_unordered(self):
+        results = dict(solution.solve_many(self.grids, workers=2, chunksize=3,
+                                           ordered=False,
+                                           variant=solution.STANDARD))
+        self.assertEqual(sorted(results), list(range(len(self.grids))))
+        for index, grid in enumerate(self.grids):
+            self.check(grid, results[index])
+
+    def test_in_process_matches_solve(self):
+        grid = '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
+        res, = solution.solve_many([grid], workers=1)
+        expected = solution.solve(grid)
+        self.assertEqual(res, ''.join(expected[box] for box in solution.boxes))
+
+
+class TestStrategies(unittest.TestCase):
+    grids = TestStandard.grids
+
+    def test_each_strategy_keeps_solutions(self):
+        # All but the last grid have a unique diagonal solution
+        expected = [solution.solve(grid) for grid in self.grids]
+        for name in strategies.ALL_STRATEGIES:
+            pipeline = strategies.Pipeline([name])
+            for grid, res in zip(self.grids[:-1], expected):
+                self.assertEqual(solution.solve(grid, pipeline=pipeline), res, name)
+            for grid in self.grids:
+                self.assertTrue(solution.is_valid_solution(
+                        solution.solve_standard_sudoku(grid, pipeline=pipeline)), name)
+
+    def test_report(self):
+        pipeline = strategies.Pipeline()
+        for grid in self.grids:
+            self.assertTrue(solution.is_valid_solution(
+                    solution.solve(grid, pipeline=pipeline), solution.DIAGONAL))
+        report = pipeline.report()
+        self.assertEqual(list(report), list(strategies.ALL_STRATEGIES))
+        self.assertGreater(report['locked_candidates']['eliminated'], 0)
+        self.assertGreaterEqual(report['locked_candidates']['runs'],
+                                report['x_wing']['runs'])
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            strategies.Pipeline(['swordfish'])
+
+
+class TestDancingLinks(unittest.TestCase):
+    grids = TestStandard.grids
+
+    def test_matches_mask_engine(self):
+        # All but the last grid have a unique diagonal solution
+        for grid in self.grids[:-1]:
+            self.assertEqual(solution.solve(grid, engine='dlx'), solution.solve(grid))
+
+    def test_standard_and_variants(self):
+        for grid in self.grids:
+            self.assertTrue(solution.is_valid_solution(
+                    solution.solve_standard_sudoku(grid, engine='dlx')))
+        self.assertTrue(solution.is_valid_solution(
+                solution.solve('.' * 81, variants.WINDOKU, engine='dlx'),
+                variants.WINDOKU))
+
+    def test_matrix_size(self):
+        self.assertEqual(len(dlx.matrix_for(solution.STANDARD).size), 1 + 324)
+        self.assertEqual(len(dlx.matrix_for(solution.DIAGONAL).size), 1 + 324 + 18)
+
+    def test_no_solution(self):
+        self.assertFalse(solution.solve('11' + '.' * 79, engine='dlx'))
+        with self.assertRaises(ValueError):
+            solution.solve(self.grids[0], engine='sat')
+
+
+class TestBranching(unittest.TestCase):
+    grids = TestStandard.grids
+
+    specs = ['%s:%s' % (variable, value) for variable in branching.VARIABLE_HEURISTICS
+                                         for value in branching.VALUE_HEURISTICS]
+
+    def test_same_solutions(self):
+        # All but the last grid have a unique diagonal solution
+        expected = [solution.solve(grid) for grid in self.grids[:-1]]
+        for spec in self.specs:
+            brancher = branching.Brancher.parse(spec)
+            for grid, res in zip(self.grids[:-1], expected):
+                self.assertEqual(solution.solve(grid, brancher=brancher), res, spec)
+            for grid in self.grids:
+                self.assertTrue(solution.is_valid_solution(
+                        solution.solve_standard_sudoku(grid, brancher=brancher)), spec)
+            self.assertEqual(solution.count_solutions(self.grids[-1], limit=None),
+                             solution.count_solutions(self.grids[-1], limit=None,
+                                                      brancher=brancher), spec)
+
+    def test_buckets_follow_undo(self):
+        brancher = branching.Brancher('dom_wdeg', 'lcv')
+        masks = engine.masks_from_grid(self.grids[2], solution.DIAGONAL)
+        self.assertEqual(engine.count_solutions(masks, solution.DIAGONAL, None,
+                                                brancher=brancher), 1)
+        self.assertGreater(brancher.conflicts, 0)
+        board = engine._new_board(masks, solution.DIAGONAL, brancher=brancher)
+        board.propagate()
+        mark = board.mark()
+        box, guesses = engine._branch(board)
+        board.shrink(box, guesses[-1])
+        board.propagate()
+        board.undo(mark)
+        for box, mask in enumerate(board.masks):
+            self.assertEqual(brancher.where[box], engine.BIT_COUNT[mask])
+            self.assertIn(box, brancher.buckets[brancher.where[box]])
+
+    def test_with_recorder(self):
+        rec = solution.AssignmentRecorder(maxlen=None)
+        res = solution.solve(self.grids[2], recorder=rec,
+                             brancher=branching.Brancher('mrv_degree', 'lcv'))
+        self.assertEqual(res, solution.solve(self.grids[2]))
+        self.assertEqual(rec.board(len(rec)),
+                         engine.masks_from_values(res, solution.boxes))
+
+    def test_bad_heuristics(self):
+        with self.assertRaises(ValueError):
+            branching.Brancher('largest')
+        with self.assertRaises(ValueError):
+            branching.Brancher.parse('mrv:random')
+        with self.assertRaises(ValueError):
+            solution.solve(self.grids[0], engine='dlx', brancher=branching.Brancher())
+
+
+class TestGenerator(unittest.TestCase):
+
+    def test_unique_puzzles(self):
+        rng = random.Random(7)
+        for variant in (variants.STANDARD, variants.DIAGONAL):
+            full = generator.random_solution(variant, rng)
+            grid = generator.make_puzzle(full, variant, rng)
+            self.assertLess(grid.count('.'), 81)
+            self.assertEqual(solution.count_solutions(grid, None, variant), 1)
+            solved = engine.solve_grid(grid, variant)
+            self.assertEqual(solved, engine.grid_from_masks(full, variant))
+            self.assertTrue(all(c in '.' + s for c, s in zip(grid, solved)))
+            # Symmetric removal keeps the clue pattern symmetric
+            self.assertEqual([c == '.' for c in grid], [c == '.' for c in grid[::-1]])
+
+    def test_rate(self):
+        self.assertEqual(generator.rate(benchmark.read_corpus('easy')[0]).level, 'easy')
+        rating = generator.rate(
+                '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......')
+        self.assertEqual(rating, ('medium', ('locked_candidates',), 0))
+        rating = generator.rate(
+                '.....6....59.....82....8....45........3........6..3.54...325..6..................')
+        self.assertIn(rating.level, ('expert', 'extreme'))
+        self.assertGreater(rating.nodes, 0)
+        with self.assertRaises(ValueError):
+            generator.rate('11' + '.' * 79)
+
+    def test_generate_many(self):
+        puzzles = list(generator.generate_many(3, workers=1, seed=11))
+        self.assertEqual(len(puzzles), 3)
+        self.assertEqual(puzzles, list(generator.generate_many(3, workers=1, seed=11)))
+        for grid, rating in puzzles:
+            self.assertEqual(generator.rate(grid), rating)
+        for grid, rating in generator.generate_many(2, 'medium', workers=1, seed=3):
+            self.assertEqual(rating.level, 'medium')
+        with self.assertRaises(ValueError):
+            generator.generate('impossible')
+
+
+class TestSolverStats(unittest.TestCase):
+    grids = TestStandard.grids
+
+    def test_counters(self):
+        stats = engine.SolverStats()
+        pipeline = strategies.Pipeline()
+        for grid in self.grids:
+            self.assertEqual(solution.solve(grid, pipeline=pipeline, stats=stats),
+                             solution.solve(grid, pipeline=strategies.Pipeline()))
+        self.assertGreater(stats.nodes, 0)
+        self.assertGreater(stats.max_depth, 1)
+        self.assertGreaterEqual(stats.passes, stats.nodes)
+        self.assertGreater(stats.eliminated['eliminate'], 0)
+        self.assertGreater(stats.eliminated['locked_candidates'], 0)
+        self.assertEqual(set(stats.seconds), set(engine.PHASES))
+        report = stats.as_dict()
+        self.assertEqual(report['passes'], stats.passes)
+        stats.reset()
+        self.assertEqual((stats.nodes, stats.max_depth, stats.passes), (0, 0, 0))
+
+    def test_reduce_puzzle(self):
+        stats = engine.SolverStats()
+        values = solution.grid_values(self.grids[0])
+        self.assertTrue(solution.reduce_puzzle(values, stats=stats))
+        self.assertEqual(stats.nodes, 0)
+        self.assertGreater(stats.passes, 0)
+
+    def test_phase_counts_add_up(self):
+        # Propagation alone solves this one, with all three phases, so
+        # between them they remove every candidate but the solution's
+        grid = benchmark.read_corpus('hard')[14]
+        masks = engine.masks_from_grid(grid, variants.STANDARD)
+        stats = engine.SolverStats()
+        solved = engine.reduce_puzzle(masks, variants.STANDARD, stats=stats)
+        self.assertEqual(solved, engine.reduce_puzzle(masks, variants.STANDARD))
+        bit_count = variants.STANDARD.bit_count
+        self.assertEqual(sum(stats.eliminated.values()),
+                         sum(bit_count[mask] for mask in masks) - 81)
+        self.assertGreater(stats.eliminated['only_choice'], 0)
+        self.assertGreater(stats.eliminated['naked_twins'], 0)
+
+    def test_trace(self):
+        events = []
+        stats = engine.SearchStats(trace=lambda *event: events.append(event))
+        self.assertTrue(solution.solve(self.grids[2], stats=stats))
+        guesses = [e for e in events if e[0] == 'guess']
+        backtracks = [e for e in events if e[0] == 'backtrack']
+        self.assertEqual(len(backtracks), stats.backtracks)
+        self.assertGreaterEqual(len(guesses), stats.nodes)
+        self.assertEqual(max(depth for _, depth, _, _ in events), stats.max_depth)
+
+    def test_dlx_depth(self):
+        stats = engine.SearchStats()
+        self.assertTrue(solution.solve(self.grids[1], engine='dlx', stats=stats))
+        self.assertGreater(stats.max_depth, 0)
+
+
+class TestSolutionCache(unittest.TestCase):
+    grids = TestStandard.grids
+
+    @staticmethod
+    def transform(grid):
+        # Swap the first two bands, reverse the columns of the first stack,
+        # transpose and relabel 1 <-> 9
+        rows = [3, 4, 5, 0, 1, 2, 6, 7, 8]
+        cols = [2, 1, 0, 3, 4, 5, 6, 7, 8]
+        moved = [grid[9*rows[c] + cols[r]] for r in range(9) for c in range(9)]
+        return ''.join(moved).translate(str.maketrans('19', '91'))
+
+    def test_canonical_form(self):
+        for grid in self.grids:
+            canonical, transform = cache.canonical_form(grid)
+            self.assertEqual(cache.canonical_form(self.transform(grid))[0], canonical)
+            self.assertEqual(transform.forward(grid), canonical)
+            self.assertEqual(transform.inverse(canonical), grid)
+
+    def test_hits_map_back(self):
+        solutions = cache.SolutionCache(maxsize=4)
+        for grid in self.grids[:3]:
+            for puzzle in (grid, self.transform(grid)):
+                res = solution.solve_standard_sudoku(puzzle, cache=solutions)
+                self.assertTrue(solution.is_valid_solution(res))
+                for box, c in zip(solution.boxes, puzzle):
+                    if c != '.':
+                        self.assertEqual(res[box], c)
+        self.assertEqual(solutions.info(), cache.CacheInfo(3, 3, 0, 4, 3))
+
+    def test_lru_limit(self):
+        solutions = cache.SolutionCache(maxsize=2)
+        for grid in self.grids[:3] + self.grids[2:3]:
+            solution.solve(grid, cache=solutions)
+        self.assertEqual(solutions.info(), cache.CacheInfo(1, 3, 1, 2, 2))
+        self.assertFalse(solution.solve('11' + '.' * 79, cache=solutions))
+        self.assertFalse(solution.solve('22' + '.' * 79, cache=solutions))
+        self.assertEqual(solutions.hits, 2)
+        with self.assertRaises(ValueError):
+            solution.solve(self.grids[0], recorder=solution.AssignmentRecorder(),
+                           cache=solutions)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestBatchValidation(unittest.TestCase):
+    grids = TestStandard.grids
+
+    def test_valid_and_invalid(self):
+        solved = [engine.solve_grid(grid, variants.DIAGONAL)
+                  for grid in self.grids[:-1]]
+        boards = validate.array_from_grids(solved)
+        self.assertEqual(boards.shape, (len(solved), 81))
+        self.assertEqual(boards.dtype, numpy.uint8)
+
+        boards[1, [0, 1]] = boards[1, [1, 0]]    # breaks columns 1 and 2
+        boards[2, 80] = 0                        # unfinished
+        boards[3, :9] = boards[3, 9:18]          # breaks column 1 only
+        valid, first_bad = validate.validate_batch(boards, chunk_size=4)
+        self.assertEqual(list(valid), [True, False, False, False] + [True] * (len(solved) - 4))
+        self.assertEqual(list(first_bad[:4]), [-1, 9, 8, 9])
+
+        valid, _ = validate.validate_batch(boards, variants.DIAGONAL)
+        self.assertEqual(list(valid), list(validate.validate_batch(boards)[0]))
+
+    def test_diagonals(self):
+        boards = validate.array_from_grids([engine.solve_grid(
+                '.' * 81, variants.STANDARD)])
+        self.assertTrue(validate.validate_batch(boards)[0][0])
+        valid, first_bad = validate.validate_batch(boards, variants.DIAGONAL)
+        self.assertFalse(valid[0])
+        self.assertGreaterEqual(first_bad[0], 27)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestBoardFiles(unittest.TestCase):
+    grids = TestStandard.grids
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_text_and_packed(self):
+        with open(self.path('in.txt'), 'w') as f:
+            f.write('# puzzles\n\n' + '\r\n'.join(self.grids) + '\n')
+        boards = board.read_array(self.path('in.txt'))
+        self.assertEqual(boards.shape, (len(self.grids), 81))
+        self.assertEqual(board.array_to_grids(boards), self.grids)
+
+        board.write_array(self.path('in.bin'), boards, 'packed')
+        self.assertEqual(os.path.getsize(self.path('in.bin')), 8 + 41 * len(self.grids))
+        with board.BoardFile(self.path('in.bin')) as puzzles:
+            self.assertEqual(puzzles.format, 'packed')
+            self.assertEqual(len(puzzles), len(self.grids))
+            self.assertEqual(list(puzzles.grids(chunk_size=5)), self.grids)
+
+    def test_solve_file(self):
+        board.write_array(self.path('in.bin'), validate.array_from_grids(
+                self.grids + ['11' + '.' * 79]), 'packed')
+        self.assertEqual(board.solve_file(self.path('in.bin'), self.path('out.txt'),
+                                          'text', workers=1, chunk_size=4),
+                         (len(self.grids) + 1, 1))
+        with board.BoardFile(self.path('out.txt')) as solutions:
+            boards = solutions.array()
+        valid, _ = validate.validate_batch(boards)
+        self.assertEqual(list(valid), [True] * len(self.grids) + [False])
+
+    def test_bad_input(self):
+        with open(self.path('bad.txt'), 'w') as f:
+            f.write(self.grids[0] + '\n' + self.grids[1][:80] + '\n')
+        with self.assertRaises(ValueError):
+            board.read_array(self.path('bad.txt'))
+        with self.assertRaises(ValueError):
+            board.BoardWriter(self.path('big.bin'), 'packed', variants.STANDARD16)
+
+    def test_bad_packed_file(self):
+        path = self.path('in.bin')
+        board.write_array(path, validate.array_from_grids(self.grids[:3]), 'packed')
+        with open(path, 'rb') as f:
+            data = bytearray(f.read())
+
+        # Wrong board size: the file and the mapping are closed again
+        opened = []
+
+        def tracking_open(*args):
+            opened.append(open(*args))
+            return opened[-1]
+
+        with mock.patch('board.open', tracking_open, create=True):
+            with self.assertRaises(ValueError):
+                board.BoardFile(path, variants.STANDARD16)
+        self.assertTrue(opened[0].closed)
+
+        # A digit above 9 in the third puzzle
+        data[8 + 2 * 41 + 5] = 0xA1
+        with open(path, 'wb') as f:
+            f.write(data)
+        with board.BoardFile(path) as puzzles:
+            with self.assertRaisesRegex(ValueError, 'packed puzzle 2'):
+                puzzles.array()
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_corpora(self):
+        for name, (_, variant) in benchmark.CORPORA.items():
+            grids = benchmark.read_corpus(name)
+            self.assertTrue(grids)
+            # No puzzle is another one transformed, which would only pad
+            # the corpus with work the solver has already been timed on
+            canonical = {cache.canonical_form(grid, variant)[0] for grid in grids}
+            self.assertEqual(len(canonical), len(grids), name)
+            for grid in grids:
+                self.assertEqual(len(grid), 81)
+            self.assertEqual(solution.count_solutions(grids[0], variant=variant), 1)
+
+    def test_percentile(self):
+        ordered = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(ordered, 0.99), 99)
+        self.assertEqual(benchmark.percentile(ordered, 0.50), 50)
+        self.assertEqual(benchmark.percentile(ordered, 1.0), 100)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4, 5, 6], 0.50), 3)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4, 5, 6], 0.99), 6)
+        self.assertEqual(benchmark.percentile([7], 0.50), 7)
+        self.assertEqual(benchmark.percentile([1, 2, 3], 0.0), 1)
+
+    def test_run(self):
+        results = benchmark.run(['hard'], configs=['none', 'locked_candidates'])
+        self.assertEqual([(r['engine'], r['strategies']) for r in results],
+                         [('mask', 'none'), ('mask', 'locked_candidates'),
+                          ('dlx', 'none')])
+        for result in results:
+            self.assertEqual(result['unsolved'], 0)
+            self.assertGreater(result['nodes_per_puzzle'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertIn('locked_candidates', results[1]['rule_hits'])
+        self.assertNotIn('rule_hits', results[0])
+        # Every mask configuration counts removals per phase; dlx has none
+        self.assertGreater(results[0]['eliminated']['eliminate'], 0)
+        self.assertGreater(results[0]['eliminated']['only_choice'], 0)
+        self.assertGreater(results[1]['eliminated']['locked_candidates'], 0)
+        self.assertIsNone(results[2]['eliminated'])
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Sudoku engines on the built-in puzzle corpora.
+
+Every combination of corpus, engine and strategy configuration is timed
+one puzzle at a time and reported as throughput (puzzles/sec), p50/p99
+latency and search nodes and backtracks per puzzle. For the bitmask
+engine it also reports the candidates removed by every propagation phase
+(eliminate, only choice, naked twins and each strategy) and, with
+strategies, how often each strategy ran; the DLX engine does not
+propagate, so its removals are null.
+The results are printed as a table and can be written out as JSON to
+compare runs:
+
+    python benchmark.py -c hard 17clue -e mask dlx -s none all -o run.json
+
+A strategy configuration is 'none', 'all' or a comma-separated list of
+names from strategies.STRATEGIES. The DLX engine has no strategies and
+only runs with 'none'.
+
+Branching heuristics for the bitmask engine are compared with -b, giving
+'scan' for the built-in box scan or a branching.Brancher spec such as
+'mrv_degree' or 'dom_wdeg:lcv':
+
+    python benchmark.py -c hard -e mask -s none -b scan mrv_degree dom_wdeg:lcv
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+from time import perf_counter
+
+import dlx
+import engine as mask_engine
+from branching import Brancher
+from strategies import Pipeline, ALL_STRATEGIES
+from variants import STANDARD, DIAGONAL
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpora')
+
+# Corpus name: (file in CORPUS_DIR, variant its puzzles are unique under)
+CORPORA = {
+    'easy'     : ('easy.txt', STANDARD),
+    'hard'     : ('hard.txt', STANDARD),
+    '17clue'   : ('17clue.txt', STANDARD),
+    'diagonal' : ('diagonal.txt', DIAGONAL),
+}
+
+ENGINES = ('mask', 'dlx')
+
+
+def read_corpus(name):
+    """Return the puzzles of a built-in corpus as a list of grid strings.
+
+    Corpus files hold one 81-character puzzle per line; blank lines and
+    lines starting with '#' are skipped.
+    """
+    try:
+        fname, _ = CORPORA[name]
+    except KeyError:
+        raise ValueError('Unknown Sudoku corpus: %r' % name)
+    with open(os.path.join(CORPUS_DIR, fname)) as f:
+        return [line.strip() for line in f
+                if line.strip() and not line.startswith('#')]
+
+
+def parse_strategies(config):
+    """Turn a strategy configuration into a tuple of strategy names."""
+    if config == 'none':
+        return ()
+    if config == 'all':
+        return ALL_STRATEGIES
+    return tuple(name.strip() for name in config.split(',') if name.strip())
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted, non-empty list.
+
+    The smallest value with at least fraction of the list at or below it.
+    """
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def parse_branching(config):
+    """Turn a branching configuration into a Brancher, or None for 'scan'."""
+    if config == 'scan':
+        return None
+    return Brancher.parse(config)
+
+
+def run_config(grids, variant, engine='mask', strategies=(), repeat=1,
+               brancher=None):
+    """Solve every grid repeat times and summarize the run.
+
+    Returns:
+        A dictionary with the throughput, latency percentiles (in
+        milliseconds), per-puzzle search counters, the number of puzzles
+        left unsolved, the candidates removed per phase and strategy in
+        one pass over the grids (engine.SolverStats.eliminated) as
+        'eliminated', None for the dlx engine, which has no propagation
+        phases, and, with strategies, the per-rule counters of
+        Pipeline.report() as 'rule_hits'.
+    """
+    if engine not in ENGINES:
+        raise ValueError('Unknown Sudoku engine: %r' % engine)
+    if engine == 'dlx' and strategies:
+        raise ValueError('The dlx engine does not run strategies')
+    if engine == 'dlx' and brancher is not None:
+        raise ValueError('The dlx engine has its own branching')
+
+    stats = mask_engine.SearchStats()
+    pipeline = Pipeline(strategies) if strategies else None
+    latencies = []
+    unsolved = 0
+
+    for _ in range(repeat):
+        for grid in grids:
+            start = perf_counter()
+            if engine == 'dlx':
+                result = dlx.solve_grid(grid, variant, stats)
+            else:
+                result = mask_engine.solve_grid(grid, variant, pipeline, stats, brancher)
+            latencies.append(perf_counter() - start)
+            if result is False:
+                unsolved += 1
+
+    solves = len(latencies)
+    latencies.sort()
+    total = sum(latencies)
+    report = {
+        'puzzles'           : solves,
+        'unsolved'          : unsolved,
+        'seconds'           : total,
+        'puzzles_per_sec'   : solves / total if total else 0.0,
+        'p50_ms'            : 1000 * percentile(latencies, 0.50) if solves else 0.0,
+        'p99_ms'            : 1000 * percentile(latencies, 0.99) if solves else 0.0,
+        'nodes_per_puzzle'  : stats.nodes / solves if solves else 0.0,
+        'backtracks_per_puzzle' : stats.backtracks / solves if solves else 0.0,
+    }
+    if pipeline is not None:
+        report['rule_hits'] = pipeline.report()
+
+    if engine == 'dlx':
+        report['eliminated'] = None
+        return report
+
+    # Removals are counted in a separate, untimed pass: a SolverStats runs
+    # the solves on the slower instrumented board
+    counts = mask_engine.SolverStats()
+    pipeline = Pipeline(strategies) if strategies else None
+    for grid in grids:
+        mask_engine.solve_grid(grid, variant, pipeline, counts, brancher)
+    report['eliminated'] = dict(counts.eliminated)
+    return report
+
+
+def run(corpora, engines=ENGINES, configs=('none',), repeat=1, branching=('scan',)):
+    """Run every corpus/engine/strategy/branching combination.
+
+    Returns:
+        A list of result dictionaries, one per combination, each tagged
+        with its corpus, engine, strategy and branching configuration.
+    """
+    results = []
+    for corpus in corpora:
+        grids = read_corpus(corpus)
+        variant = CORPORA[corpus][1]
+        for engine in engines:
+            for config in configs:
+                strategies = parse_strategies(config)
+                if engine == 'dlx' and strategies:
+                    continue
+                for branch_config in branching:
+                    brancher = parse_branching(branch_config)
+                    if engine == 'dlx' and brancher is not None:
+                        continue
+                    result = {'corpus' : corpus, 'variant' : variant.name,
+                              'engine' : engine, 'strategies' : config,
+                              'branching' : branch_config}
+                    result.update(run_config(grids, variant, engine,
+                                             strategies, repeat, brancher))
+                    results.append(result)
+    return results
+
+
+def show_results(results, out=sys.stdout):
+    header = '{:<10} {:<6} {:<24} {:<16} {:>10} {:>9} {:>9} {:>9} {:>11}'
+    row    = '{:<10} {:<6} {:<24} {:<16} {:>10.1f} {:>9.3f} {:>9.3f} {:>9.1f} {:>11.1f}'
+    print(header.format('corpus', 'engine', 'strategies', 'branching', 'puzzles/s',
+                        'p50 ms', 'p99 ms', 'nodes', 'backtracks'), file=out)
+    for r in results:
+        print(row.format(r['corpus'], r['engine'], r['strategies'][:24],
+                         r.get('branching', 'scan')[:16],
+                         r['puzzles_per_sec'], r['p50_ms'], r['p99_ms'],
+                         r['nodes_per_puzzle'], r['backtracks_per_puzzle']),
+              file=out)
+        if r['unsolved']:
+            print('    {} puzzles unsolved'.format(r['unsolved']), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Sudoku engines.")
+    parser.add_argument('-c', '--corpora', nargs='+', default=sorted(CORPORA),
+                        choices=sorted(CORPORA), metavar='CORPUS',
+                        help="Corpora to run: %s" % ', '.join(sorted(CORPORA)))
+    parser.add_argument('-e', '--engines', nargs='+', default=list(ENGINES),
+                        choices=ENGINES, metavar='ENGINE',
+                        help="Engines to run: %s" % ', '.join(ENGINES))
+    parser.add_argument('-s', '--strategies', nargs='+', default=['none', 'all'],
+                        metavar='CONFIG',
+                        help="Strategy configurations: 'none', 'all' or a "
+                             "comma-separated list of strategy names")
+    parser.add_argument('-b', '--branching', nargs='+', default=['scan'],
+                        metavar='CONFIG',
+                        help="Branching heuristics for the mask engine: 'scan' "
+                             "or variable[:value], e.g. mrv_degree or dom_wdeg:lcv")
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+                        help="Solve every corpus this many times")
+    parser.add_argument('-o', '--output', help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    for config in args.strategies:
+        try:
+            Pipeline(parse_strategies(config))
+        except ValueError as err:
+            parser.error(str(err))
+    for config in args.branching:
+        try:
+            parse_branching(config)
+        except ValueError as err:
+            parser.error(str(err))
+
+    results = run(args.corpora, args.engines, args.strategies, args.repeat,
+                  args.branching)
+    show_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python'  : platform.python_version(),
+                       'machine' : platform.machine(),
+                       'repeat'  : args.repeat,
+                       'results' : results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
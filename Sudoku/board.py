@@ -1,10 +1,373 @@
-import numpy
+#!/usr/bin/env python3
+"""
+Bulk reading and writing of Sudoku puzzle files.
 
-class board(object):
-'''
-A Class for managing Sudoku board instances.
-'''
+Two formats are supported:
 
-    def __init__(self, fname):
+text:   one puzzle per line, digits with '.' or '0' for empty boxes (81
+        characters on a 9x9 board). Blank lines and lines starting with
+        '#' are skipped, and '\\r\\n' line ends are accepted.
+packed: a header (magic, format version, board size) followed by one
+        record per puzzle holding two boxes per byte, the first box in the
+        high nibble, 0 for empty. A 9x9 puzzle takes 41 bytes. Only boards
+        up to 9x9 fit in 4 bits per box.
 
- 
+BoardFile memory-maps a file and parses it with NumPy a window at a time
+straight into (N, boxes) uint8 arrays of digits (1..size, 0 for empty),
+so no Python string is created per box or even per puzzle unless grid
+strings are asked for. BoardWriter writes arrays or grid strings back in
+either format, and solve_file() streams a puzzle file through
+solution.solve_many() into a solution file.
+"""
+
+import argparse
+import mmap
+import struct
+
+import numpy as np
+
+import solution
+from variants import STANDARD, get_variant
+
+MAGIC       = b'SDKP'
+VERSION     = 1
+_HEADER     = struct.Struct('<4sHH')
+
+FORMATS = ('text', 'packed')
+
+# Puzzles per array yielded while streaming
+CHUNK_SIZE = 65536
+
+_NEWLINE, _RETURN, _COMMENT = ord('\n'), ord('\r'), ord('#')
+_BAD = 255
+
+
+def char_table(variant=STANDARD):
+    """Byte value to digit (1..size) lookup; 0 for '.' and '0', 255 if invalid."""
+    table = np.full(256, _BAD, dtype=np.uint8)
+    table[ord('.')] = table[ord('0')] = 0
+    for value, digit in enumerate(variant.digits, 1):
+        table[ord(digit)] = value
+    return table
+
+
+def digit_table(variant=STANDARD):
+    """Digit (0..size) to grid character lookup, '.' for 0."""
+    return np.frombuffer(('.' + variant.digits).encode('ascii'), dtype=np.uint8)
+
+
+def _record_size(variant):
+    return (len(variant.boxes) + 1) // 2
+
+
+def _check_packable(variant):
+    if variant.size > 15:
+        raise ValueError('The packed format holds boards up to 9x9, not %dx%d'
+                         % (variant.size, variant.size))
+
+
+def pack(boards):
+    """Pack an (N, boxes) array of digits into (N, record) nibble pairs."""
+    boards = np.asarray(boards, dtype=np.uint8)
+    if boards.shape[1] % 2:
+        boards = np.pad(boards, ((0, 0), (0, 1)))
+    return boards[:, 0::2] << 4 | boards[:, 1::2]
+
+
+def unpack(records, num_boxes):
+    """Unpack (N, record) nibble pairs into an (N, num_boxes) array of digits."""
+    boards = np.empty((len(records), 2 * records.shape[1]), dtype=np.uint8)
+    boards[:, 0::2] = records >> 4
+    boards[:, 1::2] = records & 0xF
+    return boards[:, :num_boxes]
+
+
+def array_to_grids(boards, variant=STANDARD):
+    """Convert an (N, boxes) array of digits into a list of grid strings."""
+    num_boxes = len(variant.boxes)
+    text = digit_table(variant)[boards].tobytes().decode('ascii')
+    return [text[i:i + num_boxes] for i in range(0, len(text), num_boxes)]
+
+
+class BoardFile(object):
+    ''' A read-only, memory-mapped file of Sudoku puzzles.
+
+    fname:   path of a text or packed puzzle file; the format is detected
+             from the packed header
+    variant: SudokuVariant giving the board size, 9x9 by default
+    format:  'text' or 'packed'
+
+    Use as a context manager, or call close() when done.
+    '''
+
+    def __init__(self, fname, variant=STANDARD):
+        self.variant = variant
+        self.num_boxes = len(variant.boxes)
+        self.file = open(fname, 'rb')
+        self.map = b''
+        self.data = self.records = None
+        try:
+            self._map_file()
+        except BaseException:
+            # Bad headers must not leak the file or the mapping
+            self.close()
+            raise
+        self._len = None
+
+    def _map_file(self):
+        """Map the file and check the header of a packed file."""
+        variant = self.variant
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self.map = b''
+        self.data = np.frombuffer(self.map, dtype=np.uint8)
+
+        if self.map[:len(MAGIC)] == MAGIC:
+            magic, version, size = _HEADER.unpack_from(self.map)
+            if version != VERSION:
+                raise ValueError('Not a version %d packed puzzle file' % VERSION)
+            if size != variant.size:
+                raise ValueError('Packed file holds %dx%d boards' % (size, size))
+            self.format = 'packed'
+            record = _record_size(variant)
+            if (len(self.data) - _HEADER.size) % record:
+                raise ValueError('Truncated packed puzzle file')
+            self.records = self.data[_HEADER.size:].reshape(-1, record)
+        else:
+            self.format = 'text'
+            self.table = char_table(variant)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.data = self.records = None
+        if isinstance(self.map, mmap.mmap):
+            try:
+                self.map.close()
+            except BufferError:
+                # A generator still holds a view; the mapping goes with it
+                pass
+        self.file.close()
+
+    def __len__(self):
+        """Number of puzzles in the file (one pass over a text file)."""
+        if self._len is None:
+            if self.format == 'packed':
+                self._len = len(self.records)
+            else:
+                self._len = sum(len(boards) for boards in self.arrays())
+        return self._len
+
+    def arrays(self, chunk_size=CHUNK_SIZE):
+        """Yield the puzzles as (n, boxes) uint8 arrays of at most chunk_size."""
+        if self.format == 'packed':
+            size = self.variant.size
+            for start in range(0, len(self.records), chunk_size):
+                boards = unpack(self.records[start:start + chunk_size], self.num_boxes)
+                if len(boards) and boards.max() > size:
+                    row = np.argmax((boards > size).any(axis=1))
+                    raise ValueError('Bad digit in packed puzzle %d' % (start + row))
+                yield boards
+            return
+
+        # Parse windows of whole lines, about chunk_size lines each
+        data = self.data
+        window = chunk_size * (self.num_boxes + 1)
+        start = 0
+        while start < len(data):
+            stop = min(start + window, len(data))
+            if stop < len(data):
+                newline = self.map.rfind(b'\n', start, stop)
+                if newline < 0:
+                    newline = self.map.find(b'\n', stop)
+                stop = len(data) if newline < 0 else newline + 1
+            boards = self._parse_lines(data[start:stop], start)
+            if len(boards):
+                yield boards
+            start = stop
+
+    def _parse_lines(self, chunk, offset):
+        """Parse a window of whole text lines into an array of digits."""
+        num_boxes = self.num_boxes
+        newlines = np.flatnonzero(chunk == _NEWLINE)
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.concatenate((newlines, [len(chunk)]))
+        has_return = (ends > starts) & (chunk[np.maximum(ends - 1, 0)] == _RETURN)
+        ends = ends - has_return
+        lengths = ends - starts
+
+        comment = np.zeros(len(starts), dtype=bool)
+        nonblank = lengths > 0
+        comment[nonblank] = chunk[starts[nonblank]] == _COMMENT
+        puzzle = nonblank & ~comment
+        bad = puzzle & (lengths != num_boxes)
+        if bad.any():
+            raise ValueError('Puzzle at byte %d is not %d characters long'
+                             % (offset + starts[np.argmax(bad)], num_boxes))
+
+        starts = starts[puzzle]
+        steps = np.diff(starts)
+        if len(steps) and (steps == steps[0]).all():
+            # Evenly spaced lines, as in any file without comments or blank
+            # lines: view them as rows instead of gathering every byte
+            lines = np.lib.stride_tricks.as_strided(
+                    chunk[starts[0]:], shape=(len(starts), num_boxes),
+                    strides=(steps[0], 1), writeable=False)
+        else:
+            lines = chunk[starts[:, None] + np.arange(num_boxes)]
+        boards = self.table[lines]
+        if (boards == _BAD).any():
+            row = np.argmax((boards == _BAD).any(axis=1))
+            raise ValueError('Bad character in the puzzle at byte %d'
+                             % (offset + starts[row]))
+        return boards
+
+    def array(self):
+        """Return every puzzle as one (N, boxes) uint8 array."""
+        boards = list(self.arrays())
+        if not boards:
+            return np.zeros((0, self.num_boxes), dtype=np.uint8)
+        return np.concatenate(boards)
+
+    def grids(self, chunk_size=CHUNK_SIZE):
+        """Yield the puzzles as grid strings, '.' for empty boxes."""
+        for boards in self.arrays(chunk_size):
+            yield from array_to_grids(boards, self.variant)
+
+
+class BoardWriter(object):
+    ''' Writes puzzles or solutions to a text or packed file.
+
+    fname:   path of the file to create
+    format:  'text' or 'packed'
+    variant: SudokuVariant giving the board size, 9x9 by default
+    '''
+
+    def __init__(self, fname, format='text', variant=STANDARD):
+        if format not in FORMATS:
+            raise ValueError('Unknown puzzle file format: %r' % format)
+        if format == 'packed':
+            _check_packable(variant)
+        self.format = format
+        self.variant = variant
+        self.table = char_table(variant)
+        self.digits = digit_table(variant)
+        self.file = open(fname, 'wb')
+        if format == 'packed':
+            self.file.write(_HEADER.pack(MAGIC, VERSION, variant.size))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def write(self, boards):
+        """Write an (N, boxes) array of digits, or a list of grid strings.
+
+        Grids may be False (as returned by solution.solve_many() for
+        puzzles without a solution), which are written as empty boards.
+        """
+        if not isinstance(boards, np.ndarray):
+            empty = '.' * len(self.variant.boxes)
+            text = ''.join([grid or empty for grid in boards])
+            boards = self.table[np.frombuffer(text.encode('ascii'), dtype=np.uint8)]
+            boards = boards.reshape(-1, len(self.variant.boxes))
+            if (boards == _BAD).any():
+                raise ValueError('Bad character in a grid')
+
+        if self.format == 'packed':
+            self.file.write(pack(boards).tobytes())
+        else:
+            lines = np.empty((len(boards), boards.shape[1] + 1), dtype=np.uint8)
+            lines[:, :-1] = self.digits[boards]
+            lines[:, -1] = _NEWLINE
+            self.file.write(lines.tobytes())
+
+
+def read_array(fname, variant=STANDARD):
+    """Read a whole puzzle file into an (N, boxes) uint8 array."""
+    with BoardFile(fname, variant) as boards:
+        return boards.array()
+
+
+def write_array(fname, boards, format='text', variant=STANDARD):
+    """Write an (N, boxes) array of digits to a puzzle file."""
+    with BoardWriter(fname, format, variant) as writer:
+        writer.write(boards)
+
+
+def solve_file(src, dst, format=None, variant=STANDARD, workers=None,
+               chunk_size=CHUNK_SIZE, strategies=()):
+    """Solve every puzzle of a file and write the solutions to another.
+
+    Puzzles are streamed from src into solution.solve_many() and the
+    solutions are written to dst in the order read, chunk_size at a time,
+    so files of any length run in bounded memory. Puzzles without a
+    solution are written as empty boards.
+
+    Args:
+        src, dst: paths of the puzzle and solution files
+        format: 'text' or 'packed' for dst; the format of src by default
+        variant: SudokuVariant to solve with, standard 9x9 by default
+        workers, strategies: passed on to solution.solve_many()
+    Returns:
+        (number of puzzles, number of puzzles without a solution)
+    """
+    total = unsolved = 0
+    with BoardFile(src, variant) as puzzles:
+        with BoardWriter(dst, format or puzzles.format, variant) as writer:
+            results = solution.solve_many(puzzles.grids(chunk_size), workers,
+                                          variant=variant, strategies=strategies)
+            batch = []
+            for grid in results:
+                batch.append(grid)
+                if len(batch) == chunk_size:
+                    writer.write(batch)
+                    total += len(batch)
+                    unsolved += batch.count(False)
+                    batch = []
+            writer.write(batch)
+            total += len(batch)
+            unsolved += batch.count(False)
+    return total, unsolved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert or solve Sudoku puzzle files.")
+    parser.add_argument('input', help="Text or packed puzzle file")
+    parser.add_argument('output', help="File to write")
+    parser.add_argument('-f', '--format', choices=FORMATS,
+                        help="Output format, the input's by default")
+    parser.add_argument('-s', '--solve', action='store_true',
+                        help="Write the solutions instead of the puzzles")
+    parser.add_argument('-v', '--variant', default='standard',
+                        help="Registered Sudoku variant, e.g. diagonal")
+    parser.add_argument('-w', '--workers', type=int,
+                        help="Worker processes used to solve")
+    args = parser.parse_args(argv)
+
+    variant = get_variant(args.variant)
+    if args.solve:
+        total, unsolved = solve_file(args.input, args.output, args.format,
+                                     variant, args.workers)
+        print("Solved {} of {} puzzles".format(total - unsolved, total))
+        return
+
+    with BoardFile(args.input, variant) as puzzles:
+        with BoardWriter(args.output, args.format or puzzles.format, variant) as writer:
+            for boards in puzzles.arrays():
+                writer.write(boards)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Branching heuristics for the bitmask search, chosen per solve.
+
+Without a Brancher, engine.search() branches on the first box with the
+fewest candidates and tries its digits from lowest to highest. A Brancher
+combines one heuristic for each of those two choices.
+
+Variable heuristics, picking the box to branch on:
+
+    mrv:        fewest candidates (minimum remaining values)
+    mrv_degree: fewest candidates, ties going to the box with the most
+                unsolved peers
+    dom_wdeg:   smallest ratio of candidates to weighted degree. Every
+                unit starts with weight 1, and a unit's weight grows by one
+                whenever propagation fails right after changing one of its
+                boxes, so search is drawn to the boxes that keep failing.
+
+Value heuristics, ordering the digits of that box:
+
+    order: lowest digit first
+    lcv:   least constraining value first, i.e. the digit that is still a
+           candidate in the fewest unsolved peers
+
+The candidate counts come from buckets, one set of boxes per count, that
+engine.BranchingBoard keeps up to date as masks shrink and are restored.
+Picking a box only looks at the first non-empty bucket instead of scanning
+the whole board; dom_wdeg, which needs every unsolved box, walks the
+buckets in order of count.
+
+A Brancher holds the state of the solve it is used for, so it serves one
+solve at a time; it is reset at the start of every solve.
+"""
+
+VARIABLE_HEURISTICS = ('mrv', 'mrv_degree', 'dom_wdeg')
+VALUE_HEURISTICS = ('order', 'lcv')
+
+
+def _bits(mask):
+    """The single-digit masks of mask, lowest digit first."""
+    bits = []
+    while mask:
+        bit = mask & -mask
+        bits.append(bit)
+        mask ^= bit
+    return bits
+
+
+class Brancher(object):
+    ''' A branching heuristic for engine.search() and related functions.
+
+    variable:  name from VARIABLE_HEURISTICS choosing the box
+    value:     name from VALUE_HEURISTICS ordering its digits
+    buckets:   buckets[n] is the set of boxes with n candidates
+    where:     the bucket of every box
+    weights:   dom_wdeg weight of every unit of the variant
+    conflicts: failed propagations seen by the current solve
+    '''
+
+    def __init__(self, variable='mrv_degree', value='order'):
+        if variable not in VARIABLE_HEURISTICS:
+            raise ValueError('Unknown variable heuristic: %r' % variable)
+        if value not in VALUE_HEURISTICS:
+            raise ValueError('Unknown value heuristic: %r' % value)
+        self.variable = variable
+        self.value = value
+        self.buckets = []
+        self.where = []
+        self.weights = []
+        self.conflicts = 0
+
+    @classmethod
+    def parse(cls, spec):
+        """Build a Brancher from 'variable' or 'variable:value'."""
+        variable, _, value = spec.partition(':')
+        return cls(variable, value or 'order')
+
+    def __repr__(self):
+        return 'Brancher(%r, %r)' % (self.variable, self.value)
+
+    def start(self, board):
+        """Sort the boxes of a new board into buckets and reset the weights."""
+        bit_count = board.bit_count
+        self.buckets = [set() for _ in range(board.width + 1)]
+        self.where = [bit_count[mask] for mask in board.masks]
+        for box, count in enumerate(self.where):
+            self.buckets[count].add(box)
+        self.weights = [1] * len(board.variant.units)
+        self.conflicts = 0
+
+    def conflict(self, board, box):
+        """Record a failed propagation whose last change was to box."""
+        self.conflicts += 1
+        weights = self.weights
+        for u in board.variant.box_units[box]:
+            weights[u] += 1
+
+    def branch(self, board):
+        """Return the box to branch on and its digits in the order to try.
+
+        The box is None if every box is solved or one has no candidates.
+        """
+        if self.buckets[0]:
+            return None, ()
+        if self.variable == 'dom_wdeg':
+            box = self._pick_dom_wdeg(board)
+        else:
+            box = self._pick_mrv(board)
+        if box is None:
+            return None, ()
+        if self.value == 'lcv':
+            return box, self._order_lcv(board, box)
+        return box, _bits(board.masks[box])
+
+    def _pick_mrv(self, board):
+        buckets = self.buckets
+        for count in range(2, len(buckets)):
+            bucket = buckets[count]
+            if not bucket:
+                continue
+            if self.variable == 'mrv' or len(bucket) == 1:
+                return next(iter(bucket))
+
+            # Degree: the box constraining the most unsolved peers
+            where = self.where
+            peers = board.variant.peers
+            best, best_degree = None, -1
+            for box in bucket:
+                degree = 0
+                for peer in peers[box]:
+                    if where[peer] > 1:
+                        degree += 1
+                if degree > best_degree:
+                    best, best_degree = box, degree
+            return best
+        return None
+
+    def _pick_dom_wdeg(self, board):
+        buckets = self.buckets
+        weights = self.weights
+        box_units = board.variant.box_units
+        best, best_score = None, None
+        for count in range(2, len(buckets)):
+            for box in buckets[count]:
+                wdeg = 0
+                for u in box_units[box]:
+                    wdeg += weights[u]
+                score = count / wdeg
+                if best_score is None or score < best_score:
+                    best, best_score = box, score
+        return best
+
+    def _order_lcv(self, board, box):
+        masks = board.masks
+        where = self.where
+        open_peers = [masks[peer] for peer in board.variant.peers[box]
+                      if where[peer] > 1]
+        ruled_out = []
+        for bit in _bits(masks[box]):
+            hits = 0
+            for mask in open_peers:
+                if mask & bit:
+                    hits += 1
+            ruled_out.append((hits, bit))
+        ruled_out.sort()
+        return [bit for _, bit in ruled_out]
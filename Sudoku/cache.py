@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+LRU cache of solved puzzles, keyed by a canonical form of the grid.
+
+Relabelling the digits, permuting bands or stacks, permuting rows within
+a band or columns within a stack and transposing the grid all turn one
+standard Sudoku into another with a correspondingly transformed
+solution. canonical_form() picks one representative of every such family,
+so a puzzle that is a transform of one solved before is answered from the
+cache by mapping the stored solution back through the inverse transform.
+
+The representative is the lexicographically smallest relabelled grid
+among the row and column orders that sort the bands, stacks, rows and
+columns by clue-count signatures, which are unchanged by all of the
+transforms. Only ties in those signatures have to be tried, up to
+MAX_ORDERINGS of them; grids with more ties than that (nearly empty or
+highly symmetric ones) still get a consistent key, but may miss some of
+their transforms in the cache.
+
+Variants with extra units (diagonals, windows, ...) are not preserved by
+the geometric transforms, so their puzzles are only canonicalized up to
+digit relabelling.
+"""
+
+from collections import OrderedDict, namedtuple
+from itertools import groupby, islice, permutations, product
+from math import isqrt
+from operator import itemgetter
+
+from variants import STANDARD
+
+# Largest number of row/column orderings tried per grid
+MAX_ORDERINGS = 64
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+_first = itemgetter(0)
+
+
+class Transform(object):
+    ''' A Sudoku symmetry taking a grid to its canonical form.
+
+    index:   for every box of the canonical grid, the box of the original
+             grid it comes from
+    relabel: {<original digit>: <canonical digit>}, covering every digit
+    '''
+
+    __slots__ = ('index', 'relabel')
+
+    def __init__(self, index, relabel):
+        self.index = index
+        self.relabel = relabel
+
+    def forward(self, grid):
+        """Map a grid of the original board to the canonical board."""
+        relabel = self.relabel
+        return ''.join([relabel.get(grid[src], grid[src]) for src in self.index])
+
+    def inverse(self, grid):
+        """Map a grid of the canonical board back to the original board."""
+        unlabel = {canonical : digit for digit, canonical in self.relabel.items()}
+        out = [''] * len(grid)
+        for c, src in zip(grid, self.index):
+            out[src] = unlabel.get(c, c)
+        return ''.join(out)
+
+
+def _groups(items, key):
+    """Sort items by key and split them into runs of equal keys."""
+    keyed = sorted([(key(item), item) for item in items], key=_first, reverse=True)
+    return [[item for _, item in run] for _, run in groupby(keyed, _first)]
+
+
+def _orderings(groups):
+    """Yield every concatenation of the groups with each group permuted."""
+    for choice in product(*[permutations(group) for group in groups]):
+        yield [item for part in choice for item in part]
+
+
+def _line_orders(clues, size, width):
+    """Yield the row orders that sort bands and rows by their signatures.
+
+    clues[r] is the set of columns holding a clue in row r. A row's
+    signature is its clue count plus the sorted clue counts of the columns
+    it has clues in; a band's is the sorted signatures of its rows.
+    """
+    col_count = [0] * size
+    for row in clues:
+        for c in row:
+            col_count[c] += 1
+    row_key = [(len(row), sorted(col_count[c] for c in row)) for row in clues]
+
+    bands = range(size // width)
+    band_key = lambda b: sorted(row_key[r] for r in range(b*width, (b+1)*width))
+    band_rows = [list(_orderings(_groups(range(b*width, (b+1)*width),
+                                         row_key.__getitem__)))
+                 for b in bands]
+
+    for band_order in _orderings(_groups(bands, band_key)):
+        for rows in product(*[band_rows[b] for b in band_order]):
+            yield [r for band in rows for r in band]
+
+
+_tables = {}
+
+
+def _box_tables(size):
+    """Box index at [row][column] of a board and of its transpose."""
+    tables = _tables.get(size)
+    if tables is None:
+        plain = [[r * size + c for c in range(size)] for r in range(size)]
+        tables = _tables[size] = (plain, [list(col) for col in zip(*plain)])
+    return tables
+
+
+def canonical_form(grid, variant=STANDARD):
+    """Return (canonical grid, Transform) for a grid string.
+
+    The canonical grid uses '.' for empty boxes and numbers the digits in
+    order of first appearance, so equivalent puzzles get equal strings.
+    """
+    char_to_mask = variant.char_to_mask
+    cells = ['.' if c in '.0' else c for c in grid if c in char_to_mask]
+    size = variant.size
+    assert len(cells) == size * size
+    width = isqrt(size)
+
+    if variant.extra_units:
+        views = [list(range(size * size))]
+    else:
+        views = []
+        for at in _box_tables(size):
+            row_clues = [{c for c in range(size) if cells[at[r][c]] != '.'}
+                         for r in range(size)]
+            col_clues = [{r for r in range(size) if cells[at[r][c]] != '.'}
+                         for c in range(size)]
+            col_orders = list(islice(_line_orders(col_clues, size, width),
+                                     MAX_ORDERINGS))
+            orders = ((rows, cols) for rows in _line_orders(row_clues, size, width)
+                                   for cols in col_orders)
+            views.extend([at[r][c] for r in rows for c in cols]
+                         for rows, cols in islice(orders, MAX_ORDERINGS))
+
+    digits = variant.digits
+    best = best_index = best_relabel = None
+    for index in views:
+        out = ''.join(itemgetter(*index)(cells))
+        # Number the digits in order of first appearance
+        found = sorted((out.find(d), d) for d in digits if d in out)
+        relabel = {d : digits[label] for label, (_, d) in enumerate(found)}
+        out = out.translate(str.maketrans(relabel))
+        if best is None or out < best:
+            best, best_index, best_relabel = out, index, relabel
+
+    # Digits missing from the grid take the remaining labels in order
+    unused = iter(d for d in digits if d not in best_relabel.values())
+    for d in digits:
+        if d not in best_relabel:
+            best_relabel[d] = next(unused)
+    return best, Transform(best_index, best_relabel)
+
+
+class SolutionCache(object):
+    ''' LRU cache of solutions keyed by (variant name, canonical grid).
+
+    maxsize:   number of puzzles kept; the least recently used one is
+               dropped beyond that. None keeps everything.
+    hits, misses, evictions:
+               lookup and eviction counters, also returned by info()
+
+    Unsolvable puzzles are cached too, as False.
+    '''
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def solve_grid(self, grid, variant, solver):
+        """Solve a grid string through the cache.
+
+        Args:
+            grid: Sudoku grid in string form, '.' or '0' for empty boxes
+            variant: SudokuVariant the grid is solved under
+            solver: function(grid) returning the solution of a grid string
+                as a grid string, or False; only called on a miss, with
+                the canonical grid
+        Returns:
+            The solution as a grid string, or False if there is none.
+        """
+        canonical, transform = canonical_form(grid, variant)
+        key = (variant.name, canonical)
+        entries = self.entries
+        try:
+            solved = entries[key]
+        except KeyError:
+            self.misses += 1
+            solved = solver(canonical)
+            entries[key] = solved
+            if self.maxsize is not None and len(entries) > self.maxsize:
+                entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            entries.move_to_end(key)
+
+        if solved is False:
+            return False
+        return transform.inverse(solved)
+
+    def info(self):
+        """Return the counters and size as a CacheInfo named tuple."""
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize,
+                         len(self.entries))
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Dancing-links (Algorithm X) exact-cover backend for the Sudoku solver.
+
+Sudoku is an exact-cover problem: every (box, digit) placement is a row
+of a 0/1 matrix, and the columns are the constraints it satisfies -- one
+column per box ("box is filled") and one per unit and digit ("digit
+appears in unit"). The standard 9x9 rules give 81 + 27*9 = 324 columns;
+every extra unit of a variant, such as a diagonal, adds 9 more.
+
+The matrix is built once per SudokuVariant as flat integer link arrays
+(Knuth's dancing links, with list indices instead of node objects) and
+copied for each solve, so a solve never allocates nodes. The search
+always branches on the column with the fewest remaining rows, which
+keeps the worst case predictable on puzzles that are adversarial for
+candidate-count heuristics.
+"""
+
+import engine
+
+# Bits of a placement used by the digit index (enough for 25x25 boards)
+_DIGIT_SHIFT = 5
+_DIGIT_MASK  = (1 << _DIGIT_SHIFT) - 1
+
+
+class ExactCover(object):
+    ''' The dancing-links matrix of a SudokuVariant.
+
+    Node 0 is the root, nodes 1..num_columns are column headers and the
+    remaining nodes are the 1s of the matrix, one row per (box, digit).
+    L, R, U, D: left/right/up/down links of every node
+    C:          the column header of every node
+    placement:  for every node, box << 5 | digit index of its row
+    size:       number of rows left in every column (headers only)
+    '''
+
+    def __init__(self, variant):
+        num_boxes = len(variant.box_units)
+        num_digits = variant.size
+        num_columns = num_boxes + len(variant.units) * num_digits
+
+        L = list(range(-1, num_columns))
+        R = list(range(1, num_columns + 2))
+        L[0], R[num_columns] = num_columns, 0
+        U = list(range(num_columns + 1))
+        D = list(range(num_columns + 1))
+        C = list(range(num_columns + 1))
+        placement = [-1] * (num_columns + 1)
+        size = [0] * (num_columns + 1)
+
+        # First node of the row of every (box, digit), for placing givens
+        self.row_start = []
+        for box in range(num_boxes):
+            starts = []
+            for digit in range(num_digits):
+                columns = [1 + box] + [1 + num_boxes + u * num_digits + digit
+                                       for u in variant.box_units[box]]
+                first = len(C)
+                starts.append(first)
+                for offset, col in enumerate(columns):
+                    node = first + offset
+                    # Vertical: append at the bottom of the column
+                    U.append(U[col])
+                    D.append(col)
+                    D[U[col]] = node
+                    U[col] = node
+                    # Horizontal: circular list within the row
+                    L.append(first + (offset - 1) % len(columns))
+                    R.append(first + (offset + 1) % len(columns))
+                    C.append(col)
+                    placement.append(box << _DIGIT_SHIFT | digit)
+                    size[col] += 1
+            self.row_start.append(tuple(starts))
+
+        self.links = (L, R, U, D)
+        self.C = C
+        self.placement = placement
+        self.size = size
+        self.num_boxes = num_boxes
+        self.bit_count = variant.bit_count
+
+    def solve(self, masks, stats=None):
+        """Find one solution consistent with the solved boxes of masks.
+
+        Only boxes with a single candidate are used as givens. If stats (an
+        engine.SearchStats) is given, every column branched on counts as a
+        node, every row taken back as a backtrack, and the deepest column
+        nesting is kept as max_depth.
+
+        Returns:
+            The solved list of masks, or False if there is no solution.
+        """
+        L, R, U, D = [list(links) for links in self.links]
+        S = list(self.size)
+        C = self.C
+        placement = self.placement
+
+        def cover(c):
+            R[L[c]] = R[c]
+            L[R[c]] = L[c]
+            i = D[c]
+            while i != c:
+                j = R[i]
+                while j != i:
+                    U[D[j]] = U[j]
+                    D[U[j]] = D[j]
+                    S[C[j]] -= 1
+                    j = R[j]
+                i = D[i]
+
+        def uncover(c):
+            i = U[c]
+            while i != c:
+                j = L[i]
+                while j != i:
+                    S[C[j]] += 1
+                    U[D[j]] = j
+                    D[U[j]] = j
+                    j = L[j]
+                i = U[i]
+            R[L[c]] = c
+            L[R[c]] = c
+
+        def search(chosen, depth):
+            if R[0] == 0:
+                return True
+
+            # Column with the fewest rows left
+            best = c = R[0]
+            best_size = S[c]
+            while c != 0 and best_size > 1:
+                if S[c] < best_size:
+                    best, best_size = c, S[c]
+                c = R[c]
+            if best_size == 0:
+                return False
+
+            if stats is not None:
+                stats.nodes += 1
+                if depth > stats.max_depth:
+                    stats.max_depth = depth
+            cover(best)
+            r = D[best]
+            while r != best:
+                chosen.append(r)
+                j = R[r]
+                while j != r:
+                    cover(C[j])
+                    j = R[j]
+                if search(chosen, depth + 1):
+                    return True
+                j = L[r]
+                while j != r:
+                    uncover(C[j])
+                    j = L[j]
+                chosen.pop()
+                if stats is not None:
+                    stats.backtracks += 1
+                r = D[r]
+            uncover(best)
+            return False
+
+        # Place the givens by covering every column of their rows. A given
+        # whose column is already gone conflicts with an earlier one.
+        covered = [False] * len(S)
+        chosen = []
+        bit_count = self.bit_count
+        for box in range(self.num_boxes):
+            mask = masks[box]
+            if bit_count[mask] != 1:
+                continue
+            r = self.row_start[box][mask.bit_length() - 1]
+            j = r
+            while True:
+                if covered[C[j]]:
+                    return False
+                covered[C[j]] = True
+                cover(C[j])
+                j = R[j]
+                if j == r:
+                    break
+            chosen.append(r)
+
+        if not search(chosen, 1):
+            return False
+
+        solved = [0] * self.num_boxes
+        for node in chosen:
+            solved[placement[node] >> _DIGIT_SHIFT] = 1 << (placement[node] & _DIGIT_MASK)
+        return solved
+
+
+_matrices = {}
+
+
+def matrix_for(variant):
+    """Return the ExactCover matrix of a variant, building it only once."""
+    matrix = _matrices.get(variant)
+    if matrix is None:
+        matrix = ExactCover(variant)
+        _matrices[variant] = matrix
+    return matrix
+
+
+def search(in_masks, variant, stats=None):
+    """Solve a list of masks with dancing links.
+
+    Returns:
+        The solved list of masks, or False if there is no solution.
+    """
+    return matrix_for(variant).solve(in_masks, stats)
+
+
+def solve_grid(grid, variant, stats=None):
+    """Solve a grid string with dancing links.
+
+    Returns:
+        The solution as a grid string, or False if there is no solution.
+    """
+    masks = search(engine.masks_from_grid(grid, variant), variant, stats)
+    if masks is False:
+        return False
+    return engine.grid_from_masks(masks, variant)
@@ -0,0 +1,723 @@
+#!/usr/bin/env python3
+"""
+Bitmask board engine for the Sudoku solver.
+
+A board is a flat list of integers, one per box, in the same row-major
+order as the variant's boxes ('A1', 'A2', ..., 'I9' on a 9x9 board). Bit
+d-1 of a box's mask is set while digit d is still a candidate for that
+box, so a solved box has exactly one bit set and a box with mask 0 means
+the board is inconsistent.
+
+Units, peers and the mask lookup tables come precompiled from a
+variants.SudokuVariant of any size (9x9, 16x16, 25x25), so propagation
+only does integer and/or operations and list indexing; no strings are
+built or searched until the final board is converted back to the
+dictionary form used by solution.py.
+"""
+
+from time import perf_counter
+
+from variants import STANDARD
+
+# The 9x9 tables, for callers working on standard-size boards
+NUM_BOXES   = len(STANDARD.boxes)
+ALL_DIGITS  = STANDARD.all_digits
+DIGITS      = STANDARD.digits
+
+# Lookup tables indexed by mask (0 .. 511)
+BIT_COUNT   = STANDARD.bit_count
+MASK_TO_STR = STANDARD.mask_to_str
+STR_TO_MASK = {d : 1 << index for index, d in enumerate(DIGITS)}
+
+# Grid characters: digits, plus '.' or '0' for an empty box
+CHAR_TO_MASK = STANDARD.char_to_mask
+
+
+def masks_from_grid(grid, variant=STANDARD):
+    """Convert a grid string straight into a list of masks.
+
+    Args:
+        grid: Sudoku grid in string form, '.' or '0' for empty boxes.
+        variant: SudokuVariant giving the board size, 9x9 by default.
+    Returns:
+        List of candidate masks, one per box.
+    """
+    char_to_mask = variant.char_to_mask
+    masks = [char_to_mask[c] for c in grid if c in char_to_mask]
+    assert len(masks) == len(variant.boxes)
+    return masks
+
+
+def mask_from_digits(digits, variant=STANDARD):
+    """Convert a string of candidate digits such as '237' into a mask."""
+    char_to_mask = variant.char_to_mask
+    mask = 0
+    for d in digits:
+        mask |= char_to_mask[d]
+    return mask
+
+
+def masks_from_values(values, boxes, variant=STANDARD):
+    """Convert a {<box>: <digits>} dictionary into a list of masks."""
+    return [mask_from_digits(values[box], variant) for box in boxes]
+
+
+def values_from_masks(masks, boxes, variant=STANDARD):
+    """Convert a list of masks back into the {<box>: <digits>} dictionary."""
+    mask_to_str = variant.mask_to_str
+    return dict(zip(boxes, [mask_to_str[mask] for mask in masks]))
+
+
+def grid_from_masks(masks, variant=STANDARD):
+    """Convert a solved list of masks into a grid string."""
+    mask_to_str = variant.mask_to_str
+    return ''.join([mask_to_str[mask] for mask in masks])
+
+
+class SearchStats(object):
+    ''' Search counters, accumulated over every solve they are passed to.
+
+    nodes:      search nodes that branched on a box
+    backtracks: guesses that were undone
+    max_depth:  deepest level of nested guesses reached
+    trace:      optional function trace(event, depth, box, mask) called by
+                the bitmask search on every 'guess' and 'backtrack'
+    '''
+
+    __slots__ = ('nodes', 'backtracks', 'max_depth', 'trace')
+
+    def __init__(self, trace=None):
+        self.trace = trace
+        self.reset()
+
+    def reset(self):
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+
+    def as_dict(self):
+        return {'nodes' : self.nodes, 'backtracks' : self.backtracks,
+                'max_depth' : self.max_depth}
+
+
+# Propagation phases timed and counted by SolverStats
+PHASES = ('eliminate', 'only_choice', 'naked_twins', 'strategies')
+
+
+class SolverStats(SearchStats):
+    ''' SearchStats plus a breakdown of the work done by propagation.
+
+    Passing a SolverStats to a solve runs it on an InstrumentedBoard; plain
+    SearchStats and no stats at all leave the uninstrumented board in place,
+    so the breakdown costs nothing unless it is asked for.
+
+    passes:     calls to propagate()
+    eliminated: {phase or strategy name: candidates removed}; the rules of
+                a strategies.Pipeline are counted under their own names
+    seconds:    {phase: time spent in it}, for the phases in PHASES
+    '''
+
+    __slots__ = ('passes', 'eliminated', 'seconds')
+
+    def reset(self):
+        SearchStats.reset(self)
+        self.passes = 0
+        self.eliminated = dict.fromkeys(PHASES[:3], 0)
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+
+    def as_dict(self):
+        report = SearchStats.as_dict(self)
+        report.update(passes=self.passes, eliminated=dict(self.eliminated),
+                      seconds=dict(self.seconds))
+        return report
+
+
+class Board(object):
+    ''' A board of candidate masks with queue-driven constraint propagation.
+
+    Instead of rescanning every box and unit until nothing changes, the
+    board keeps two work queues that are fed by every change of a mask:
+
+    pending: boxes that became solved and whose digit still has to be
+             removed from their peers
+    dirty:   units with at least one box that lost candidates since the
+             unit was last checked for only choices and naked twins
+
+    The number of solved boxes is kept up to date as masks change, and a
+    mask dropping to 0 stops propagation immediately. Once both queues are
+    empty, the board's strategies.Pipeline (if any) gets a chance to apply
+    more expensive rules, whose changes feed the queues again.
+
+    Every change is also logged on a trail as one int per change, packing
+    the box index above the variant.size bits of its previous mask. Search
+    works on a single board: it takes a mark() before a guess and undo()es
+    back to it on failure, so no board is ever copied and memory stays
+    bounded by the number of candidates (81*9 on a 9x9 board).
+    '''
+
+    __slots__ = ('variant', 'bit_count', 'width', 'masks', 'solved', 'pending',
+                 'dirty', 'is_dirty', 'trail', 'pipeline', 'stats', 'brancher')
+
+    def __init__(self, masks, variant):
+        self.variant = variant
+        self.bit_count = variant.bit_count
+        self.width = variant.size
+        self.masks = list(masks)
+        self.solved = 0
+        self.pending = []
+        self.dirty = []
+        self.is_dirty = [False] * len(variant.units)
+        self.trail = []
+        self.pipeline = None
+        self.stats = None
+        self.brancher = None
+
+    @classmethod
+    def from_masks(cls, masks, variant):
+        """Build a board with every solved box and every unit queued."""
+        board = cls(masks, variant)
+        bit_count = board.bit_count
+        board.pending = [box for box, mask in enumerate(board.masks)
+                         if bit_count[mask] == 1]
+        board.solved = len(board.pending)
+        board.dirty = list(range(len(variant.units)))
+        board.is_dirty = [True] * len(variant.units)
+        return board
+
+    def is_solved(self):
+        return self.solved == len(self.masks)
+
+    def mark(self):
+        """Return a trail position to undo() back to."""
+        return len(self.trail)
+
+    def undo(self, mark):
+        """Restore every mask changed since mark() returned mark."""
+        masks = self.masks
+        trail = self.trail
+        bit_count = self.bit_count
+        width = self.width
+        all_digits = self.variant.all_digits
+        for _ in range(len(trail) - mark):
+            entry = trail.pop()
+            box = entry >> width
+            if bit_count[masks[box]] == 1:
+                self.solved -= 1
+            masks[box] = entry & all_digits
+
+    def shrink(self, box, mask):
+        """Narrow the candidates of box down to mask, queueing the effects.
+
+        Returns:
+            False if box is left without candidates, True otherwise.
+        """
+        masks = self.masks
+        self.trail.append(box << self.width | masks[box])
+        masks[box] = mask
+        if not mask:
+            return False
+
+        if self.bit_count[mask] == 1:
+            self.solved += 1
+            self.pending.append(box)
+
+        is_dirty = self.is_dirty
+        for u in self.variant.box_units[box]:
+            if not is_dirty[u]:
+                is_dirty[u] = True
+                self.dirty.append(u)
+        return True
+
+    def propagate(self):
+        """Run eliminate, only choice and naked twins from the work queues.
+
+        Every phase is a method of its own, so subclasses can wrap them
+        (see InstrumentedBoard) without copying this loop.
+
+        Returns:
+            False if the board turned out to be inconsistent, True once both
+            queues are empty and the pipeline has nothing more to remove.
+        """
+        pending = self.pending
+        dirty = self.dirty
+        is_dirty = self.is_dirty
+        units = self.variant.units
+        pipeline = self.pipeline
+        eliminate = self._eliminate
+        only_choice = self._only_choice
+        naked_twins = self._naked_twins
+
+        while True:
+            if pending and not eliminate():
+                return self._fail()
+
+            if not dirty:
+                if pipeline is None:
+                    return True
+                removed = self._strategies()
+                if removed is None:
+                    return self._fail()
+                if not removed:
+                    return True
+                continue
+
+            u = dirty.pop()
+            is_dirty[u] = False
+            unit = units[u]
+            if not only_choice(unit) or not naked_twins(unit):
+                return self._fail()
+
+    def _eliminate(self):
+        """Remove the digit of every newly solved box from its peers."""
+        masks = self.masks
+        pending = self.pending
+        peers = self.variant.peers
+        shrink = self.shrink
+        while pending:
+            box = pending.pop()
+            digit = masks[box]
+            keep = ~digit
+            for peer in peers[box]:
+                mask = masks[peer]
+                if mask & digit and not shrink(peer, mask & keep):
+                    return False
+        return True
+
+    def _only_choice(self, unit):
+        """Solve the boxes of unit holding a digit that fits nowhere else."""
+        masks = self.masks
+        once = twice = 0
+        for box in unit:
+            mask = masks[box]
+            twice |= once & mask
+            once |= mask
+        if once != self.variant.all_digits:
+            return False
+
+        only = once & ~twice
+        if only:
+            bit_count = self.bit_count
+            for box in unit:
+                mask = masks[box]
+                hit = mask & only
+                if hit and hit != mask:
+                    if bit_count[hit] > 1:
+                        return False
+                    self.shrink(box, hit)
+        return True
+
+    def _naked_twins(self, unit):
+        """Clear the digits of every naked pair of unit from its other boxes."""
+        masks = self.masks
+        bit_count = self.bit_count
+        for index, box in enumerate(unit):
+            pair = masks[box]
+            if bit_count[pair] != 2:
+                continue
+            for other in unit[index + 1:]:
+                if masks[other] == pair:
+                    keep = ~pair
+                    for target in unit:
+                        mask = masks[target]
+                        if mask != pair and mask & pair:
+                            if not self.shrink(target, mask & keep):
+                                return False
+                    break
+        return True
+
+    def _strategies(self):
+        """Apply the pipeline once; see strategies.Pipeline.apply()."""
+        return self.pipeline.apply(self)
+
+    def _fail(self):
+        # Leave empty queues behind so the board can be reused
+        for u in self.dirty:
+            self.is_dirty[u] = False
+        del self.dirty[:]
+        del self.pending[:]
+        return False
+
+
+class RecordingBoard(Board):
+    ''' A Board that reports every mask change to a recorder.
+
+    Changes made by propagation and the restores made by undo() are both
+    reported, so the recorder can rebuild the board at any step. Plain
+    Boards carry no recording code at all.
+    '''
+
+    __slots__ = ('recorder',)
+
+    def shrink(self, box, mask):
+        self.recorder.record(box, mask)
+        return super().shrink(box, mask)
+
+    def undo(self, mark):
+        record = self.recorder.record
+        width = self.width
+        all_digits = self.variant.all_digits
+        for index in range(len(self.trail) - 1, mark - 1, -1):
+            entry = self.trail[index]
+            record(entry >> width, entry & all_digits)
+        super().undo(mark)
+
+
+class InstrumentedBoard(Board):
+    ''' A Board whose propagate() fills in the breakdown of a SolverStats.
+
+    Each phase method of Board is wrapped to time it and to count the
+    candidates it removed, read off the trail entries it added.
+    '''
+
+    __slots__ = ()
+
+    def propagate(self):
+        self.stats.passes += 1
+        return super().propagate()
+
+    def _count(self, phase, mark, start):
+        stats = self.stats
+        stats.seconds[phase] += perf_counter() - start
+        masks = self.masks
+        bit_count = self.bit_count
+        width = self.width
+        all_digits = self.variant.all_digits
+        # The first entry of a box holds its mask before the phase
+        before = {}
+        for entry in self.trail[mark:]:
+            before.setdefault(entry >> width, entry & all_digits)
+        stats.eliminated[phase] += sum(bit_count[mask] - bit_count[masks[box]]
+                                       for box, mask in before.items())
+
+    def _eliminate(self):
+        mark, start = len(self.trail), perf_counter()
+        ok = super()._eliminate()
+        self._count('eliminate', mark, start)
+        return ok
+
+    def _only_choice(self, unit):
+        mark, start = len(self.trail), perf_counter()
+        ok = super()._only_choice(unit)
+        self._count('only_choice', mark, start)
+        return ok
+
+    def _naked_twins(self, unit):
+        mark, start = len(self.trail), perf_counter()
+        ok = super()._naked_twins(unit)
+        self._count('naked_twins', mark, start)
+        return ok
+
+    def _strategies(self):
+        # The pipeline counts removals per rule itself
+        start = perf_counter()
+        pipeline = self.pipeline
+        eliminated = self.stats.eliminated
+        before = list(pipeline.eliminated)
+        removed = super()._strategies()
+        for name, old, new in zip(pipeline.names, before, pipeline.eliminated):
+            if new != old:
+                eliminated[name] = eliminated.get(name, 0) + new - old
+        self.stats.seconds['strategies'] += perf_counter() - start
+        return removed
+
+
+class BranchingBoard(Board):
+    ''' A Board that keeps the candidate-count buckets of a Brancher.
+
+    Every box sits in brancher.buckets[<number of candidates>]; shrink()
+    and undo() move the boxes they change to their new bucket, and a
+    failed propagate() tells the brancher about the conflict.
+    '''
+
+    __slots__ = ()
+
+    def shrink(self, box, mask):
+        ok = super().shrink(box, mask)
+        brancher = self.brancher
+        count = self.bit_count[mask]
+        old = brancher.where[box]
+        if count != old:
+            buckets = brancher.buckets
+            buckets[old].discard(box)
+            buckets[count].add(box)
+            brancher.where[box] = count
+        return ok
+
+    def undo(self, mark):
+        width = self.width
+        changed = {entry >> width for entry in self.trail[mark:]}
+        super().undo(mark)
+        masks = self.masks
+        bit_count = self.bit_count
+        buckets = self.brancher.buckets
+        where = self.brancher.where
+        for box in changed:
+            count = bit_count[masks[box]]
+            if count != where[box]:
+                buckets[where[box]].discard(box)
+                buckets[count].add(box)
+                where[box] = count
+
+    def propagate(self):
+        if super().propagate():
+            return True
+        if self.trail:
+            self.brancher.conflict(self, self.trail[-1] >> self.width)
+        return False
+
+
+_board_classes = {}
+
+
+def _board_class(recording, instrumented, branching):
+    """Return the Board subclass combining the requested features."""
+    key = (recording, instrumented, branching)
+    cls = _board_classes.get(key)
+    if cls is None:
+        bases = tuple(base for base, wanted in ((BranchingBoard, branching),
+                                                (InstrumentedBoard, instrumented),
+                                                (RecordingBoard, recording))
+                      if wanted)
+        if not bases:
+            cls = Board
+        elif len(bases) == 1:
+            cls = bases[0]
+        else:
+            cls = type(''.join(base.__name__[:-5] for base in bases) + 'Board',
+                       bases, {'__slots__' : ()})
+        _board_classes[key] = cls
+    return cls
+
+
+def _new_board(masks, variant, recorder=None, pipeline=None, stats=None,
+               brancher=None):
+    cls = _board_class(recorder is not None, isinstance(stats, SolverStats),
+                       brancher is not None)
+    board = cls.from_masks(masks, variant)
+    if recorder is not None:
+        board.recorder = recorder
+        recorder.start(board.masks)
+    board.pipeline = pipeline
+    board.stats = stats
+    if brancher is not None:
+        board.brancher = brancher
+        brancher.start(board)
+    return board
+
+
+def reduce_puzzle(in_masks, variant, recorder=None, pipeline=None, stats=None):
+    """Propagate eliminate, only choice and naked twins to a fixed point.
+
+    Args:
+        in_masks: list of candidate masks, one per box (not modified)
+        variant:  SudokuVariant with the rules being solved
+        recorder: optional recorder.AssignmentRecorder for the changes
+        pipeline: optional strategies.Pipeline of extra rules
+        stats:    optional SolverStats for the propagation breakdown
+    Returns:
+        The reduced list of masks, or False if the board is inconsistent.
+    """
+    board = _new_board(in_masks, variant, recorder, pipeline, stats)
+    if not board.propagate():
+        return False
+    return board.masks
+
+
+def _pick_box(board):
+    """Return the unfinished box with the fewest candidates, or None."""
+    bit_count = board.bit_count
+    min_box = None
+    min_count = board.width + 1
+    for box, mask in enumerate(board.masks):
+        count = bit_count[mask]
+        if 1 < count < min_count:
+            min_box, min_count = box, count
+            if count == 2:
+                break
+    return min_box
+
+
+def _branch(board):
+    """Return the box to branch on and its candidates in the order to try.
+
+    Uses the board's Brancher if it has one, otherwise the first box with
+    the fewest candidates and its digits from lowest to highest. The box is
+    None if no unfinished box is left.
+    """
+    if board.brancher is not None:
+        return board.brancher.branch(board)
+    box = _pick_box(board)
+    if box is None:
+        return None, ()
+    guesses = []
+    remaining = board.masks[box]
+    while remaining:
+        guess = remaining & -remaining
+        guesses.append(guess)
+        remaining ^= guess
+    return box, guesses
+
+
+def _node(stats, depth):
+    """Count a search node at depth; return the trace function, if any."""
+    stats.nodes += 1
+    if depth > stats.max_depth:
+        stats.max_depth = depth
+    return stats.trace
+
+
+def _search(board, depth=1):
+    if board.is_solved():
+        return True
+
+    # Not solved and nothing to branch on: a box was empty from the start
+    min_box, guesses = _branch(board)
+    if min_box is None:
+        return False
+
+    stats = board.stats
+    trace = None if stats is None else _node(stats, depth)
+
+    # Try each candidate on the same board, rolling back failed guesses
+    mark = board.mark()
+    for guess in guesses:
+        if trace is not None:
+            trace('guess', depth, min_box, guess)
+
+        if board.shrink(min_box, guess) and board.propagate() and _search(board, depth + 1):
+            return True
+        board.undo(mark)
+        if stats is not None:
+            stats.backtracks += 1
+            if trace is not None:
+                trace('backtrack', depth, min_box, guess)
+
+    return False
+
+
+def _count(board, limit, depth=1):
+    if board.is_solved():
+        return 1
+
+    min_box, guesses = _branch(board)
+    if min_box is None:
+        return 0
+
+    stats = board.stats
+    trace = None if stats is None else _node(stats, depth)
+
+    found = 0
+    mark = board.mark()
+    for guess in guesses:
+        if found >= limit:
+            break
+        if trace is not None:
+            trace('guess', depth, min_box, guess)
+
+        if board.shrink(min_box, guess) and board.propagate():
+            found += _count(board, limit - found, depth + 1)
+        board.undo(mark)
+        if stats is not None:
+            stats.backtracks += 1
+            if trace is not None:
+                trace('backtrack', depth, min_box, guess)
+
+    return found
+
+
+def _iter(board, depth=1):
+    if board.is_solved():
+        yield list(board.masks)
+        return
+
+    min_box, guesses = _branch(board)
+    if min_box is None:
+        return
+
+    stats = board.stats
+    trace = None if stats is None else _node(stats, depth)
+
+    mark = board.mark()
+    for guess in guesses:
+        if trace is not None:
+            trace('guess', depth, min_box, guess)
+
+        if board.shrink(min_box, guess) and board.propagate():
+            yield from _iter(board, depth + 1)
+        board.undo(mark)
+        if stats is not None:
+            stats.backtracks += 1
+            if trace is not None:
+                trace('backtrack', depth, min_box, guess)
+
+
+def search(in_masks, variant, recorder=None, pipeline=None, stats=None,
+           brancher=None):
+    """Depth-first search with propagation on a list of masks.
+
+    Args:
+        in_masks: list of candidate masks, one per box (not modified)
+        variant:  SudokuVariant with the rules being solved
+        recorder: optional recorder.AssignmentRecorder for the changes
+        pipeline: optional strategies.Pipeline of extra rules
+        stats:    optional SearchStats to count nodes and backtracks in, or
+                  a SolverStats to also break down the propagation
+        brancher: optional branching.Brancher choosing the box to branch on
+                  and the order of its digits
+    Returns:
+        The solved list of masks, or False if there is no solution.
+    """
+    board = _new_board(in_masks, variant, recorder, pipeline, stats, brancher)
+    if not (board.propagate() and _search(board)):
+        return False
+    return board.masks
+
+
+def solve_grid(grid, variant, pipeline=None, stats=None, brancher=None):
+    """Solve a grid string, 81 characters long on a 9x9 board.
+
+    Returns:
+        The solution as a grid string, or False if there is no solution.
+    """
+    masks = search(masks_from_grid(grid, variant), variant, pipeline=pipeline,
+                   stats=stats, brancher=brancher)
+    if masks is False:
+        return False
+    return grid_from_masks(masks, variant)
+
+
+def count_solutions(in_masks, variant, limit=2, pipeline=None, stats=None,
+                    brancher=None):
+    """Count the solutions of a board, stopping once limit are found.
+
+    Args:
+        in_masks: list of candidate masks, one per box (not modified)
+        variant:  SudokuVariant with the rules being solved
+        limit:    stop counting at this many solutions; None counts all
+        pipeline: optional strategies.Pipeline of extra rules
+        stats:    optional SearchStats to count nodes and backtracks in, or
+                  a SolverStats to also break down the propagation
+        brancher: optional branching.Brancher for the search order
+    Returns:
+        The number of solutions found, at most limit.
+    """
+    if limit is None:
+        limit = float('inf')
+
+    board = _new_board(in_masks, variant, pipeline=pipeline, stats=stats,
+                       brancher=brancher)
+    if limit < 1 or not board.propagate():
+        return 0
+    return _count(board, limit)
+
+
+def iter_solutions(in_masks, variant, pipeline=None, stats=None, brancher=None):
+    """Yield every solution of a board as a list of masks, one at a time.
+
+    Only the current search path is kept in memory; each solution is
+    copied out when it is yielded.
+    """
+    board = _new_board(in_masks, variant, pipeline=pipeline, stats=stats,
+                       brancher=brancher)
+    if board.propagate():
+        yield from _iter(board)
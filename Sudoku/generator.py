@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Generate Sudoku puzzles with a unique solution and rate their difficulty.
+
+A puzzle starts from a random full grid (a few random givens, propagated
+and then completed by search) and has its clues removed in random order,
+by default in 180-degree symmetric pairs. A removal is kept only if the
+puzzle still has exactly one solution. Instead of counting solutions up
+to 2, each removal searches for a solution that differs from the full
+grid in one of the boxes just cleared; that search stops at the first
+solution it finds, and usually fails fast in propagation.
+
+Puzzles are rated by what it takes to solve them:
+
+    easy:    eliminate, only choice and naked twins alone
+    medium:  also locked candidates or hidden pairs
+    hard:    also naked or hidden triples, naked quads or X-Wing
+    expert:  search, with at most EXTREME_NODES search nodes
+    extreme: search with more nodes than that
+
+generate_many() spreads the work over worker processes, like
+solution.solve_many(). Run as a script, the module reports the puzzles
+per minute it produced at every level:
+
+    python generator.py -n 200 -l hard -o hard.txt
+"""
+
+import argparse
+import os
+import random
+import sys
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import engine
+from solution import LARGE_BOARD_STRATEGIES
+from strategies import Pipeline, ALL_STRATEGIES
+from variants import STANDARD
+
+LEVELS = ('easy', 'medium', 'hard', 'expert', 'extreme')
+
+# Level of the puzzles each strategy is needed for; rules registered
+# later count as 'hard'
+STRATEGY_LEVELS = {
+    'locked_candidates' : 'medium',
+    'hidden_pairs'      : 'medium',
+    'naked_triples'     : 'hard',
+    'hidden_triples'    : 'hard',
+    'x_wing'            : 'hard',
+    'naked_quads'       : 'hard',
+}
+
+# Most search nodes an 'expert' puzzle may take
+EXTREME_NODES = 3
+
+# strategies: rules that removed candidates before search (or before the
+#             puzzle was solved), cheapest first
+# nodes:      search nodes needed with every strategy on, 0 without search
+Rating = namedtuple('Rating', ['level', 'strategies', 'nodes'])
+
+
+def _search_pipeline(variant):
+    """The pipeline used for searches, as solution.solve() picks it."""
+    return Pipeline(LARGE_BOARD_STRATEGIES) if variant.size > 9 else None
+
+
+def _is_solved(masks, variant):
+    bit_count = variant.bit_count
+    return all(bit_count[mask] == 1 for mask in masks)
+
+
+def random_solution(variant=STANDARD, rng=random):
+    """Return a random full grid of a variant as a list of masks.
+
+    variant.size + 2 random boxes get a random remaining candidate, with
+    propagation after each, and search fills in the rest. Rare dead ends
+    start over.
+    """
+    num_boxes = len(variant.boxes)
+    digit_bits = variant.digit_bits
+    pipeline = _search_pipeline(variant)
+    while True:
+        masks = [variant.all_digits] * num_boxes
+        for box in rng.sample(range(num_boxes), variant.size + 2):
+            mask = masks[box]
+            masks[box] = rng.choice([bit for bit in digit_bits if mask & bit])
+            masks = engine.reduce_puzzle(masks, variant, pipeline=pipeline)
+            if masks is False:
+                break
+        else:
+            solved = engine.search(masks, variant, pipeline=pipeline)
+            if solved is not False:
+                return solved
+
+
+def _has_other_solution(puzzle, full, group, variant, pipeline):
+    """True if puzzle has a solution other than full differing in group.
+
+    Any such solution differs from full at some first box of group, so one
+    search per box, with the earlier boxes of group held at their digits in
+    full and the box itself barred from its digit, finds it.
+    """
+    masks = list(puzzle)
+    all_digits = variant.all_digits
+    for box in group:
+        masks[box] = all_digits & ~full[box]
+        if engine.search(masks, variant, pipeline=pipeline) is not False:
+            return True
+        masks[box] = full[box]
+    return False
+
+
+def make_puzzle(full, variant=STANDARD, rng=random, symmetric=True):
+    """Remove clues from a full grid while its solution stays unique.
+
+    Args:
+        full: list of solved masks, e.g. from random_solution()
+        variant: SudokuVariant the puzzle is unique under
+        rng: random.Random (or the random module) choosing the order
+        symmetric: remove boxes in pairs symmetric about the center
+    Returns:
+        The puzzle as a grid string, '.' for empty boxes.
+    """
+    num_boxes = len(full)
+    all_digits = variant.all_digits
+    pipeline = _search_pipeline(variant)
+    puzzle = list(full)
+    order = list(range(num_boxes))
+    rng.shuffle(order)
+    tried = [False] * num_boxes
+
+    for box in order:
+        if tried[box]:
+            continue
+        mirror = num_boxes - 1 - box
+        group = (box, mirror) if symmetric and mirror != box else (box,)
+        for b in group:
+            tried[b] = True
+            puzzle[b] = all_digits
+        if _has_other_solution(puzzle, full, group, variant, pipeline):
+            for b in group:
+                puzzle[b] = full[b]
+
+    bit_count = variant.bit_count
+    mask_to_str = variant.mask_to_str
+    return ''.join([mask_to_str[mask] if bit_count[mask] == 1 else '.'
+                    for mask in puzzle])
+
+
+def rate(grid, variant=STANDARD):
+    """Rate the difficulty of a puzzle, see the module docstring.
+
+    Returns:
+        A Rating; raises ValueError if the puzzle has no solution.
+    """
+    masks = engine.masks_from_grid(grid, variant)
+    reduced = engine.reduce_puzzle(masks, variant)
+    if reduced is False:
+        raise ValueError('Sudoku puzzle has no solution')
+    if _is_solved(reduced, variant):
+        return Rating('easy', (), 0)
+
+    pipeline = Pipeline(ALL_STRATEGIES)
+    reduced = engine.reduce_puzzle(masks, variant, pipeline=pipeline)
+    if reduced is False:
+        raise ValueError('Sudoku puzzle has no solution')
+    used = tuple(name for name, removed in zip(pipeline.names, pipeline.eliminated)
+                 if removed)
+    if _is_solved(reduced, variant):
+        level = max((STRATEGY_LEVELS.get(name, 'hard') for name in used),
+                    key=LEVELS.index, default='easy')
+        return Rating(level, used, 0)
+
+    stats = engine.SearchStats()
+    if engine.search(reduced, variant, pipeline=pipeline, stats=stats) is False:
+        raise ValueError('Sudoku puzzle has no solution')
+    level = 'extreme' if stats.nodes > EXTREME_NODES else 'expert'
+    return Rating(level, used, stats.nodes)
+
+
+def generate(level=None, variant=STANDARD, rng=random, symmetric=True):
+    """Generate one rated puzzle.
+
+    Args:
+        level: one of LEVELS to keep generating until a puzzle of that
+            level comes up, or None to take the first puzzle
+        variant, rng, symmetric: see make_puzzle()
+    Returns:
+        (grid, Rating) of the puzzle.
+    """
+    if level is not None and level not in LEVELS:
+        raise ValueError('Unknown Sudoku level: %r' % level)
+    while True:
+        grid = make_puzzle(random_solution(variant, rng), variant, rng, symmetric)
+        rating = rate(grid, variant)
+        if level is None or rating.level == level:
+            return grid, rating
+
+
+def _generate_chunk(seed, count, level, variant, symmetric):
+    """Worker for generate_many: generate count puzzles from one seed."""
+    rng = random.Random(seed)
+    return [generate(level, variant, rng, symmetric) for _ in range(count)]
+
+
+def generate_many(count, level=None, workers=None, variant=STANDARD, seed=None,
+                  symmetric=True, chunksize=4):
+    """
+    Generate count rated puzzles on a pool of worker processes.
+
+    Every chunk of chunksize puzzles is generated from its own seed, drawn
+    from seed, and results come back in chunk order, so a given seed
+    yields the same puzzles whatever the number of workers.
+
+    Args:
+        count(int): number of puzzles to generate.
+        level(string): only keep puzzles of this level, see generate().
+        workers(int): number of worker processes, default os.cpu_count().
+            With workers=1 everything runs in the calling process.
+        variant(SudokuVariant): the rules the puzzles are unique under.
+        seed: seed of the random generator, None for a random one.
+        symmetric(bool): remove clues in symmetric pairs.
+        chunksize(int): number of puzzles generated per worker task.
+    Yields:
+        (grid, Rating) pairs.
+    """
+    if level is not None and level not in LEVELS:
+        raise ValueError('Unknown Sudoku level: %r' % level)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    seeds = random.Random(seed)
+    tasks = ((seeds.getrandbits(64), min(chunksize, count - start))
+             for start in range(0, count, chunksize))
+
+    if workers == 1:
+        for chunk_seed, size in tasks:
+            yield from _generate_chunk(chunk_seed, size, level, variant, symmetric)
+        return
+
+    max_pending = 2*workers
+    pool = ProcessPoolExecutor(workers)
+    try:
+        pending = deque()
+        for chunk_seed, size in tasks:
+            pending.append(pool.submit(_generate_chunk, chunk_seed, size, level,
+                                       variant, symmetric))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def show_summary(ratings, seconds, out=sys.stdout):
+    """Print puzzles, puzzles/minute and mean search nodes per level."""
+    counts = Counter(rating.level for rating in ratings)
+    nodes = Counter()
+    for rating in ratings:
+        nodes[rating.level] += rating.nodes
+    minutes = seconds / 60
+    print('{:<8} {:>8} {:>12} {:>8}'.format('level', 'puzzles', 'puzzles/min',
+                                            'nodes'), file=out)
+    for level in LEVELS:
+        if counts[level]:
+            print('{:<8} {:>8} {:>12.1f} {:>8.1f}'.format(
+                    level, counts[level], counts[level] / minutes if minutes else 0.0,
+                    nodes[level] / counts[level]), file=out)
+    print('{:<8} {:>8} {:>12.1f}'.format('total', len(ratings),
+                                         len(ratings) / minutes if minutes else 0.0),
+          file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate rated Sudoku puzzles.")
+    parser.add_argument('-n', '--count', type=int, default=100,
+                        help="Number of puzzles to generate")
+    parser.add_argument('-l', '--level', choices=LEVELS,
+                        help="Only keep puzzles of this level")
+    parser.add_argument('-w', '--workers', type=int,
+                        help="Worker processes, default one per core")
+    parser.add_argument('-s', '--seed', type=int, help="Random seed")
+    parser.add_argument('--asymmetric', action='store_true',
+                        help="Remove clues one at a time instead of in symmetric pairs")
+    parser.add_argument('-o', '--output',
+                        help="Write the puzzles to this file, one per line")
+    args = parser.parse_args(argv)
+
+    start = perf_counter()
+    puzzles = list(generate_many(args.count, args.level, args.workers, seed=args.seed,
+                                 symmetric=not args.asymmetric))
+    seconds = perf_counter() - start
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            for grid, rating in puzzles:
+                print(grid, file=f)
+    show_summary([rating for _, rating in puzzles], seconds)
+
+
+if __name__ == '__main__':
+    main()
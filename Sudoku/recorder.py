@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Opt-in recording of the board changes made during a solve.
+
+Instead of a copy of the whole board per assignment, a recorder keeps the
+initial masks plus one compact delta per change: the box index packed
+above the box's new 9-bit mask. Deltas go into a ring buffer of bounded
+length and/or are streamed to a binary file, and any intermediate board
+can be rebuilt from them for visualization. Recordings are of 9x9 boards
+only.
+"""
+
+import struct
+from collections import deque
+
+import engine
+from variants import boxes
+
+# Stream layout: magic, format version, number of boxes, the initial
+# masks, then one little-endian uint16 delta per change.
+MAGIC       = b'SDKR'
+VERSION     = 1
+_HEADER     = struct.Struct('<4sHH')
+_DELTA      = struct.Struct('<H')
+
+
+class AssignmentRecorder(object):
+    ''' Records the (box index, new mask) deltas of one solve.
+
+    maxlen: number of deltas kept in memory. When the ring buffer is full
+            the oldest delta is folded into the base board, so the boards
+            that are still covered can always be rebuilt. None keeps
+            everything, 0 keeps nothing in memory.
+    stream: optional binary file object every delta is also written to;
+            read it back with AssignmentRecorder.replay().
+    '''
+
+    def __init__(self, maxlen=65536, stream=None):
+        self.maxlen = maxlen
+        self.stream = stream
+        self.base = None
+        self.deltas = deque()
+        self.dropped = 0
+
+    def start(self, masks):
+        """Begin a recording from the initial list of masks."""
+        if len(masks) != engine.NUM_BOXES:
+            raise ValueError('AssignmentRecorder only records 9x9 boards')
+        self.base = list(masks)
+        self.deltas.clear()
+        self.dropped = 0
+        if self.stream is not None:
+            self.stream.write(_HEADER.pack(MAGIC, VERSION, len(masks)))
+            self.stream.write(struct.pack('<%dH' % len(masks), *masks))
+
+    def record(self, box, mask):
+        """Record that box now has candidate mask."""
+        delta = box << 9 | mask
+        if self.stream is not None:
+            self.stream.write(_DELTA.pack(delta))
+
+        if self.maxlen is not None and len(self.deltas) >= self.maxlen:
+            # Fold the oldest delta into the base board
+            self.dropped += 1
+            if not self.deltas:
+                self.base[box] = mask
+                return
+            old = self.deltas.popleft()
+            self.base[old >> 9] = old & engine.ALL_DIGITS
+        self.deltas.append(delta)
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def boards(self):
+        """Yield the list of masks after each delta still in memory.
+
+        The same list is updated in place between steps; copy it to keep it.
+        """
+        masks = list(self.base)
+        for delta in self.deltas:
+            masks[delta >> 9] = delta & engine.ALL_DIGITS
+            yield masks
+
+    def board(self, step):
+        """Rebuild the list of masks after the first step deltas in memory."""
+        masks = list(self.base)
+        for index, delta in enumerate(self.deltas):
+            if index == step:
+                break
+            masks[delta >> 9] = delta & engine.ALL_DIGITS
+        return masks
+
+    def assignments(self):
+        """Yield a dictionary board for each delta that fixed a box.
+
+        This is the sequence the old module-level 'assignments' list used
+        to hold, and is what visualize_assignments() expects.
+        """
+        for masks, delta in zip(self.boards(), self.deltas):
+            if engine.BIT_COUNT[delta & engine.ALL_DIGITS] == 1:
+                yield engine.values_from_masks(masks, boxes)
+
+    @staticmethod
+    def replay(fp):
+        """Yield the list of masks after every delta of a streamed recording.
+
+        The first board yielded is the initial one. As with boards(), the
+        same list is updated in place between steps.
+        """
+        magic, version, num_boxes = _HEADER.unpack(fp.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a version %d Sudoku recording' % VERSION)
+
+        masks = list(struct.unpack('<%dH' % num_boxes, fp.read(2*num_boxes)))
+        yield masks
+        while True:
+            chunk = fp.read(_DELTA.size * 4096)
+            if not chunk:
+                return
+            for (delta,) in _DELTA.iter_unpack(chunk):
+                masks[delta >> 9] = delta & engine.ALL_DIGITS
+                yield masks
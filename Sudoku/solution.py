@@ -1,95 +1,107 @@
 #!/usr/bin/env python3
 
-assignments = []
-
-
-def cross(a, b):
-    return [s+t for s in a for t in b]
-
-
-rows = 'ABCDEFGHI'
-cols = '123456789'
-
-boxes = cross(rows, cols)
-
-# Standard Sudoku
-row_units    = [cross(r, cols) for r in rows]
-column_units = [cross(rows, c) for c in cols]
-square_units = [cross(rs, cs) for rs in ('ABC','DEF','GHI') for cs in ('123','456','789')]
-
-
-
-# build standard Sudoku peers
+import itertools
+import os
+from math import isqrt
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import dlx
+# Under another name, as solve() takes an engine= keyword
+import engine as mask_engine
+from recorder import AssignmentRecorder
+from strategies import Pipeline
+from variants import (cross, rows, cols, boxes, row_units, column_units,
+                      square_units, diagonal_units, STANDARD, DIAGONAL)
+
+# Standard Sudoku units and peers, kept for the dictionary helpers below.
+# These are never modified; other rule sets are passed in as a SudokuVariant.
 unitlist = row_units + column_units + square_units
 units = dict((s, [u for u in unitlist if s in u]) for s in boxes)
 peers = dict((s, set(sum(units[s],[]))-set([s])) for s in boxes)
 
+box_index = {box : index for index, box in enumerate(boxes)}
+
+# Rules solve() runs by default on boards larger than 9x9, where search
+# without them goes exponentially deep
+LARGE_BOARD_STRATEGIES = ('locked_candidates',)
 
 
-def display(values):
+
+def display(values, variant=STANDARD):
     """
     Display the values as a 2-D grid.
-    Input: The sudoku in dictionary form
+    Input: The sudoku in dictionary form, and the SudokuVariant giving the
+           board size (9x9 by default)
     Output: None
     """
-    width = 1+max(len(values[s]) for s in boxes)
-    line = '+'.join(['-'*(width*3)]*3)
-    for r in rows:
-        print(''.join(values[r+c].center(width)+('|' if c in '36' else '')
-                      for c in cols))
-        if r in 'CF': print(line)
+    size = variant.size
+    square = isqrt(size)
+    width = 1+max(len(values[s]) for s in variant.boxes)
+    line = '+'.join(['-'*(width*square)]*square)
+    for r in range(size):
+        row = variant.boxes[r*size:(r+1)*size]
+        print(''.join(values[box].center(width)+('|' if c % square == square-1 and c < size-1 else '')
+                      for c, box in enumerate(row)))
+        if r % square == square-1 and r < size-1: print(line)
     return
 
 
 # WARNING! We've modified this function to return '123456789' instead of '.' for boxes with no value.
 # Look at the explanation above in the text.
-def grid_values(grid):
+def grid_values(grid, variant=STANDARD):
     """Convert grid string into {<box>: <value>} dict with '123456789' value for empties.
 
     Args:
-        grid: Sudoku grid in string form, 81 characters long
+        grid: Sudoku grid in string form, 81 characters long (256 for 16x16,
+            625 for 25x25, with digits past 9 written as letters)
+        variant: SudokuVariant giving the board size, 9x9 by default
     Returns:
         Sudoku grid in dictionary form:
         - keys: Box labels, e.g. 'A1'
         - values: Value in corresponding box, e.g. '8', or '123456789' if it is empty.
     """
     values = []
-    all_digits = '123456789'
+    all_digits = variant.digits
     for c in grid:
         if c == '.':
             values.append(all_digits)
         elif c in all_digits:
             values.append(c)
-    assert len(values) == 81
-    return dict(zip(boxes, values))
+    assert len(values) == len(variant.boxes)
+    return dict(zip(variant.boxes, values))
 
 
-def is_valid_solution(grid_dict):
+def is_valid_solution(grid_dict, variant=STANDARD):
     """ Check a grid dictionary to see if represents a valid
     solution to Sudoku. 
     The constarainst must be valid, i.e. the peers of every box
     must contain values distinct from the said box.
     
-    Applicable to both standard and diagonal sudoku.
+    Applicable to any SudokuVariant; standard rules by default.
     
     """
     
     # Check no conflicts with peers
-    for cur_box in boxes:
-        if grid_dict[cur_box] in peers[cur_box]:
+    peer_labels = variant.peer_labels
+    for cur_box in variant.boxes:
+        if any(grid_dict[cur_box] == grid_dict[peer]
+               for peer in peer_labels[cur_box]):
             return False
         
     # Check no unfinished boxes
-    for cur_box in boxes:
-        if len(grid_dict[cur_box]) > 1:
+    for cur_box in variant.boxes:
+        if len(grid_dict[cur_box]) != 1:
             return False
         
-    # Check each digit appears exactly 9 times
-    hist = {str(digit) : 0 for digit in range(1, 10)}
-    for cur_box in boxes:
+    # Check each digit appears exactly once per row, i.e. size times
+    hist = {digit : 0 for digit in variant.digits}
+    for cur_box in variant.boxes:
+        if grid_dict[cur_box] not in hist:
+            return False
         hist[grid_dict[cur_box]] += 1
     vals = hist.values()
-    if max(vals) != 9 and min(vals) !=9:
+    if max(vals) != variant.size or min(vals) != variant.size:
         return False
         
     # All checks passed ...    
@@ -119,7 +131,7 @@ def eliminate_new(values):
 
 
 
-def eliminate(values):
+def eliminate(values, variant=STANDARD):
     """Eliminate values from peers of each box with a single value.
 
     Go through all the boxes, and whenever there is a box with a single value,
@@ -127,13 +139,15 @@ def eliminate(values):
 
     Args:
         values: Sudoku in dictionary form.
+        variant: SudokuVariant defining the peers, standard by default.
     Returns:
         Resulting Sudoku in dictionary form after eliminating values.
     """
     
+    peers = variant.peer_labels
     new_dict = values.copy()
     
-    for cur_box in boxes:
+    for cur_box in variant.boxes:
        
         if len(values[cur_box]) == 1:
             # Loop over all peers, eliminate values[cur_box]
@@ -145,17 +159,18 @@ def eliminate(values):
                     
     return new_dict
 
-def only_choice(values):
+def only_choice(values, variant=STANDARD):
     """Finalize all values that are the only choice for a unit.
 
     Go through all the units, and whenever there is a unit with a value
     that only fits in one box, assign the value to this box.
 
-    Input: Sudoku in dictionary form.
+    Input: Sudoku in dictionary form, and the SudokuVariant whose units
+           are checked (standard by default).
     Output: Resulting Sudoku in dictionary form after filling in only choices.
     """
-    for unit in unitlist:
-        for digit in '123456789':
+    for unit in variant.unitlist:
+        for digit in variant.digits:
             dplaces = [box for box in unit if digit in values[box]]
             if len(dplaces) == 1:
                 assign_value(values, dplaces[0], digit)
@@ -204,120 +219,88 @@ def only_choice_old(values):
 
 
 
-def reduce_puzzle(in_values):
-    # Defensive copy first
-    values = in_values.copy()
-    stalled = False
-    
-    while not stalled:
-        # Check how many boxes have a determined value
-        solved_values_before = len([box for box in values.keys() if len(values[box]) == 1])
-
-        # Apply all heuristics
-        values = eliminate(values)
-        values = only_choice(values)
-        values = naked_twins(values)
-        
-        # Check how many boxes have a determined value, to compare
-        solved_values_after = len([box for box in values.keys() if len(values[box]) == 1])
-        
-        stalled = solved_values_before == solved_values_after
-        
-        # Sanity check, return False if there is a box with zero available values:
-        if len([box for box in values.keys() if len(values[box]) == 0]):
-            return False
-        
-        
-    # No more progress   
-    return values
+def reduce_puzzle(in_values, variant=STANDARD, recorder=None, pipeline=None,
+                  stats=None):
+    """Repeatedly apply eliminate, only_choice and naked_twins until stalled.
 
+    The work is done by the bitmask engine; the board is converted to masks
+    once on the way in and back to a dictionary on the way out.
 
+    Args:
+        in_values: Sudoku in dictionary form (not modified).
+        variant: SudokuVariant with the rules to apply, standard by default.
+        recorder: optional AssignmentRecorder to log the changes to.
+        pipeline: optional strategies.Pipeline of extra rules to apply.
+        stats: optional engine.SolverStats to count the propagation passes,
+            eliminations and time per phase in.
+    Returns:
+        The reduced Sudoku in dictionary form, or False if a box is left
+        with no available values.
+    """
+    masks = mask_engine.reduce_puzzle(
+            mask_engine.masks_from_values(in_values, variant.boxes, variant),
+            variant, recorder, pipeline, stats)
+    if masks is False:
+        return False
 
+    return mask_engine.values_from_masks(masks, variant.boxes, variant)
 
 
 
-def search(in_values):
+def search(in_values, variant=STANDARD, recorder=None, pipeline=None, stats=None,
+           brancher=None):
     "Using depth-first search and propagation, create a search tree and solve the sudoku."
-    # First, reduce the puzzle using the previous function    
-    # Choose one of the unfilled squares with the fewest possibilities    
-    # Now use recursion to solve each one of the resulting sudokus, and if one returns a value (not False), return that answer!
-
-   
-    # Are we done?
-    # If so, there are no more unfinished boxes, and we can return
-    num_unfinished_boxes = len([box for box in in_values.keys() 
-                                            if len(in_values[box]) > 1])
-    
-    if num_unfinished_boxes == 0:
-        return in_values
-    
-    # OK, not done. 
-    
-    # Reduce the board as much as possible
-    # If a bad board results, return to the previous
-    # point in the recursion
-    values = reduce_puzzle(in_values)
-    if values == False:
+    # The bitmask engine does the reduction and the recursion over the
+    # box with the fewest possibilities; see engine.search
+    masks = mask_engine.search(
+            mask_engine.masks_from_values(in_values, variant.boxes, variant),
+            variant, recorder, pipeline, stats, brancher)
+    if masks is False:
         return False
-    
-    # Find the box with the smallest number of possibilities (but greater>1)
-    # Recurse through the possibilities of this box
-    len_list = [ (box, len(values[box])) for box in values.keys() 
-                                         if len(values[box]) > 1 ]
-    
-    # It's possible the reduction has actually solved the puzzle.
-    # In that case, len_list is empty and we are done
-    if len(len_list) < 1:
-        return values
-    
-    # Non-empty list of candidates to expand
-    # Choose the one with the smallest number of digits
-    min_element = min(len_list, key=lambda x : x[1])
-    min_box = min_element[0]
-    
-    # Recurse through possible values of this box
-    for guess_value in values[min_box]:
-        guess_board = values.copy()
-        guess_board[min_box] = guess_value
-        
-        res = search(guess_board)
-        if not res:
-            continue
-
-        num_unfinished_boxes = len([box for box in res.keys() 
-                                            if len(res[box]) > 1])
-        if num_unfinished_boxes == 0:
-            return res
-    
+
+    return mask_engine.values_from_masks(masks, variant.boxes, variant)
 
 
 
 
 
 
-def assign_value(values, box, value):
+def _search_dlx(values, variant, stats=None):
+    """Solve a board in dictionary form with the dancing-links backend."""
+    masks = dlx.search(mask_engine.masks_from_values(values, variant.boxes, variant),
+                       variant, stats)
+    if masks is False:
+        return False
+
+    return mask_engine.values_from_masks(masks, variant.boxes, variant)
+
+
+
+def assign_value(values, box, value, recorder=None):
     """
     Please use this function to update your values dictionary!
-    Assigns a value to a given box. If it updates the board record it.
+    Assigns a value to a given box. If it updates the board and a recorder
+    (see recorder.AssignmentRecorder) is given, record it as a compact delta.
     """
 
-    # Don't waste memory appending actions that don't actually change any values
+    # Don't waste memory recording actions that don't actually change any values
     if values[box] == value:
         return values
 
     values[box] = value
-    if len(value) == 1:
-        assignments.append(values.copy())
+    if recorder is not None:
+        recorder.record(box_index[box], mask_engine.mask_from_digits(value))
     return values
 
 
 
 
 
-def naked_twins(in_values):
+def naked_twins(in_values, variant=STANDARD):
     """Eliminate values using the naked twins strategy.
     Args:
         values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        variant: SudokuVariant defining the peers, standard by default.
 
     Returns:
         the values dictionary with the naked twins eliminated from peers.
@@ -325,11 +308,12 @@ def naked_twins(in_values):
 
     # Defensive copy
     values = in_values.copy()
+    peers = variant.peer_labels
     
     
     # Reduce the number of searches in naked_twins double loop by
     # focusing only on entries with two values
-    pair_values = [cur_box for cur_box in boxes if len(values[cur_box]) == 2]
+    pair_values = [cur_box for cur_box in variant.boxes if len(values[cur_box]) == 2]
     
     
     # NB: The double loop will create "double" the number twins with 
@@ -364,68 +348,200 @@ def naked_twins(in_values):
     return values
     
 
-def solve_standard_sudoku(grid):
+def solve_standard_sudoku(grid, recorder=None, pipeline=None, engine='mask',
+                          cache=None, stats=None, brancher=None):
     """
-    Find the solution to a standard Sudoku grid, i.e. one with diagonal constraints.
+    Find the solution to a standard Sudoku grid, i.e. one without diagonal constraints.
     Args:
         grid(string): a string representing a sudoku grid.
             Example: '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
+        recorder(AssignmentRecorder): optional, records every board change.
+        pipeline(Pipeline): optional extra propagation rules, see solve().
+        engine(string): 'mask' or 'dlx', see solve().
+        cache(SolutionCache): optional solution cache, see solve().
+        stats(SearchStats): optional search counters, see solve().
+        brancher(Brancher): optional branching heuristic, see solve().
     Returns:
         The dictionary representation of the final sudoku grid. False if no solution exists.
     """
-    
-    # build standard Sudoku peers
-    # Override globals in case diagonal Sudoku had been previously run.
-    global unitlist 
-    unitlist = row_units + column_units + square_units
-    global units 
-    units = dict((s, [u for u in unitlist if s in u]) for s in boxes)
-    global peers 
-    peers = dict((s, set(sum(units[s],[]))-set([s])) for s in boxes)
-    
-    return search(grid_values(grid))
+    return solve(grid, STANDARD, recorder, pipeline, engine, cache, stats, brancher)
      
 
     
 
-def solve(grid):
+def solve(grid, variant=DIAGONAL, recorder=None, pipeline=None, engine='mask',
+          cache=None, stats=None, brancher=None):
     """
     Find the solution to a diagonal Sudoku grid.
     Args:
         grid(string): a string representing a sudoku grid.
             Example: '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
+        variant(SudokuVariant): the rules to solve with. Diagonal Sudoku by
+            default, i.e. both main diagonals are units too. Its size sets
+            the board size, e.g. variants.STANDARD16 for 16x16 grids.
+        recorder(AssignmentRecorder): optional, records every board change
+            so intermediate boards can be rebuilt for visualization.
+        pipeline(Pipeline): optional extra propagation rules (hidden
+            subsets, locked candidates, X-Wing, ...) tried whenever
+            eliminate/only_choice/naked_twins stall. Its counters report
+            how many candidates each rule removed. Boards larger than 9x9
+            get a Pipeline(LARGE_BOARD_STRATEGIES) unless one is given.
+        engine(string): 'mask' (default) for propagation and depth-first
+            search on the bitmask board, or 'dlx' for the dancing-links
+            exact-cover solver. recorder, pipeline and brancher only apply
+            to 'mask'.
+        cache(SolutionCache): optional cache.SolutionCache to look the grid
+            up in first, by its canonical form; only misses are solved.
+            Cannot be combined with a recorder.
+        stats(SearchStats): optional engine.SearchStats counting search
+            nodes, backtracks and depth, or engine.SolverStats to also
+            break the propagation down by phase and strategy (mask engine
+            only). Cache hits are not searched, so they add nothing.
+        brancher(Brancher): optional branching.Brancher choosing the box
+            to branch on and the order of its digits (mask engine only).
     Returns:
         The dictionary representation of the final sudoku grid. False if no solution exists.
     """
     
-    # Since the Sudoku rules for this solve include diagona constraints, 
-    # those must be added to the basic (global) variables.
-    # This is manifested as additional peers for diagonal elements.
-    # Specifically, each element of the diagonals has all the diagonal
-    # entries as peers.
-    
-    # Diagonals
-    back_slash   = [rows[index]+cs for index, cs in enumerate(cols) ]
-    forw_slash   = [rows[8-index]+cs for index, cs in enumerate(cols)]
-    global unitlist
-    #print('Unitlist:', unitlist)
-    #print('back_slash:', back_slash)
-    #print('forw_slash:', forw_slash)
-    
-    # Append to the global unitlist to include the diaginals
-    
-    unitlist.append(back_slash)
-    unitlist.append(forw_slash)
-    #print('final Unitlist:', unitlist)
-    #exit()
-    
-    global units
-    units = dict((s, [u for u in unitlist if s in u]) for s in boxes)
-    
-    global peers
-    peers = dict((s, set(sum(units[s],[]))-set([s])) for s in boxes)
-    
-    return search(grid_values(grid))
+    if cache is not None:
+        if recorder is not None:
+            raise ValueError('A recorder cannot be used with a cache')
+        solved = cache.solve_grid(grid, variant, lambda canonical: _solve_to_grid(
+                canonical, variant, pipeline, engine, stats, brancher))
+        if solved is False:
+            return False
+        return dict(zip(variant.boxes, solved))
+
+    # The variant is compiled once (see variants.py), so nothing is
+    # rebuilt per call and no global state is touched.
+    values = grid_values(grid, variant)
+    if engine == 'dlx':
+        if recorder is not None or pipeline is not None or brancher is not None:
+            raise ValueError("recorder, pipeline and brancher need engine='mask'")
+        return _search_dlx(values, variant, stats)
+    if engine != 'mask':
+        raise ValueError('Unknown Sudoku engine: %r' % engine)
+    if pipeline is None and variant.size > 9:
+        pipeline = Pipeline(LARGE_BOARD_STRATEGIES)
+    return search(values, variant, recorder, pipeline, stats, brancher)
+
+
+def _solve_to_grid(grid, variant, pipeline, engine, stats=None, brancher=None):
+    """solve() a grid, returning the solution as a grid string or False."""
+    values = solve(grid, variant, pipeline=pipeline, engine=engine, stats=stats,
+                   brancher=brancher)
+    if values is False:
+        return False
+    return ''.join(values[box] for box in variant.boxes)
+
+
+def count_solutions(grid, limit=2, variant=DIAGONAL, pipeline=None, brancher=None):
+    """
+    Count the solutions of a Sudoku grid, stopping as soon as limit are found.
+    With the default limit of 2 this is a uniqueness check: 0 means no
+    solution, 1 a unique solution and 2 more than one.
+    Args:
+        grid(string): a string representing a sudoku grid.
+        limit(int): upper bound on the count, None to count them all.
+        variant(SudokuVariant): the rules to solve with, diagonal by default.
+        pipeline(Pipeline): optional extra propagation rules.
+        brancher(Brancher): optional branching heuristic for the search.
+    Returns:
+        The number of solutions found, at most limit.
+    """
+    return mask_engine.count_solutions(mask_engine.masks_from_grid(grid, variant),
+                                       variant, limit, pipeline, brancher=brancher)
+
+
+def iter_solutions(grid, variant=DIAGONAL, pipeline=None, brancher=None):
+    """
+    Generate all solutions of a Sudoku grid, lazily and in search order.
+    Args:
+        grid(string): a string representing a sudoku grid.
+        variant(SudokuVariant): the rules to solve with, diagonal by default.
+        pipeline(Pipeline): optional extra propagation rules.
+        brancher(Brancher): optional branching heuristic for the search.
+    Yields:
+        The dictionary representation of each solution.
+    """
+    for masks in mask_engine.iter_solutions(mask_engine.masks_from_grid(grid, variant),
+                                            variant, pipeline, brancher=brancher):
+        yield mask_engine.values_from_masks(masks, variant.boxes, variant)
+
+
+def _solve_chunk(grids, variant, strategies):
+    """Worker for solve_many: solve a list of grid strings."""
+    pipeline = Pipeline(strategies) if strategies else None
+    return [mask_engine.solve_grid(grid, variant, pipeline) for grid in grids]
+
+
+def solve_many(grids, workers=None, chunksize=256, ordered=True, variant=DIAGONAL,
+               strategies=()):
+    """
+    Solve a stream of Sudoku grids on a pool of worker processes.
+
+    Grids are read lazily from the input in chunks of chunksize, and at most
+    two chunks per worker are in flight at a time, so arbitrarily long
+    inputs (e.g. the lines of a puzzle file) run in bounded memory.
+
+    Args:
+        grids(iterable): 81-character grid strings, '.' or '0' for empties.
+        workers(int): number of worker processes, default os.cpu_count().
+            With workers=1 everything runs in the calling process.
+        chunksize(int): number of grids sent to a worker at a time.
+        ordered(bool): if True, results come back in input order. If False,
+            (index, result) pairs are yielded as soon as each chunk is done.
+        variant(SudokuVariant): the rules to solve with, diagonal by
+            default like solve().
+        strategies(tuple): names of extra propagation rules (see
+            strategies.STRATEGIES) each worker runs in a Pipeline.
+    Yields:
+        Solutions as 81-character grid strings, False for grids with no
+        solution.
+    """
+    grid_iter = iter(grids)
+    chunks = iter(lambda: list(itertools.islice(grid_iter, chunksize)), [])
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1:
+        start = 0
+        for chunk in chunks:
+            for index, res in enumerate(_solve_chunk(chunk, variant, strategies), start):
+                yield res if ordered else (index, res)
+            start += len(chunk)
+        return
+
+    max_pending = 2*workers
+    pool = ProcessPoolExecutor(workers)
+    try:
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_solve_chunk, chunk, variant, strategies))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            # Map each pending future to the input index of its first grid
+            pending = {}
+            start = 0
+            for chunk in chunks:
+                pending[pool.submit(_solve_chunk, chunk, variant, strategies)] = start
+                start += len(chunk)
+                while len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from enumerate(future.result(), pending.pop(future))
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from enumerate(future.result(), pending.pop(future))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
 
 if __name__ == '__main__':
     diag_sudoku_grid = '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
@@ -434,13 +550,14 @@ if __name__ == '__main__':
     display(solve_standard_sudoku(diag_sudoku_grid))
     
     print('\n\ndiagonal sudoku:\n\n')
-    display(solve(diag_sudoku_grid))
+    recorder = AssignmentRecorder()
+    display(solve(diag_sudoku_grid, recorder=recorder))
 
    
 '''
     try:
         from visualize import visualize_assignments
-        visualize_assignments(assignments)
+        visualize_assignments(list(recorder.assignments()))
 
     except SystemExit:
         pass
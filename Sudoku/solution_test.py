@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
+import io
+import engine
+import recorder
 import solution
+import variants
 import unittest
 
 
@@ -96,6 +100,171 @@ class TestDiagonalSudoku(unittest.TestCase):
     def test_solve(self):
         self.assertEqual(solution.solve(self.diagonal_grid), self.solved_diag_sudoku)
 
+class TestBitmaskEngine(unittest.TestCase):
+    diagonal_grid = TestDiagonalSudoku.diagonal_grid
+
+    def test_mask_round_trip(self):
+        values = solution.grid_values(self.diagonal_grid)
+        masks = engine.masks_from_values(values, solution.boxes)
+        self.assertEqual(masks, engine.masks_from_grid(self.diagonal_grid))
+        self.assertEqual(engine.values_from_masks(masks, solution.boxes), values)
+
+    def test_reduce_detects_contradiction(self):
+        # Two 2s in the first row
+        values = solution.grid_values('22' + '.' * 79)
+        self.assertFalse(solution.reduce_puzzle(values))
+
+    def test_undo_restores_board(self):
+        grid = '4.......3..9.........1...7.....1.8.....5.9.....1.2.....3...5.........7..7.......8'
+        board = engine.Board.from_masks(engine.masks_from_grid(grid),
+                                        solution.STANDARD)
+        self.assertTrue(board.propagate())
+        masks, solved = list(board.masks), board.solved
+
+        mark = board.mark()
+        box = next(box for box, mask in enumerate(masks)
+                   if engine.BIT_COUNT[mask] > 1)
+        board.shrink(box, masks[box] & -masks[box])
+        board.propagate()
+        self.assertGreater(board.solved, solved)
+
+        board.undo(mark)
+        self.assertEqual(board.masks, masks)
+        self.assertEqual(board.solved, solved)
+
+
+class TestVariants(unittest.TestCase):
+
+    def test_variants_are_cached(self):
+        self.assertIs(variants.register_variant('diagonal', variants.diagonal_units),
+                      solution.DIAGONAL)
+        self.assertIs(variants.get_variant('windoku'), variants.WINDOKU)
+        with self.assertRaises(ValueError):
+            variants.register_variant('diagonal', variants.window_units)
+
+    def test_variants_are_immutable(self):
+        with self.assertRaises(AttributeError):
+            solution.DIAGONAL.units = ()
+
+    def test_solve_leaves_globals_alone(self):
+        unitlist = list(solution.unitlist)
+        solution.solve(TestDiagonalSudoku.diagonal_grid)
+        solution.solve(TestDiagonalSudoku.diagonal_grid)
+        self.assertEqual(solution.unitlist, unitlist)
+        self.assertEqual(len(solution.DIAGONAL.units), 29)
+
+    def test_windoku(self):
+        res = solution.solve('.' * 81, variants.WINDOKU)
+        self.assertTrue(solution.is_valid_solution(res, variants.WINDOKU))
+
+
+class TestLargeBoards(unittest.TestCase):
+    grid16 = ('.2.45.78..BCD.F....8D.F.12.4..BC...C1.....F.5678......BC5..81...'
+              '2413.9A.E...G..7.B...41..D.7.39......B.F..A1.......637...G.9B1..'
+              '..82......G..C....4.BF..3..A..........D26..F..8.6.5...G..C......'
+              '....C35..7..FDG.A3.7...9C.6.E..........AG.D.....G..5...E..9.....')
+
+    def test_tables(self):
+        variant = variants.STANDARD16
+        self.assertEqual(len(variant.boxes), 256)
+        self.assertEqual(variant.boxes[16], 'B1')
+        self.assertEqual(variant.digits, '123456789ABCDEFG')
+        self.assertEqual(len(variant.units), 48)
+        self.assertEqual(len(variant.peers[0]), 15 + 15 + 9)
+        self.assertEqual(variant.bit_count[0xFFFF], 16)
+        self.assertEqual(variants.STANDARD25.bit_count[(1 << 25) - 1], 25)
+        self.assertEqual(variants.STANDARD25.mask_to_str[1 << 24], 'P')
+        with self.assertRaises(ValueError):
+            variants.register_variant('twelve', size=12)
+
+    def test_solve_16(self):
+        variant = variants.STANDARD16
+        for engine_name in ('mask', 'dlx'):
+            res = solution.solve(self.grid16, variant, engine=engine_name)
+            self.assertTrue(solution.is_valid_solution(res, variant))
+            for box, c in zip(variant.boxes, self.grid16):
+                if c != '.':
+                    self.assertEqual(res[box], c)
+
+    def test_solve_25(self):
+        variant = variants.register_variant(
+                'diagonal25', variants.diagonals(25), size=25)
+        res = solution.solve('.' * 625, variant)
+        self.assertTrue(solution.is_valid_solution(res, variant))
+        self.assertFalse(solution.is_valid_solution(res, variants.STANDARD16))
+
+    def test_recorder_is_9x9_only(self):
+        with self.assertRaises(ValueError):
+            solution.solve(self.grid16, variants.STANDARD16,
+                           recorder=recorder.AssignmentRecorder())
+
+
+class TestAssignmentRecorder(unittest.TestCase):
+    grid = '4.......3..9.........1...7.....1.8.....5.9.....1.2.....3...5.........7..7.......8'
+
+    def test_rebuild_final_board(self):
+        rec = recorder.AssignmentRecorder(maxlen=None)
+        res = solution.solve_standard_sudoku(self.grid, recorder=rec)
+        self.assertEqual(rec.dropped, 0)
+        self.assertEqual(rec.board(len(rec)),
+                         engine.masks_from_values(res, solution.boxes))
+        self.assertEqual(list(rec.assignments())[-1], res)
+
+    def test_ring_buffer_is_bounded(self):
+        full = recorder.AssignmentRecorder(maxlen=None)
+        solution.solve_standard_sudoku(self.grid, recorder=full)
+
+        ring = recorder.AssignmentRecorder(maxlen=100)
+        solution.solve_standard_sudoku(self.grid, recorder=ring)
+        self.assertEqual(len(ring), 100)
+        self.assertEqual(ring.dropped, len(full) - 100)
+        self.assertEqual(ring.board(40), full.board(len(full) - 60))
+
+    def test_stream_replay(self):
+        stream = io.BytesIO()
+        rec = recorder.AssignmentRecorder(maxlen=0, stream=stream)
+        res = solution.solve_standard_sudoku(self.grid, recorder=rec)
+        self.assertEqual(len(rec), 0)
+
+        stream.seek(0)
+        boards = [list(masks) for masks in recorder.AssignmentRecorder.replay(stream)]
+        self.assertEqual(len(boards), rec.dropped + 1)
+        self.assertEqual(boards[0], engine.masks_from_grid(self.grid))
+        self.assertEqual(boards[-1], engine.masks_from_values(res, solution.boxes))
+
+
+class TestSolutionCount(unittest.TestCase):
+    unique_grid = TestDiagonalSudoku.diagonal_grid
+    open_grid = '.' * 81
+    # A solved standard grid with a swappable 2x2 rectangle of 5s and 7s removed
+    two_solutions = '239874156754316298681952374.76128.39312495687.98637.12143769825965283741827541963'
+
+    def test_unique(self):
+        self.assertEqual(solution.count_solutions(self.unique_grid), 1)
+        solutions = list(solution.iter_solutions(self.unique_grid))
+        self.assertEqual(solutions, [TestDiagonalSudoku.solved_diag_sudoku])
+
+    def test_limit(self):
+        self.assertEqual(solution.count_solutions(self.open_grid, limit=5), 5)
+        self.assertEqual(solution.count_solutions(self.open_grid, limit=1), 1)
+
+    def test_no_solution(self):
+        self.assertEqual(solution.count_solutions('11' + '.' * 79), 0)
+        self.assertEqual(list(solution.iter_solutions('11' + '.' * 79)), [])
+
+    def test_iter_is_lazy(self):
+        solutions = solution.iter_solutions(self.open_grid, solution.STANDARD)
+        first, second = next(solutions), next(solutions)
+        self.assertNotEqual(first, second)
+        for res in (first, second):
+            self.assertTrue(solution.is_valid_solution(res))
+
+    def test_count_all(self):
+        self.assertEqual(solution.count_solutions(self.two_solutions, None,
+                                                  solution.STANDARD), 2)
+        self.assertEqual(len(list(solution.iter_solutions(self.two_solutions,
+                                                          solution.STANDARD))), 2)
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Extra inference rules for the bitmask engine, run as a pluggable pipeline.
+
+engine.Board.propagate() always applies eliminate, only choice and naked
+twins. When those stall, a Pipeline (if the solve was given one) tries
+its rules in order; the first rule that removes anything hands control
+back to the cheap propagation, and the pipeline starts over from its
+first rule once that stalls again.
+
+A rule is a function rule(board) that removes candidates only through
+board.shrink(), so the trail, the work queues and any recorder see every
+change. It returns the number of candidates removed, or None if the
+board became inconsistent. Rules stop at the first pattern that removes
+something; cheaper propagation is usually enough to finish the job.
+"""
+
+from functools import partial
+from itertools import combinations
+
+
+def _remove(board, boxes, digits):
+    """Remove digits from the candidates of boxes.
+
+    Returns:
+        The number of candidates removed, or None on a contradiction.
+    """
+    masks = board.masks
+    bit_count = board.bit_count
+    removed = 0
+    for box in boxes:
+        mask = masks[box]
+        if mask & digits:
+            new = mask & ~digits
+            removed += bit_count[mask] - bit_count[new]
+            if not board.shrink(box, new):
+                return None
+    return removed
+
+
+def _places(masks, unit, digit):
+    """Bitmask of the positions within unit where digit is a candidate."""
+    places = 0
+    for slot, box in enumerate(unit):
+        if masks[box] & digit:
+            places |= 1 << slot
+    return places
+
+
+def locked_candidates(board):
+    """Pointing pairs/triples and box-line reduction.
+
+    If, within a unit, a digit can only go where the unit overlaps a second
+    unit, the digit is removed from the rest of the second unit. With a
+    square as the first unit this is a pointing pair, with a line it is
+    box-line reduction; extra units such as diagonals take part too.
+    """
+    masks = board.masks
+    for shared, first_rest, second_rest in board.variant.intersections:
+        inside = outside = 0
+        for box in shared:
+            inside |= masks[box]
+        for box in first_rest:
+            outside |= masks[box]
+
+        locked = inside & ~outside
+        if locked:
+            removed = _remove(board, second_rest, locked)
+            if removed != 0:
+                return removed
+    return 0
+
+
+def naked_subsets(board, size):
+    """Naked pairs/triples/quads.
+
+    If size unsolved boxes of a unit hold only size digits between them,
+    those digits are removed from every other box of the unit.
+    """
+    masks = board.masks
+    bit_count = board.bit_count
+    for unit in board.variant.units:
+        cells = [box for box in unit if 1 < bit_count[masks[box]] <= size]
+        if len(cells) < size:
+            continue
+
+        for subset in combinations(cells, size):
+            digits = 0
+            for box in subset:
+                digits |= masks[box]
+            if bit_count[digits] == size:
+                others = [box for box in unit if box not in subset]
+                removed = _remove(board, others, digits)
+                if removed != 0:
+                    return removed
+    return 0
+
+
+def hidden_subsets(board, size):
+    """Hidden pairs/triples.
+
+    If size digits of a unit can only go in size boxes, every other digit
+    is removed from those boxes.
+    """
+    masks = board.masks
+    bit_count = board.bit_count
+    variant = board.variant
+    for unit in variant.units:
+        candidates = []
+        for digit in variant.digit_bits:
+            places = _places(masks, unit, digit)
+            if 1 < bit_count[places] <= size:
+                candidates.append((digit, places))
+        if len(candidates) < size:
+            continue
+
+        for subset in combinations(candidates, size):
+            digits = places = 0
+            for digit, where in subset:
+                digits |= digit
+                places |= where
+            if bit_count[places] == size:
+                boxes = [box for slot, box in enumerate(unit) if places >> slot & 1]
+                removed = _remove(board, boxes, variant.all_digits & ~digits)
+                if removed != 0:
+                    return removed
+    return 0
+
+
+def x_wing(board):
+    """X-Wing on rows and on columns.
+
+    If a digit can only go in the same two columns of two rows, it is
+    removed from the rest of those two columns; likewise with rows and
+    columns swapped.
+    """
+    masks = board.masks
+    bit_count = board.bit_count
+    variant = board.variant
+    units = variant.units
+    for digit in variant.digit_bits:
+        for base_ids, cover_ids in ((variant.row_ids, variant.column_ids),
+                                    (variant.column_ids, variant.row_ids)):
+            seen = {}
+            for base in base_ids:
+                places = _places(masks, units[base], digit)
+                if bit_count[places] != 2:
+                    continue
+                other = seen.setdefault(places, base)
+                if other == base:
+                    continue
+
+                keep = set(units[base]) | set(units[other])
+                targets = [box for slot, cover in enumerate(cover_ids)
+                                if places >> slot & 1
+                                for box in units[cover] if box not in keep]
+                removed = _remove(board, targets, digit)
+                if removed != 0:
+                    return removed
+    return 0
+
+
+# Registered rules, cheapest first
+STRATEGIES = {
+    'locked_candidates' : locked_candidates,
+    'hidden_pairs'      : partial(hidden_subsets, size=2),
+    'naked_triples'     : partial(naked_subsets, size=3),
+    'hidden_triples'    : partial(hidden_subsets, size=3),
+    'x_wing'            : x_wing,
+    'naked_quads'       : partial(naked_subsets, size=4),
+}
+
+ALL_STRATEGIES = tuple(STRATEGIES)
+
+
+def register_strategy(name, rule):
+    """Make a rule(board) function available to Pipeline by name."""
+    STRATEGIES[name] = rule
+
+
+class Pipeline(object):
+    ''' An ordered set of extra rules for one or more solves.
+
+    names: rule names from STRATEGIES, tried in the given order
+    runs:  how many times each rule was tried
+    eliminated: how many candidates each rule removed
+    '''
+
+    def __init__(self, names=ALL_STRATEGIES):
+        self.names = tuple(names)
+        try:
+            self.rules = tuple(STRATEGIES[name] for name in self.names)
+        except KeyError as err:
+            raise ValueError('Unknown Sudoku strategy: %s' % err)
+        self.reset()
+
+    def reset(self):
+        self.runs = [0] * len(self.rules)
+        self.eliminated = [0] * len(self.rules)
+
+    def apply(self, board):
+        """Run the rules in order until one removes a candidate.
+
+        Returns:
+            The number of candidates removed (0 if no rule applied), or None
+            if the board became inconsistent.
+        """
+        for index, rule in enumerate(self.rules):
+            self.runs[index] += 1
+            removed = rule(board)
+            if removed != 0:
+                if removed is not None:
+                    self.eliminated[index] += removed
+                return removed
+        return 0
+
+    def report(self):
+        """Per-rule counters as {name: {'runs': n, 'eliminated': n}}."""
+        return {name : {'runs' : runs, 'eliminated' : eliminated}
+                for name, runs, eliminated in zip(self.names, self.runs,
+                                                  self.eliminated)}
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Vectorized validation of many solved Sudoku boards at once with NumPy.
+
+Boards are rows of an (N, 81) uint8 array holding digits 1-9 (1..size on
+larger boards), 0 for an empty box. Every unit of a SudokuVariant is
+checked for all N boards together: each digit d is turned into the bit
+1 << (d-1), the bits of the boxes of every unit are or-ed together, and a
+unit is valid exactly when the result has all size bits set. Since a
+unit has size boxes, that also rules out repeated digits.
+
+The standard variant checks rows, columns and squares; pass
+variants.DIAGONAL to check the diagonals too, or any other variant for
+its extra units.
+"""
+
+import numpy as np
+
+from variants import STANDARD
+
+# Boards checked per step; small enough for the temporary (chunk, units,
+# size) arrays to stay in cache
+CHUNK_SIZE = 2048
+
+_unit_tables = {}
+
+
+def _unit_table(variant):
+    """The units of a variant as an (units, size) index array, built once."""
+    table = _unit_tables.get(variant)
+    if table is None:
+        table = _unit_tables[variant] = np.array(variant.units, dtype=np.intp)
+    return table
+
+
+def array_from_grids(grids, variant=STANDARD):
+    """Convert grid strings into an (N, boxes) uint8 array of digits.
+
+    Digits become 1..size, '.' and '0' become 0. Every grid must be exactly
+    one board long, without separators.
+    """
+    size = len(variant.boxes)
+    table = np.zeros(256, dtype=np.uint8)
+    for value, digit in enumerate(variant.digits, 1):
+        table[ord(digit)] = value
+    data = np.frombuffer(''.join(grids).encode('ascii'), dtype=np.uint8)
+    if data.size % size:
+        raise ValueError('Grids must be %d characters long' % size)
+    return table[data].reshape(-1, size)
+
+
+def validate_batch(boards, variant=STANDARD, chunk_size=CHUNK_SIZE):
+    """Check many solved boards at once.
+
+    Args:
+        boards: (N, boxes) array of digits, 1..size for a solved box
+        variant: SudokuVariant whose units are checked, standard by default
+        chunk_size: number of boards checked per vectorized step
+    Returns:
+        (valid, first_bad): a boolean array of length N that is True for
+        every valid board, and an int array with the index into
+        variant.units of the first violated unit of every invalid board,
+        -1 for valid ones. Units are numbered rows, columns, squares, then
+        the variant's extra units.
+    """
+    boards = np.asarray(boards)
+    if boards.ndim != 2 or boards.shape[1] != len(variant.boxes):
+        raise ValueError('Expected an (N, %d) array of boards' % len(variant.boxes))
+
+    size = variant.size
+    if boards.dtype != np.uint8:
+        boards = np.where((boards >= 0) & (boards <= size), boards, 0).astype(np.uint8)
+
+    units = _unit_table(variant)
+    full = np.uint32(variant.all_digits)
+    # Digit d to bit d-1; empty or out-of-range boxes contribute nothing
+    bit_of = np.zeros(256, dtype=np.uint32)
+    bit_of[1:size + 1] = np.left_shift(1, np.arange(size, dtype=np.uint32))
+    valid = np.empty(len(boards), dtype=bool)
+    first_bad = np.empty(len(boards), dtype=np.intp)
+
+    for start in range(0, len(boards), chunk_size):
+        chunk = boards[start:start + chunk_size]
+        bits = bit_of[chunk]
+        unit_ok = np.bitwise_or.reduce(bits[:, units], axis=2) == full
+
+        ok = unit_ok.all(axis=1)
+        stop = start + len(chunk)
+        valid[start:stop] = ok
+        first_bad[start:stop] = np.where(ok, -1, np.argmin(unit_ok, axis=1))
+
+    return valid, first_bad
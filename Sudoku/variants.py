@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Precompiled, immutable Sudoku rule sets.
+
+A SudokuVariant is the standard rows, columns and squares of a 9x9,
+16x16 or 25x25 board plus any extra units (the two diagonals, the four
+windoku windows, ...), compiled once into tuples of box indices and mask
+lookup tables for the bitmask engine and into label sets for the
+dictionary API in solution.py.
+
+Boxes are labelled by row letter and column number ('A1' .. 'P16' on a
+16x16 board), and digits beyond 9 are written as letters: a size n board
+uses the first n characters of DIGIT_CHARS.
+
+Variants are compiled by register_variant() and cached by name, so
+solving many puzzles never rebuilds units or peers. Every solver entry
+point takes the variant as a parameter instead of reading module globals.
+"""
+
+from math import isqrt
+from types import MappingProxyType
+
+# Row letters and digit characters, enough for 25x25 boards. A board of
+# size n uses the first n of each; columns are numbered 1..n.
+ROW_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXY'
+DIGIT_CHARS = '123456789ABCDEFGHIJKLMNOP'
+
+
+def cross(a, b):
+    return [s+t for s in a for t in b]
+
+
+def grid_labels(size):
+    """Return the row letters and column numbers of a size x size board."""
+    if size < 1 or isqrt(size)**2 != size or size > len(DIGIT_CHARS):
+        raise ValueError('Unsupported Sudoku size: %r' % size)
+    return ROW_LETTERS[:size], [str(c) for c in range(1, size + 1)]
+
+
+def standard_units(size):
+    """Return the row, column and square units of a size x size board."""
+    rows, cols = grid_labels(size)
+    width = isqrt(size)
+    bands = [rows[i:i+width] for i in range(0, size, width)]
+    stacks = [cols[i:i+width] for i in range(0, size, width)]
+    return ([cross(r, cols) for r in rows],
+            [cross(rows, [c]) for c in cols],
+            [cross(rs, cs) for rs in bands for cs in stacks])
+
+
+def diagonals(size):
+    """Return the two main diagonals of a size x size board."""
+    rows, cols = grid_labels(size)
+    return [[rows[index]+c for index, c in enumerate(cols)],
+            [rows[size-1-index]+c for index, c in enumerate(cols)]]
+
+
+rows, cols = grid_labels(9)
+cols = ''.join(cols)
+
+boxes = cross(rows, cols)
+
+row_units, column_units, square_units = standard_units(9)
+
+# Extra units for the built-in variants
+diagonal_units = diagonals(9)
+window_units   = [cross(rs, cs) for rs in ('BCD', 'FGH') for cs in ('234', '678')]
+
+
+class _MemoTable(dict):
+    """A lookup table that computes and keeps entries on first use.
+
+    Stands in for a list indexed by mask when 2**size entries would be too
+    many to build up front; lookups of known masks stay plain dict hits.
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def __missing__(self, key):
+        value = self[key] = self.function(key)
+        return value
+
+
+_mask_tables = {}
+
+
+def mask_tables(size):
+    """Return (bit_count, mask_to_str) lookup tables for size digits.
+
+    Both are indexed by candidate mask. They are built once per size and
+    shared by every variant of that size: as lists for boards up to 9x9
+    (bit counts up to 16x16), and as _MemoTables for larger ones.
+    """
+    tables = _mask_tables.get(size)
+    if tables is None:
+        digits = DIGIT_CHARS[:size]
+
+        def count(mask):
+            return bin(mask).count('1')
+
+        def to_str(mask):
+            return ''.join(d for index, d in enumerate(digits) if mask >> index & 1)
+
+        if size <= 16:
+            # Masks with bit i set have one more bit than those without it
+            bit_count = [0]
+            for _ in range(size):
+                bit_count += [c + 1 for c in bit_count]
+        else:
+            bit_count = _MemoTable(count)
+        if size <= 9:
+            mask_to_str = [to_str(mask) for mask in range(1 << size)]
+        else:
+            mask_to_str = _MemoTable(to_str)
+        tables = _mask_tables[size] = (bit_count, mask_to_str)
+    return tables
+
+
+class SudokuVariant(object):
+    ''' A compiled set of Sudoku rules.
+
+    name:        name the variant is registered under
+    size:        digits per unit, and rows and columns of the board (9, 16
+                 or 25)
+    extra_units: the units added to the standard ones, as tuples of labels
+    boxes:       box labels in row-major order
+    digits:      the digit characters, digit i being bit i of a mask
+    all_digits:  mask with every digit set
+    digit_bits:  the single-digit masks, in digit order
+    bit_count, mask_to_str:
+                 lookup tables indexed by mask, see mask_tables()
+    char_to_mask:
+                 grid character to mask, '.' and '0' meaning every digit
+    unitlist:    all units, as tuples of box labels
+    units:       all units, as tuples of box indices
+    box_units:   for every box index, the indices into units it belongs to
+    peers:       for every box index, the box indices sharing a unit with it
+    peer_labels: read-only {<box>: frozenset of peer labels} for the
+                 dictionary API
+    row_ids, column_ids, square_ids:
+                 indices into units of the rows, columns and squares; the
+                 boxes of each row (column) are in column (row) order
+    intersections:
+                 for every ordered pair of units sharing two or more boxes,
+                 a tuple (shared boxes, rest of the first unit, rest of the
+                 second unit), used by the locked candidates strategy
+
+    Instances are immutable; build them with register_variant().
+    '''
+
+    __slots__ = ('name', 'size', 'extra_units', 'boxes', 'digits', 'all_digits',
+                 'digit_bits', 'bit_count', 'mask_to_str', 'char_to_mask',
+                 'unitlist', 'units', 'box_units', 'peers', 'peer_labels',
+                 'row_ids', 'column_ids', 'square_ids', 'intersections')
+
+    def __init__(self, name, extra_units=(), size=9):
+        rows, cols = grid_labels(size)
+        labels = tuple(cross(rows, cols))
+        extra_units = tuple(tuple(unit) for unit in extra_units)
+        row_units, column_units, square_units = standard_units(size)
+        unitlist = tuple(tuple(unit) for unit in
+                         row_units + column_units + square_units) + extra_units
+        index_of = {box : index for index, box in enumerate(labels)}
+
+        digits = DIGIT_CHARS[:size]
+        all_digits = (1 << size) - 1
+        digit_bits = tuple(1 << index for index in range(size))
+        bit_count, mask_to_str = mask_tables(size)
+        char_to_mask = dict(zip(digits, digit_bits))
+        char_to_mask.update({'.' : all_digits, '0' : all_digits})
+
+        units = tuple(tuple(index_of[box] for box in unit) for unit in unitlist)
+        box_units = [[] for _ in labels]
+        for u, unit in enumerate(units):
+            for index in unit:
+                box_units[index].append(u)
+        box_units = tuple(tuple(ids) for ids in box_units)
+        peers = tuple(tuple(sorted(set(peer for u in box_units[index]
+                                            for peer in units[u]) - {index}))
+                      for index in range(len(labels)))
+        peer_labels = MappingProxyType(
+                {box : frozenset(labels[peer] for peer in peers[index])
+                 for index, box in enumerate(labels)})
+
+        # The standard units come first, in row, column, square order
+        row_ids    = tuple(range(0, size))
+        column_ids = tuple(range(size, 2*size))
+        square_ids = tuple(range(2*size, 3*size))
+
+        intersections = []
+        unit_sets = [set(unit) for unit in units]
+        for u, first in enumerate(units):
+            for v, second in enumerate(units):
+                shared = unit_sets[u] & unit_sets[v]
+                if u != v and len(shared) > 1:
+                    intersections.append((tuple(sorted(shared)),
+                                          tuple(box for box in first if box not in shared),
+                                          tuple(box for box in second if box not in shared)))
+        intersections = tuple(intersections)
+
+        for attr, value in (('name', name), ('size', size),
+                            ('extra_units', extra_units), ('boxes', labels),
+                            ('digits', digits), ('all_digits', all_digits),
+                            ('digit_bits', digit_bits), ('bit_count', bit_count),
+                            ('mask_to_str', mask_to_str),
+                            ('char_to_mask', MappingProxyType(char_to_mask)),
+                            ('unitlist', unitlist), ('units', units),
+                            ('box_units', box_units), ('peers', peers),
+                            ('peer_labels', peer_labels), ('row_ids', row_ids),
+                            ('column_ids', column_ids), ('square_ids', square_ids),
+                            ('intersections', intersections)):
+            object.__setattr__(self, attr, value)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError('SudokuVariant is immutable')
+
+    def __reduce__(self):
+        # Ship only the name, extra units and size to worker processes; the
+        # receiving side looks the variant up (or compiles it once) there.
+        return (register_variant, (self.name, self.extra_units, self.size))
+
+    def __repr__(self):
+        return 'SudokuVariant(%r, %dx%d, %d units)' % (self.name, self.size,
+                                                      self.size, len(self.units))
+
+
+_variants = {}
+
+
+def register_variant(name, extra_units=(), size=9):
+    """Compile a variant once and cache it under name.
+
+    Args:
+        name(string): name of the variant, e.g. 'windoku'
+        extra_units: iterable of units (each an iterable of box labels)
+            added to the standard rows, columns and squares
+        size(int): digits per unit; 9, 16 or 25 (any square up to 25)
+    Returns:
+        The cached SudokuVariant. Registering the same name again with the
+        same units and size returns the cached instance.
+    """
+    extra_units = tuple(tuple(unit) for unit in extra_units)
+    variant = _variants.get(name)
+    if variant is None:
+        variant = SudokuVariant(name, extra_units, size)
+        _variants[name] = variant
+    elif variant.extra_units != extra_units or variant.size != size:
+        raise ValueError('Sudoku variant %r is already registered with '
+                         'different units' % name)
+    return variant
+
+
+def get_variant(name):
+    """Look up a registered variant by name."""
+    try:
+        return _variants[name]
+    except KeyError:
+        raise ValueError('Unknown Sudoku variant: %r' % name)
+
+
+STANDARD = register_variant('standard')
+DIAGONAL = register_variant('diagonal', diagonal_units)
+WINDOKU  = register_variant('windoku', window_units)
+
+STANDARD16 = register_variant('standard16', size=16)
+STANDARD25 = register_variant('standard25', size=25)